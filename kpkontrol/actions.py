@@ -1,17 +1,22 @@
 import asyncio
+import codecs
+import hashlib
+import json
+import re
+from collections import deque, namedtuple
 try:
-    from urllib import urlencode
+    from urllib import urlencode, quote_plus
     from urlparse import urlunsplit
 except ImportError:
-    from urllib.parse import urlencode, urlunsplit
+    from urllib.parse import urlencode, quote_plus, urlunsplit
 
-import aiohttp
-
-from kpkontrol.parameters import (
-    ParameterBase, EnumParameter, IntParameter, StrParameter,
-)
+from kpkontrol.session import session_pool
+from kpkontrol.parameters import ParameterBase
 from kpkontrol.objects import Clip
 
+PreparedRequest = namedtuple('PreparedRequest', ['method', 'url', 'data', 'headers'])
+
+FORM_HEADERS = {'Content-Type':'application/x-www-form-urlencoded'}
 
 class Action(object):
     _url_path = '/'
@@ -21,22 +26,52 @@ class Action(object):
         self.netloc = netloc
         self.session = kwargs.get('session')
         self.loop = kwargs.get('loop')
+        self.session_borrowed = False
+        self._prepared = None
         init_query_params = kwargs.get('query_params', {})
         self.query_params = self.build_query_params(**init_query_params)
         self.result = None
     async def __call__(self, **kwargs):
         self._build_session(**kwargs)
-        r = await self.build_request()
-        async with r:
-            result = await self.process_response(r)
+        borrowed = self.session_borrowed
+        if borrowed:
+            self.session = session_pool.acquire(loop=self.loop)
+        try:
+            r = await self.build_request()
+            async with r:
+                result = await self.process_response(r)
+        finally:
+            if borrowed:
+                session_pool.release(self.session)
         self.result = result
         return result
+    async def send(self, session=None, **kwargs):
+        # Sends the prepared request without storing anything on the action,
+        # so one instance can be shared by concurrent callers
+        req = self.prepare_call(**kwargs)
+        borrowed = session is None
+        if borrowed:
+            session = session_pool.acquire(loop=self.loop)
+        try:
+            r = await self._send_request(session, req)
+            async with r:
+                return await self.process_response(r)
+        finally:
+            if borrowed:
+                session_pool.release(session)
     async def process_response(self, r):
         raise NotImplementedError()
     @property
     def url_path(self):
         return self._url_path.lstrip('/')
     @property
+    def query_params(self):
+        return self._query_params_
+    @query_params.setter
+    def query_params(self, value):
+        self._query_params_ = value
+        self._prepared = None
+    @property
     def query_string(self):
         qs = getattr(self, '_query_string', None)
         if qs is not None:
@@ -47,6 +82,22 @@ class Action(object):
     @query_string.setter
     def query_string(self, value):
         self._query_string = value
+        self._prepared = None
+    @property
+    def prepared(self):
+        p = self._prepared
+        if p is None:
+            p = self._prepared = self.prepare()
+        return p
+    def prepare(self):
+        if self.method == 'get':
+            return PreparedRequest('get', self.build_url(), None, None)
+        elif self.method == 'post':
+            data = urlencode(self.query_params)
+            return PreparedRequest('post', self.build_url(), data, FORM_HEADERS)
+        raise Exception('{} method not supported'.format(self.method))
+    def prepare_call(self, **kwargs):
+        return self.prepared
     @property
     def full_url(self):
         return self.build_url()
@@ -57,13 +108,13 @@ class Action(object):
             sp_tpl = ('http', self.netloc, self.url_path, '', '')
         return urlunsplit(sp_tpl)
     async def build_request(self):
-        url = self.full_url
-        if self.method == 'get':
-            r = await self.session.get(url)
-        elif self.method == 'post':
-            r = await self.session.post(url, data=self.query_params)
+        return await self._send_request(self.session, self.prepared)
+    @staticmethod
+    async def _send_request(session, req):
+        if req.method == 'get':
+            r = await session.get(req.url)
         else:
-            raise Exception('{} method not supported'.format(self.method))
+            r = await session.post(req.url, data=req.data, headers=req.headers)
         return r
     @classmethod
     def iter_bases(cls):
@@ -74,14 +125,24 @@ class Action(object):
                     continue
                 for _subcls in _cls.iter_bases():
                     yield _subcls
-    def build_query_params(self, **kwargs):
+    @classmethod
+    def get_class_query_params(cls):
+        # Merged once per class and stored in the class __dict__ so
+        # subclasses don't pick up their parent's result
+        params = cls.__dict__.get('_merged_query_params')
+        if params is not None:
+            return params
         params = {}
-        for cls in self.iter_bases():
-            if cls._query_params is None:
+        for _cls in cls.iter_bases():
+            if _cls._query_params is None:
                 continue
             # Allow subclasses to override
-            _params = {k:v for k, v in cls._query_params.items() if k not in params}
+            _params = {k:v for k, v in _cls._query_params.items() if k not in params}
             params.update(_params)
+        cls._merged_query_params = params
+        return params
+    def build_query_params(self, **kwargs):
+        params = self.get_class_query_params().copy()
         params.update(kwargs)
         return params
     def _build_session(self, **kwargs):
@@ -89,21 +150,83 @@ class Action(object):
         loop = kwargs.get('loop')
         if session is not None:
             self.session = session
+            self.session_borrowed = False
             self.loop = session._loop
         elif loop is not None:
             self.loop = loop
 
         if self.session is None:
-            self.session = aiohttp.ClientSession(loop=self.loop)
+            # Borrow from the shared pool. The session is re-acquired on
+            # each call since the pool may evict it between uses
+            self.session = session_pool.get_session(loop=self.loop)
+            self.session_borrowed = True
         self.loop = self.session._loop
         return self.session
 
 class GetAllParameters(Action):
     _url_path = 'descriptors'
     _query_params = {'paramid':'*'}
+    def __init__(self, netloc, **kwargs):
+        self.cache = kwargs.get('cache')
+        self.registry = kwargs.get('registry')
+        self.cache_key = None
+        super(GetAllParameters, self).__init__(netloc, **kwargs)
+    async def __call__(self, **kwargs):
+        if self.cache is None and self.registry is None:
+            return await super(GetAllParameters, self).__call__(**kwargs)
+        self._build_session(**kwargs)
+        # Held for the cache key requests, which use self.session directly
+        borrowed = self.session_borrowed
+        if borrowed:
+            self.session = session_pool.acquire(loop=self.loop)
+        try:
+            if self.cache is not None:
+                self.cache_key = await self.get_cache_key()
+            if self.cache_key is not None:
+                params = None
+                if self.registry is not None:
+                    params = self.registry.get_by_key(self.cache_key)
+                if params is None:
+                    payload = self.cache.get_payload(self.cache_key)
+                    if payload is not None:
+                        params = self.load_payload(payload)
+                if params is not None:
+                    self.result = params
+                    return self.result
+            return await super(GetAllParameters, self).__call__()
+        finally:
+            if borrowed:
+                session_pool.release(self.session)
+    async def get_cache_key(self):
+        values = []
+        for param_id in self.cache.key_parameter_ids:
+            a = GetParameter(
+                self.netloc, session=self.session,
+                parameter=ParameterBase(id=param_id),
+            )
+            try:
+                response = await a()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # The device can't be identified, so bootstrap without the
+                # cache
+                return None
+            values.append(json.dumps(response, sort_keys=True))
+        return self.cache.build_key(*values)
     async def process_response(self, r):
+        s = await r.text()
+        if self.cache is not None and self.cache_key is not None:
+            self.cache.set(self.cache_key, s)
+        return self.load_payload(s)
+    def load_payload(self, payload):
+        if self.registry is None:
+            return self.build_parameters(json.loads(payload))
+        return self.registry.get_or_build(payload, self.build_parameters, key=self.cache_key)
+    @staticmethod
+    def build_parameters(data):
         params = {'by_id':{}, 'by_type':{}}
-        for d in await r.json(content_type=None):
+        for d in data:
             param = ParameterBase.from_json(d)
             params['by_id'][param.id] = param
             if param.param_type not in params['by_type']:
@@ -125,12 +248,42 @@ class SetParameter(Action):
     method = 'post'
     def __init__(self, netloc, **kwargs):
         self.parameter = kwargs.get('parameter')
-        self.value = kwargs.get('value')
+        self._value = kwargs.get('value')
+        self._body_prefix = None
         super(SetParameter, self).__init__(netloc, **kwargs)
+    async def __call__(self, **kwargs):
+        if 'value' in kwargs:
+            self.value = kwargs['value']
+        return await super(SetParameter, self).__call__(**kwargs)
+    @property
+    def value(self):
+        return self._value
+    @value.setter
+    def value(self, value):
+        self._value = value
+        self.query_params['newValue'] = value
+        self._prepared = None
     def build_query_params(self, **kwargs):
         kwargs['paramName'] = self.parameter.id
         kwargs['newValue'] = self.value
         return super(SetParameter, self).build_query_params(**kwargs)
+    def prepare(self):
+        return self.prepare_value(self.value)
+    def prepare_call(self, **kwargs):
+        if 'value' not in kwargs:
+            return self.prepared
+        return self.prepare_value(kwargs['value'])
+    def prepare_value(self, value):
+        # The url and everything but the value are fixed for the parameter,
+        # so only the new value needs to be encoded
+        prefix = self._body_prefix
+        if prefix is None:
+            params = {k:v for k, v in self.query_params.items() if k != 'newValue'}
+            params['newValue'] = ''
+            prefix = self._body_prefix = urlencode(params)
+            self._url = self.build_url()
+        data = ''.join([prefix, quote_plus(str(value))])
+        return PreparedRequest('post', self._url, data, FORM_HEADERS)
     async def process_response(self, r):
         return await self.parameter.parse_response(r)
 
@@ -147,43 +300,76 @@ class ListenForEvents(Action):
     def __init__(self, netloc, **kwargs):
         self.connection_id = kwargs.get('connection_id')
         self.all_parameters = kwargs.get('all_parameters')
+        # If True, decoded values are set directly on the parameter objects
+        # (DeviceParameter instances) and the response is {param_id:value}
+        self.apply_values = kwargs.get('apply_values', False)
+        # If True, decoders are built as events arrive for each parameter
+        # instead of for all parameters up front
+        self.lazy_decoders = kwargs.get('lazy_decoders', False)
+        self.decoders = {}
         super(ListenForEvents, self).__init__(netloc, **kwargs)
     async def __call__(self, **kwargs):
         self._build_session(**kwargs)
-        if self.all_parameters is None:
-            a = GetAllParameters(self.netloc, session=self.session)
-            self.all_parameters = await a()
-        if self.connection_id is None:
-            a = Connect(self.netloc, session=self.session)
-            self.connection_id = await a()
-            self.query_params = self.build_query_params()
-        return await super(ListenForEvents, self).__call__()
+        borrowed = self.session_borrowed
+        if borrowed:
+            self.session = session_pool.acquire(loop=self.loop)
+        try:
+            if self.all_parameters is None:
+                a = GetAllParameters(self.netloc, session=self.session)
+                self.all_parameters = await a()
+            if not len(self.decoders) and not self.lazy_decoders:
+                self.build_decoders()
+            if self.connection_id is None:
+                a = Connect(self.netloc, session=self.session)
+                self.connection_id = await a()
+                self.query_params = self.build_query_params()
+            return await super(ListenForEvents, self).__call__()
+        finally:
+            if borrowed:
+                session_pool.release(self.session)
     def build_query_params(self, **kwargs):
         kwargs['connectionid'] = self.connection_id
         return super(ListenForEvents, self).build_query_params(**kwargs)
+    def build_decoders(self):
+        for param_id, param in self.all_parameters['by_id'].items():
+            self.decoders[param_id] = param.build_event_decoder()
+    def get_decoder(self, param_id):
+        decoder = self.decoders.get(param_id)
+        if decoder is None:
+            param = self.all_parameters['by_id'].get(param_id)
+            if param is None:
+                return None
+            decoder = self.decoders[param_id] = param.build_event_decoder()
+        return decoder
     async def process_response(self, r):
         self.response_obj = r
-        params = {}
         data = await r.json(content_type=None)
+        return self.decode_events(data)
+    def decode_events(self, data):
+        by_id = self.all_parameters['by_id']
+        decoders = self.decoders
+        apply_values = self.apply_values
+        params = {}
         for d in data:
             if 'services' in d:
-                param = self.all_parameters['by_id']['eParamID_NetworkServices']
-                _d = {'parameter':param, 'value':d['services']}
-                params[param.id] = _d
-                continue
-            if 'param_id' not in d:
-                continue
-            if 'str_value' not in d:
-                continue
-            param = self.all_parameters['by_id'][d['param_id']]
-            _d = {'parameter':param}
-            if isinstance(param, IntParameter):
-                _d['value'] = int(d['int_value'])
-            elif isinstance(param, EnumParameter):
-                _d['value'] = param.enum_items[int(d['int_value'])]
+                param_id = 'eParamID_NetworkServices'
+                value = d['services']
+            else:
+                param_id = d.get('param_id')
+                if param_id is None or 'str_value' not in d:
+                    continue
+                decoder = decoders.get(param_id)
+                if decoder is None:
+                    decoder = self.get_decoder(param_id)
+                    if decoder is None:
+                        continue
+                value = decoder(d)
+            if apply_values:
+                if value is not None:
+                    by_id[param_id].value = value
+                params[param_id] = value
             else:
-                _d['value'] = d['str_value']
-            params[param.id] = _d
+                params[param_id] = {'parameter':by_id[param_id], 'value':value}
         return params
 
 class GetClips(Action):
@@ -195,3 +381,115 @@ class GetClips(Action):
         for clipdata in data['clips']:
             clips.append(Clip.from_json(clipdata))
         return clips
+    def stream(self, **kwargs):
+        return ClipStream(self, **kwargs)
+
+class ClipListParser(object):
+    _array_start = re.compile(r'"clips"\s*:\s*\[')
+    _separator = re.compile(r'[\s,]*')
+    def __init__(self, **kwargs):
+        self.keep_text = kwargs.get('keep_text', False)
+        self.text_decoder = codecs.getincrementaldecoder('UTF-8')()
+        self.json_decoder = json.JSONDecoder()
+        self.digest = hashlib.sha1()
+        self.buffer = ''
+        self.in_array = False
+        self.complete = False
+    def feed(self, data, final=False):
+        self.digest.update(data)
+        self.buffer = ''.join([self.buffer, self.text_decoder.decode(data, final)])
+        items = []
+        if not self.in_array:
+            m = self._array_start.search(self.buffer)
+            if m is None:
+                if final:
+                    raise ValueError('No clips array found in response')
+                return items
+            self.buffer = self.buffer[m.end():]
+            self.in_array = True
+        buf = self.buffer
+        idx = 0
+        while not self.complete:
+            idx = self._separator.match(buf, idx).end()
+            if idx >= len(buf):
+                break
+            if buf[idx] == ']':
+                self.complete = True
+                idx += 1
+                break
+            try:
+                item, end = self.json_decoder.raw_decode(buf, idx)
+            except ValueError:
+                # Most likely an incomplete item, so wait for more data
+                if final:
+                    raise
+                break
+            if self.keep_text:
+                item = (buf[idx:end], item)
+            items.append(item)
+            idx = end
+        self.buffer = buf[idx:]
+        if final and not self.complete:
+            raise ValueError('Incomplete clips array in response')
+        return items
+
+class ClipStream(object):
+    # Async iterator of Clip objects parsed from the response as it arrives
+    def __init__(self, action, **kwargs):
+        self.action = action
+        # If True, yield the (text, data) of each clip record rather than
+        # a parsed Clip
+        self.records = kwargs.pop('records', False)
+        self.call_kwargs = kwargs
+        self.parser = ClipListParser(keep_text=self.records)
+        self.pending = deque()
+        self.response = None
+        self.eof = False
+        self.closed = False
+        self.session_borrowed = False
+    async def _open(self):
+        action = self.action
+        action._build_session(**self.call_kwargs)
+        self.session_borrowed = action.session_borrowed
+        if self.session_borrowed:
+            action.session = session_pool.acquire(loop=action.loop)
+        try:
+            self.response = await action.build_request()
+        except Exception:
+            await self.close()
+            raise
+    async def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.response is not None:
+            self.response.release()
+        if self.session_borrowed:
+            session_pool.release(self.action.session)
+    @property
+    def digest(self):
+        return self.parser.digest.hexdigest()
+    async def __aenter__(self):
+        return self
+    async def __aexit__(self, *args):
+        await self.close()
+    def __aiter__(self):
+        return self
+    async def __anext__(self):
+        if self.response is None and not self.closed:
+            await self._open()
+        try:
+            while not len(self.pending):
+                if self.eof or self.closed:
+                    raise StopAsyncIteration()
+                chunk = await self.response.content.readany()
+                if not chunk:
+                    self.eof = True
+                self.pending.extend(self.parser.feed(chunk, final=self.eof))
+            item = self.pending.popleft()
+            if self.records:
+                return item
+            return Clip.from_json(item)
+        except BaseException:
+            await self.close()
+            raise
@@ -4,10 +4,16 @@ class ObjectBase(Dispatcher):
     __attribute_names = None
     __attribute_defaults = None
     def __init__(self, **kwargs):
-        names, defaults = self._get_attribute_data()
+        names, ordered_names, defaults, mutable_defaults = self._get_attribute_data()
         self.attribute_names_ = names
-        for key in names:
-            val = kwargs.get(key, defaults.get(key))
+        for key in ordered_names:
+            if key in kwargs:
+                val = kwargs[key]
+            elif key in mutable_defaults:
+                # Only mutable defaults need a per-instance copy
+                val = defaults[key].copy()
+            else:
+                val = defaults.get(key)
             setattr(self, key, val)
     @classmethod
     def iter_bases(cls):
@@ -22,6 +28,21 @@ class ObjectBase(Dispatcher):
                 yield _cls
     @classmethod
     def _get_attribute_data(cls):
+        # Every instance needs these in __init__, so they are merged from
+        # the class hierarchy once. A plain getattr would find the data
+        # cached on a parent class, which is missing the names and defaults
+        # added by this class.
+        data = cls.__dict__.get('_attribute_data_')
+        if data is None:
+            names, defaults = cls._build_attribute_data()
+            mutable_defaults = frozenset(
+                key for key, val in defaults.items() if isinstance(val, (list, dict))
+            )
+            data = (frozenset(names), tuple(names), defaults, mutable_defaults)
+            cls._attribute_data_ = data
+        return data
+    @classmethod
+    def _build_attribute_data(cls):
         all_names = set()
         all_defaults = {}
         for _cls in cls.iter_bases():
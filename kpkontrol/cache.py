@@ -0,0 +1,152 @@
+import os
+import hashlib
+import json
+from collections import OrderedDict
+
+
+def get_default_cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME')
+    if not base:
+        base = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'kpkontrol', 'descriptors')
+
+class DescriptorCache(object):
+    # Parameters used to identify the descriptor set of a device.
+    # These are small requests compared to the full descriptor payload
+    key_parameter_ids = ['eParamID_ProductID', 'eParamID_SWVersion']
+    def __init__(self, **kwargs):
+        self.path = kwargs.get('path')
+        if self.path is None:
+            self.path = get_default_cache_dir()
+        self.max_entries = kwargs.get('max_entries', 16)
+        self.max_bytes = kwargs.get('max_bytes', 16 * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+    @staticmethod
+    def build_key(*values):
+        s = ':'.join([str(v) for v in values])
+        return hashlib.sha1(s.encode('UTF-8')).hexdigest()
+    @staticmethod
+    def content_hash(s):
+        if not isinstance(s, bytes):
+            s = s.encode('UTF-8')
+        return hashlib.sha1(s).hexdigest()
+    def _filename(self, key):
+        return os.path.join(self.path, '{}.json'.format(key))
+    def iter_entries(self):
+        if not os.path.isdir(self.path):
+            return
+        for fn in os.listdir(self.path):
+            if not fn.endswith('.json'):
+                continue
+            fn = os.path.join(self.path, fn)
+            try:
+                st = os.stat(fn)
+            except OSError:
+                continue
+            yield fn, st
+    def get(self, key):
+        payload = self.get_payload(key)
+        if payload is None:
+            return None
+        return json.loads(payload)
+    def get_payload(self, key):
+        fn = self._filename(key)
+        try:
+            with open(fn, 'r') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        payload = cached.get('payload')
+        if payload is None or self.content_hash(payload) != cached.get('content_hash'):
+            # Corrupt or partially written entry
+            self.remove(key)
+            self.misses += 1
+            return None
+        try:
+            # Mark as recently used for eviction
+            os.utime(fn, None)
+        except OSError:
+            pass
+        self.hits += 1
+        return payload
+    def set(self, key, payload):
+        if not isinstance(payload, str):
+            payload = json.dumps(payload)
+        os.makedirs(self.path, exist_ok=True)
+        fn = self._filename(key)
+        tmp_fn = '{}.tmp'.format(fn)
+        data = {'content_hash':self.content_hash(payload), 'payload':payload}
+        with open(tmp_fn, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_fn, fn)
+        self.evict()
+    def remove(self, key):
+        try:
+            os.remove(self._filename(key))
+        except OSError:
+            pass
+    def evict(self):
+        entries = sorted(self.iter_entries(), key=lambda e: e[1].st_mtime, reverse=True)
+        total_bytes = 0
+        for i, (fn, st) in enumerate(entries):
+            total_bytes += st.st_size
+            if i == 0:
+                # Always keep the most recent entry
+                continue
+            if i >= self.max_entries or total_bytes > self.max_bytes:
+                try:
+                    os.remove(fn)
+                except OSError:
+                    pass
+    def clear(self):
+        for fn, st in list(self.iter_entries()):
+            try:
+                os.remove(fn)
+            except OSError:
+                pass
+
+class DescriptorRegistry(object):
+    # In-memory store of parsed descriptor sets, shared by the devices it is
+    # passed to (KpFleet creates one for its devices). Sets are stored by a
+    # hash of the raw payload, so devices on the same firmware get the same
+    # ParameterBase objects. Those must be treated as read-only.
+    def __init__(self, **kwargs):
+        self.max_entries = kwargs.get('max_entries', 8)
+        self.by_hash = OrderedDict()
+        # DescriptorCache keys (device identity) to payload hashes
+        self.by_key = {}
+        self.hits = 0
+        self.misses = 0
+    def get_by_key(self, key):
+        content_hash = self.by_key.get(key)
+        if content_hash is None:
+            return None
+        return self._get(content_hash)
+    def _get(self, content_hash):
+        params = self.by_hash.get(content_hash)
+        if params is not None:
+            self.by_hash.move_to_end(content_hash)
+            self.hits += 1
+        return params
+    def get_or_build(self, payload, builder, key=None):
+        content_hash = DescriptorCache.content_hash(payload)
+        params = self._get(content_hash)
+        if params is None:
+            self.misses += 1
+            params = builder(json.loads(payload))
+            self.by_hash[content_hash] = params
+            self.evict()
+        if key is not None:
+            self.by_key[key] = content_hash
+        return params
+    def evict(self):
+        while len(self.by_hash) > self.max_entries:
+            content_hash, params = self.by_hash.popitem(last=False)
+            for key, h in list(self.by_key.items()):
+                if h == content_hash:
+                    del self.by_key[key]
+    def clear(self):
+        self.by_hash.clear()
+        self.by_key.clear()
@@ -6,14 +6,50 @@ from pydispatch.properties import (
 
 from kpkontrol.base import ObjectBase
 from kpkontrol import actions
+from kpkontrol.session import session_pool
+from kpkontrol.scheduler import get_scheduler
 from kpkontrol.parameters import ParameterBase
 from kpkontrol.objects import (
     DeviceParameter,
+    LazyParameterMap,
     NetworkServicesParameter,
     NetworkDevice,
     Clip,
+    ClipDiffer,
+    ClipIndex,
 )
-from kpkontrol.timecode import FrameRate, FrameFormat, Timecode
+from kpkontrol.timecode import FrameRate, FrameFormat, Timecode, TimecodeValue
+
+class ListenStats(object):
+    def __init__(self):
+        self.requests = 0
+        self.events = 0
+        self.empty_responses = 0
+        self.errors = 0
+        self.last_poll_time = None
+        self.last_dispatch_time = None
+        self.max_dispatch_time = 0.
+        self.last_rearm_delay = None
+        self.last_response_ts = None
+    def record_response(self, num_events, poll_time, dispatch_time):
+        self.events += num_events
+        if not num_events:
+            self.empty_responses += 1
+        self.last_poll_time = poll_time
+        self.last_dispatch_time = dispatch_time
+        if dispatch_time > self.max_dispatch_time:
+            self.max_dispatch_time = dispatch_time
+    def as_dict(self):
+        keys = [
+            'requests', 'events', 'empty_responses', 'errors', 'last_poll_time',
+            'last_dispatch_time', 'max_dispatch_time', 'last_rearm_delay',
+            'last_response_ts',
+        ]
+        return {k:getattr(self, k) for k in keys}
+    def __repr__(self):
+        return '<{self.__class__.__name__}: {self}>'.format(self=self)
+    def __str__(self):
+        return 'requests={self.requests}, events={self.events}, errors={self.errors}'.format(self=self)
 
 class KpDevice(ObjectBase):
     name = Property()
@@ -35,15 +71,75 @@ class KpDevice(ObjectBase):
     _events_ = [
         'on_events_received', 'on_parameter_value',
         'on_network_device_added', 'on_network_device_removed',
+        'on_clip_added', 'on_clip_changed', 'on_clip_removed',
+    ]
+    # (initial, maximum) delays in seconds before re-arming the event
+    # listener after an empty response or an error
+    listen_empty_backoff = (.01, .5)
+    listen_error_backoff = (.1, 5.)
+    # Poll intervals in seconds by transport state. "after_record" is used
+    # for record_settle_time seconds after recording stops, when the clip
+    # list is likely to change.
+    poll_intervals = {
+        'clips':{'idle':5., 'active':2., 'recording':1., 'after_record':.25},
+        'gang':{'idle':10., 'active':10., 'recording':10., 'after_record':10.},
+    }
+    poll_priorities = {'clips':1, 'gang':0}
+    record_settle_time = 5.
+    gang_parameter_ids = ['eParamID_GangEnable', 'eParamID_GangMaster', 'eParamID_GangList']
+    # Config events are considered absent if no listen response (including
+    # empty long-poll responses) has been received within this time
+    listen_stale_timeout = 30.
+    # Parameters created up front when lazy_parameters is enabled
+    eager_parameter_ids = [
+        'eParamID_NetworkServices', 'eParamID_SysName', 'eParamID_FormattedSerialNumber',
     ]
     def __init__(self, **kwargs):
         super(KpDevice, self).__init__(**kwargs)
         self.all_parameters = {}
+        self.parameter_descriptors = {}
+        self.lazy_parameters = kwargs.get('lazy_parameters', False)
+        # If True, config event values are set on the DeviceParameters as
+        # they are decoded and on_events_received gets {param_id:value}
+        # instead of {param_id:{'parameter':..., 'value':...}}
+        self.apply_values = kwargs.get('apply_values', False)
+        self.prepared_actions = {}
+        self.clip_differ = ClipDiffer()
+        self.clip_index = ClipIndex(self.clips.values())
+        self._update_clips_lock = asyncio.Lock()
+        self.listen_stats = ListenStats()
         self.loop = kwargs.get('loop')
+        self.session_borrowed = False
+        self.session_pool = kwargs.get('session_pool', session_pool)
         self.session = kwargs.get('session')
+        self.bootstrap_concurrency = kwargs.get('bootstrap_concurrency', 8)
+        self.descriptor_cache = kwargs.get('descriptor_cache')
+        # A DescriptorRegistry to share ParameterBase objects with other
+        # devices
+        self.descriptor_registry = kwargs.get('descriptor_registry')
+        self.coalesce_writes = kwargs.get('coalesce_writes', False)
+        self._pending_writes = {}
+        self.get_cache_ttl = kwargs.get('get_cache_ttl')
+        self._inflight_gets = {}
+        self._recent_gets = {}
+        self.bootstrap_time = None
+        self.bootstrap_errors = {}
+        self.scheduler = kwargs.get('scheduler')
+        self.poll_tasks = {}
+        self._record_stopped_ts = None
+        self._record_settle_handle = None
         if self.loop is None:
             self.loop = asyncio.get_event_loop()
-        self.transport = KpTransport(device=self)
+        if self.scheduler is None:
+            self.scheduler = get_scheduler(self.loop)
+        # See KpTransport.timecode_rate
+        self.transport = KpTransport(
+            device=self, timecode_rate=kwargs.get('timecode_rate'),
+        )
+        self.transport.bind(
+            active=self._on_transport_state,
+            recording=self._on_transport_state,
+        )
     @classmethod
     async def create(cls, **kwargs):
         obj = cls(**kwargs)
@@ -60,6 +156,11 @@ class KpDevice(ObjectBase):
         if value is not None:
             self.loop = value._loop
     @property
+    def connection_stats(self):
+        if not self.session_borrowed:
+            return None
+        return self.session_pool.stats(loop=self.loop)
+    @property
     def listen_action(self):
         a = getattr(self, '_listen_action', None)
         if a is None:
@@ -67,11 +168,16 @@ class KpDevice(ObjectBase):
             a = self._listen_action = actions.ListenForEvents(
                 self.host_address,
                 all_parameters=all_parameters,
+                apply_values=self.apply_values,
+                lazy_decoders=self.lazy_parameters,
                 session=self.session,
                 loop=self.loop,
             )
         return a
     async def connect(self):
+        if self.session is None:
+            self.session = self.session_pool.acquire(loop=self.loop)
+            self.session_borrowed = True
         self._listen_event = asyncio.Event()
         await self._get_all_parameters()
         await self.update_clips()
@@ -81,93 +187,293 @@ class KpDevice(ObjectBase):
         if not self.connected:
             return
         self.connected = False
+        fut = getattr(self, '_listen_loop_fut', None)
+        if fut is not None:
+            # The listen request may be held by the device, so don't wait for it
+            fut.cancel()
+            self._listen_loop_fut = None
         fut = getattr(self, '_update_loop_fut', None)
         if fut is not None:
             await fut
             self._update_loop_fut = None
-        if close_session and self.session is not None:
-            self.session.close()
+        if self._record_settle_handle is not None:
+            self._record_settle_handle.cancel()
+            self._record_settle_handle = None
+        writers = [state['task'] for state in self._pending_writes.values()]
+        for task in writers:
+            task.cancel()
+        if len(writers):
+            await asyncio.gather(*writers, return_exceptions=True)
+        if self.session is not None:
+            if self.session_borrowed:
+                self.session_pool.release(self.session)
+            elif close_session:
+                await self.session.close()
+        self.session_borrowed = False
         self.session = None
+        self._listen_action = None
+        self.prepared_actions.clear()
     async def _update_loop(self):
-        async def inner(f, timeout):
-            while self.connected:
-                await f()
-                await asyncio.sleep(timeout)
-        coros = [
-            inner(self.listen_for_events, .1),
-            inner(self.update_clips, .5),
-            inner(self.update_gang_params, .5),
-        ]
-        await asyncio.wait(coros)
+        state = self.poll_state
+        callbacks = {'clips':self.update_clips, 'gang':self.verify_gang_params}
+        for key, cb in callbacks.items():
+            self.poll_tasks[key] = self.scheduler.add_task(
+                cb, self.poll_intervals[key][state],
+                name='{} {}'.format(self.host_address, key),
+                priority=self.poll_priorities[key],
+            )
+        self._listen_loop_fut = asyncio.ensure_future(self._listen_loop())
+        await asyncio.wait([self._listen_loop_fut])
+        for task in self.poll_tasks.values():
+            await self.scheduler.remove_task(task)
+        self.poll_tasks.clear()
+    @property
+    def poll_state(self):
+        transport = self.transport
+        if transport.recording:
+            return 'recording'
+        ts = self._record_stopped_ts
+        if ts is not None and self.loop.time() - ts < self.record_settle_time:
+            return 'after_record'
+        if transport.active:
+            return 'active'
+        return 'idle'
+    def _on_transport_state(self, instance, value, **kwargs):
+        if instance.recording:
+            self._record_stopped_ts = None
+        elif kwargs.get('property').name == 'recording' and kwargs.get('old'):
+            self._record_stopped_ts = self.loop.time()
+            if self._record_settle_handle is not None:
+                self._record_settle_handle.cancel()
+            self._record_settle_handle = self.loop.call_later(
+                self.record_settle_time, self._on_record_settled,
+            )
+        # Poll right away on state changes since the current clip and
+        # clip list are likely to have changed
+        self.update_poll_intervals(run_now=True)
+    def _on_record_settled(self):
+        self._record_settle_handle = None
+        self.update_poll_intervals()
+    def update_poll_intervals(self, run_now=False):
+        state = self.poll_state
+        for key, task in self.poll_tasks.items():
+            task.set_interval(self.poll_intervals[key][state], run_now=run_now and key == 'clips')
+    async def _listen_loop(self):
+        # wait_for_config_events is a long-poll, so it is re-armed as soon
+        # as a response is handled. Delays are only added after errors or
+        # empty responses.
+        stats = self.listen_stats
+        delay = 0
+        while self.connected:
+            if delay:
+                await asyncio.sleep(delay)
+            stats.last_rearm_delay = delay
+            try:
+                events = await self.listen_for_events()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                stats.errors += 1
+                initial, maximum = self.listen_error_backoff
+                delay = min(maximum, max(initial, delay * 2))
+                continue
+            if len(events):
+                delay = 0
+            else:
+                initial, maximum = self.listen_empty_backoff
+                delay = min(maximum, max(initial, delay * 2))
     async def _do_action(self, action_cls, **kwargs):
         kwargs.setdefault('session', self.session)
         kwargs.setdefault('loop', self.loop)
         a = action_cls(self.host_address, **kwargs)
-        response = await a()
-        if self.session is None:
-            self.session = a.session
-        return response
+        return await a()
+    def get_prepared_action(self, action_cls, parameter=None):
+        if parameter is not None:
+            key = (action_cls, parameter.id)
+        else:
+            key = action_cls
+        a = self.prepared_actions.get(key)
+        if a is None:
+            a = action_cls(
+                self.host_address,
+                parameter=parameter,
+                session=self.session,
+                loop=self.loop,
+            )
+            # Built here so concurrent calls only ever read it
+            a.prepared
+            self.prepared_actions[key] = a
+        return a
+    async def _do_prepared_action(self, action_cls, parameter=None, **kwargs):
+        # Calls can overlap for the same parameter, so per-call values are
+        # passed to send() instead of being set on the shared action
+        a = self.get_prepared_action(action_cls, parameter)
+        return await a.send(self.session, **kwargs)
     async def update_clips(self):
-        clips = await self._do_action(actions.GetClips)
-        for clip in clips:
-            if clip.name not in self.clips:
-                self.clips[clip.name] = clip
-            else:
-                for attr in clip.attribute_names_:
-                    if attr == 'name':
-                        continue
-                    if attr == 'format':
-                        if str(clip.format) != str(self.clips[clip.name].format):
-                            self.clips[clip.name] = clip
-                        continue
-                    val = getattr(clip, attr)
-                    if getattr(self.clips[clip.name], attr) == val:
-                        continue
-                    setattr(self.clips[clip.name], attr, val)
+        # The differ tracks a single response at a time
+        async with self._update_clips_lock:
+            await self._update_clips()
         current = await self.get_parameter('eParamID_CurrentClip')
         if current in self.clips:
             self.transport.clip = self.clips[current]
+    async def _update_clips(self):
+        a = self.get_prepared_action(actions.GetClips)
+        differ = self.clip_differ
+        names = set()
+        async with a.stream(session=self.session, records=True) as stream:
+            async for text, data in stream:
+                status, name, h = differ.check_record(text, data)
+                names.add(name)
+                if status is None:
+                    continue
+                self._apply_clip(Clip.from_json(data))
+                clip = self.clips[name]
+                self.clip_index.update(clip)
+                differ.record_applied(name, h)
+                if status == 'added':
+                    self.emit('on_clip_added', self, clip)
+                else:
+                    self.emit('on_clip_changed', self, clip)
+        body_hash = stream.digest
+        for name in differ.find_removed(names, body_hash):
+            differ.record_removed(name)
+            clip = self.clips.pop(name, None)
+            if clip is None:
+                continue
+            self.clip_index.remove(name)
+            self.emit('on_clip_removed', self, clip)
+        differ.finish(body_hash)
+    def _apply_clip(self, clip):
+        if clip.name not in self.clips:
+            self.clips[clip.name] = clip
+            return
+        for attr in clip.attribute_names_:
+            if attr == 'name':
+                continue
+            if attr == 'format':
+                # Formats are interned, so an identity check is enough
+                if clip.format is not self.clips[clip.name].format:
+                    self.clips[clip.name] = clip
+                continue
+            val = getattr(clip, attr)
+            if getattr(self.clips[clip.name], attr) == val:
+                continue
+            setattr(self.clips[clip.name], attr, val)
+    def clip_at(self, tc):
+        return self.clip_index.clip_at(tc)
+    def clips_in_range(self, start_tc, end_tc):
+        return self.clip_index.clips_in_range(start_tc, end_tc)
+    @property
+    def events_active(self):
+        ts = self.listen_stats.last_response_ts
+        if ts is None:
+            return False
+        return self.loop.time() - ts < self.listen_stale_timeout
     async def update_gang_params(self):
-        for pid in ['GangEnable', 'GangMaster', 'GangList']:
-            pid = 'eParamID_{}'.format(pid)
-            p = self.all_parameters[pid]
-            await p.get_value()
+        params = [self.all_parameters[pid] for pid in self.gang_parameter_ids]
+        await asyncio.gather(*[p.get_value() for p in params])
+    async def verify_gang_params(self):
+        # Gang changes arrive through config events, so only poll when the
+        # event stream has gone quiet
+        if self.events_active:
+            return
+        await self.update_gang_params()
     async def listen_for_events(self):
         self._listen_event.clear()
         await self._get_all_parameters()
         a = self.listen_action
+        stats = self.listen_stats
+        stats.requests += 1
+        start_ts = self.loop.time()
         events = await a()
+        response_ts = self.loop.time()
+        for param_id in events.keys():
+            self._recent_gets.pop(param_id, None)
         self.emit('on_events_received', self, events)
-        for param_id, data in events.items():
-            device_param = self.all_parameters[param_id]
-            device_param.value = data['value']
+        if not self.apply_values:
+            for param_id, data in events.items():
+                if data['value'] is None:
+                    continue
+                self.all_parameters[param_id].value = data['value']
         self._listen_event.set()
+        stats.last_response_ts = response_ts
+        stats.record_response(
+            len(events),
+            response_ts - start_ts,
+            self.loop.time() - response_ts,
+        )
+        return events
     async def _get_all_parameters(self):
         if self.parameters_received:
             return
-        params = await self._do_action(actions.GetAllParameters)
-        for param_id, param in params['by_id'].items():
-            if param_id in self.all_parameters:
-                continue
-            device_param = DeviceParameter.create(device=self, parameter=param)
-            if isinstance(device_param, NetworkServicesParameter):
-                for d in device_param.devices.values():
-                    self._on_network_device_added(d)
-                device_param.bind(
-                    on_device_added=self._on_network_device_added,
-                    on_device_removed=self._on_network_device_removed,
-                )
-            self.all_parameters[param_id] = device_param
-            device_param.bind(value=self._on_device_parameter_value)
+        params = await self._do_action(
+            actions.GetAllParameters,
+            cache=self.descriptor_cache,
+            registry=self.descriptor_registry,
+        )
+        self.parameter_descriptors = params['by_id']
+        if self.lazy_parameters:
+            self.all_parameters = LazyParameterMap(
+                descriptors=self.parameter_descriptors,
+                factory=self._build_device_parameter,
+            )
+            for param_id in self.eager_parameter_ids:
+                if param_id in self.all_parameters:
+                    self.all_parameters[param_id]
+        else:
+            for param_id, param in params['by_id'].items():
+                if param_id in self.all_parameters:
+                    continue
+                self.all_parameters[param_id] = self._build_device_parameter(param)
         self.parameters_received = True
         await self.get_all_parameter_values()
+    def _build_device_parameter(self, param):
+        device_param = DeviceParameter.create(device=self, parameter=param)
+        if isinstance(device_param, NetworkServicesParameter):
+            for d in device_param.devices.values():
+                self._on_network_device_added(d)
+            device_param.bind(
+                on_device_added=self._on_network_device_added,
+                on_device_removed=self._on_network_device_removed,
+            )
+        device_param.bind(value=self._on_device_parameter_value)
+        return device_param
+    def _apply_parameter_response(self, param_id, response):
+        if self.lazy_parameters:
+            self.all_parameters.set_raw_value(param_id, response)
+        else:
+            self.all_parameters[param_id].process_response(response)
     async def get_all_parameter_values(self):
-        for device_param in self.all_parameters.values():
-            if device_param.parameter.param_type == 'data':
+        start_ts = self.loop.time()
+        params = []
+        for param in self.parameter_descriptors.values():
+            if param.param_type == 'data':
                 continue
-            if device_param.id in ['eParamID_MACAddress', 'eParamID_NetworkServices']:
+            if param.id in ['eParamID_MACAddress', 'eParamID_NetworkServices']:
                 continue
-            await device_param.get_value()
+            params.append(param)
+
+        limit = self.bootstrap_concurrency
+        if not limit or limit < 1:
+            limit = 1
+        semaphore = asyncio.Semaphore(limit)
+        async def get_response(param):
+            async with semaphore:
+                return await self.get_parameter(param)
+        # Failures are kept per-parameter so one bad response doesn't
+        # prevent the rest from being applied
+        responses = await asyncio.gather(
+            *[get_response(p) for p in params],
+            return_exceptions=True,
+        )
+
+        self.bootstrap_errors = {}
+        for param, response in zip(params, responses):
+            if isinstance(response, Exception):
+                self.bootstrap_errors[param.id] = response
+                continue
+            self._apply_parameter_response(param.id, response)
+        self.bootstrap_time = self.loop.time() - start_ts
     def _on_device_parameter_value(self, instance, value, **kwargs):
         if instance.id == 'eParamID_SysName':
             self.name = value
@@ -183,24 +489,89 @@ class KpDevice(ObjectBase):
         if device.id in self.network_devices:
             del self.network_devices[device.id]
         self.emit('on_network_device_removed', self, device)
-    async def _get_parameter_object(self, parameter):
+    async def _get_parameter_descriptor(self, parameter):
         await self._get_all_parameters()
         if isinstance(parameter, (ParameterBase, DeviceParameter)):
-            return self.all_parameters[parameter.id]
-        return self.all_parameters[parameter]
+            return self.parameter_descriptors[parameter.id]
+        return self.parameter_descriptors[parameter]
     async def get_parameter(self, parameter):
-        parameter = await self._get_parameter_object(parameter)
-        return await self._do_action(
-            actions.GetParameter,
-            parameter=parameter.parameter,
-        )
+        parameter = await self._get_parameter_descriptor(parameter)
+        ttl = self.get_cache_ttl
+        if ttl:
+            cached = self._recent_gets.get(parameter.id)
+            if cached is not None:
+                ts, value = cached
+                if self.loop.time() - ts <= ttl:
+                    return value
+        # Concurrent requests for the same parameter share one in-flight
+        # request and its result
+        fut = self._inflight_gets.get(parameter.id)
+        if fut is None:
+            fut = asyncio.ensure_future(self._do_prepared_action(
+                actions.GetParameter,
+                parameter,
+            ))
+            self._inflight_gets[parameter.id] = fut
+            fut.add_done_callback(
+                lambda f, pid=parameter.id: self._on_get_parameter_done(pid, f)
+            )
+        return await asyncio.shield(fut)
+    def _on_get_parameter_done(self, param_id, fut):
+        if self._inflight_gets.get(param_id) is not fut:
+            return
+        del self._inflight_gets[param_id]
+        if not self.get_cache_ttl or fut.cancelled() or fut.exception() is not None:
+            return
+        self._recent_gets[param_id] = (self.loop.time(), fut.result())
+    def _invalidate_parameter_get(self, param_id):
+        self._inflight_gets.pop(param_id, None)
+        self._recent_gets.pop(param_id, None)
     async def set_parameter(self, parameter, value):
-        parameter = await self._get_parameter_object(parameter)
-        return await self._do_action(
+        parameter = await self._get_parameter_descriptor(parameter)
+        self._invalidate_parameter_get(parameter.id)
+        if self.coalesce_writes:
+            return await self._set_parameter_coalesced(parameter, value)
+        return await self._do_prepared_action(
             actions.SetParameter,
-            parameter=parameter.parameter,
+            parameter,
             value=value,
         )
+    async def _set_parameter_coalesced(self, parameter, value):
+        # While a write is in flight, only the most recent value is kept
+        # and sent once it completes. Every caller receives the response
+        # from the last write sent.
+        state = self._pending_writes.get(parameter.id)
+        if state is None:
+            state = {'future':self.loop.create_future()}
+            self._pending_writes[parameter.id] = state
+            state['task'] = asyncio.ensure_future(
+                self._coalesced_writer(parameter, state, value), loop=self.loop,
+            )
+        else:
+            state['value'] = value
+        return await asyncio.shield(state['future'])
+    async def _coalesced_writer(self, parameter, state, value):
+        fut = state['future']
+        try:
+            while True:
+                response = await self._do_prepared_action(
+                    actions.SetParameter,
+                    parameter,
+                    value=value,
+                )
+                if 'value' not in state:
+                    break
+                value = state.pop('value')
+        except Exception as exc:
+            fut.set_exception(exc)
+        except BaseException:
+            # Cancelled (e.g. by stop()), so the callers can't be left waiting
+            fut.cancel()
+            raise
+        else:
+            fut.set_result(response)
+        finally:
+            del self._pending_writes[parameter.id]
     async def create_gang(self, *members):
         if not len(members):
             members = [m for m in self.network_devices.values() if m is not self.network_host_device]
@@ -279,20 +650,126 @@ class KpTransport(ObjectBase):
         'paused':False,
         'shuttle':False,
     }
+    _timecode_view_properties = [
+        'timecode_str', 'timecode_remaining', 'timecode_remaining_str',
+    ]
     def __init__(self, **kwargs):
+        self.timecode_views = []
+        self.timecode_view = None
+        # If set, the max updates per second of the timecode_str,
+        # timecode_remaining and timecode_remaining_str Properties
+        self.timecode_rate = kwargs.get('timecode_rate')
+        self._timecode_str_cache = None
+        self._remaining_format = None
         self.bind(
             clip=self.on_clip,
             active=self.on_active,
             playing=self.on_playing,
             recording=self.on_recording,
             timecode=self.on_timecode,
-            timecode_remaining=self.on_timecode_remaining,
+            frame_range=self.on_frame_range,
         )
         super(KpTransport, self).__init__(**kwargs)
         self.device.bind(on_parameter_value=self.on_parameter_value)
+    def bind(self, **kwargs):
+        # The timecode Properties are only rendered while something is bound
+        # to them. The view is started first so new listeners aren't called
+        # with the current value.
+        if self.timecode_view is None:
+            for name in self._timecode_view_properties:
+                if name in kwargs:
+                    self._start_timecode_view()
+                    break
+        super(KpTransport, self).bind(**kwargs)
+    def unbind(self, *args):
+        super(KpTransport, self).unbind(*args)
+        if self.timecode_view is not None and not self._has_timecode_observers():
+            self._stop_timecode_view()
+    def _has_timecode_observers(self):
+        # Listeners are stored weakly, so this also notices ones that were
+        # collected without being unbound
+        events = self._Dispatcher__property_events
+        for name in self._timecode_view_properties:
+            e = events[name]
+            if len(e.listeners) or len(e.aio_listeners):
+                return True
+        return False
+    def _start_timecode_view(self):
+        view = KpTransportTimecodeView(transport=self, max_rate=self.timecode_rate)
+        view.bind(
+            timecode_str=self.on_timecode_view_value,
+            timecode_remaining=self.on_timecode_view_value,
+            timecode_remaining_str=self.on_timecode_view_value,
+        )
+        self.timecode_view = view
+        self.timecode_str = view.timecode_str
+        self.timecode_remaining = view.timecode_remaining
+        self.timecode_remaining_str = view.timecode_remaining_str
+        self._watch_timecode()
+    def _stop_timecode_view(self):
+        view = self.timecode_view
+        self.timecode_view = None
+        view.stop()
+        self._watch_timecode()
+    def _watch_timecode(self):
+        # Frame changes are only observed when something is displaying them
+        tc = self.timecode
+        if tc is None:
+            return
+        if self.timecode_view is not None or len(self.timecode_views):
+            tc.bind(on_change=self.on_timecode_change)
+        else:
+            tc.unbind(self.on_timecode_change)
     @property
     def loop(self):
         return self.device.loop
+    def get_timecode_str(self):
+        # Rendered on read and reused until the frame count changes
+        tc = self.timecode
+        if tc is None:
+            return '00:00:00:00'
+        total_frames = tc.total_frames
+        cached = self._timecode_str_cache
+        if cached is not None and cached[0] is tc and cached[1] == total_frames:
+            return cached[2]
+        s = str(tc)
+        self._timecode_str_cache = (tc, total_frames, s)
+        return s
+    @property
+    def frames_remaining(self):
+        tc = self.timecode
+        if tc is None:
+            return 0
+        return max(self.frame_range[1] - tc.total_frames, 0)
+    def get_timecode_remaining(self):
+        if self.timecode is None:
+            return None
+        return TimecodeValue(self.frames_remaining, self._remaining_format)
+    def add_timecode_view(self, max_rate=None):
+        view = KpTransportTimecodeView(transport=self, max_rate=max_rate)
+        self.timecode_views.append(view)
+        self._watch_timecode()
+        return view
+    def remove_timecode_view(self, view):
+        if view not in self.timecode_views:
+            return
+        self.timecode_views.remove(view)
+        view.stop()
+        self._watch_timecode()
+    def update_timecode_views(self, immediate=False):
+        views = self.timecode_views
+        if self.timecode_view is not None:
+            if self._has_timecode_observers():
+                views = [self.timecode_view] + views
+            else:
+                self._stop_timecode_view()
+        for view in views:
+            if immediate:
+                view.update()
+            else:
+                view.on_timecode_change()
+    def on_timecode_view_value(self, instance, value, **kwargs):
+        setattr(self, kwargs['property'].name, value)
     @property
     def timecode_param(self):
         p = getattr(self, '_timecode_param', None)
@@ -328,18 +805,27 @@ class KpTransport(ObjectBase):
         param = self.device.all_parameters['eParamID_GoToClip']
         await param.set_value(clip.name)
         self.clip = clip
+    async def go_to_timecode_anywhere(self, tc):
+        # Cue to a timecode in whichever clip contains it
+        clip = self.device.clip_at(tc)
+        if clip is None:
+            raise KeyError('No clip found for timecode {}'.format(tc))
+        if isinstance(tc, int):
+            tc = TimecodeValue(tc, clip.start_timecode.frame_format)
+        if clip is not self.clip:
+            await self.go_to_clip(clip)
+        await self.go_to_timecode(tc)
     async def go_to_frame(self, frame):
-        tc = self.timecode.copy()
-        tc.set_total_frames(frame)
+        tc = TimecodeValue(frame, self.timecode.frame_format)
         await self.go_to_timecode(tc)
     async def go_to_timecode(self, tc):
-        if isinstance(tc, Timecode):
+        if isinstance(tc, (Timecode, TimecodeValue)):
             tc = str(tc)
         param = self.device.all_parameters['eParamID_CueToTimecode']
         playing = self.playing
         await param.set_value(tc)
         if playing:
-            while not self.timecode_str == tc:
+            while not self.get_timecode_str() == tc:
                 await asyncio.sleep(0)
             await self.play()
         else:
@@ -369,12 +855,8 @@ class KpTransport(ObjectBase):
     def on_clip(self, instance, clip, **kwargs):
         if clip is None:
             self.timecode = None
-            self.timecode_remaining = None
-        self.timecode = clip.start_timecode.copy()
-        self.timecode_remaining = Timecode(
-            frame_format=FrameFormat(rate=self.timecode.frame_format.rate),
-            total_frames=self.clip.duration_tc.total_frames,
-        )
+            return
+        self.timecode = clip.start_timecode.to_timecode()
         start_f = self.clip.start_timecode.total_frames
         self.frame_range = [
             start_f,
@@ -402,33 +884,20 @@ class KpTransport(ObjectBase):
             old.unbind(self)
             asyncio.ensure_future(self.stop_freerun(old), loop=self.loop)
         if value is None:
+            self._remaining_format = None
+            self.update_timecode_views(immediate=True)
             return
-        self.timecode_str = str(value)
-        value.bind(on_change=self.on_timecode_change)
+        self._remaining_format = FrameFormat(rate=value.frame_format.rate)
+        self._watch_timecode()
+        self.update_timecode_views(immediate=True)
         if self.playing or self.recording:
             asyncio.ensure_future(value.start_freerun(), loop=self.loop)
-    def on_timecode_remaining(self, instance, value, **kwargs):
-        old = kwargs.get('old')
-        if old is not None:
-            old.unbind(self)
-        if value is not None:
-            self.timecode_remaining_str = str(value)
-            value.bind(on_change=self.on_timecode_remaining_change)
-        else:
-            self.timecode_remaining_str = '00:00:00:00'
+    def on_frame_range(self, *args, **kwargs):
+        self.update_timecode_views(immediate=True)
     def on_timecode_change(self, tc, total_frames, **kwargs):
-        prev_frames = kwargs.get('old')
         if tc is not self.timecode:
             return
-        self.timecode_str = str(tc)
-        if self.timecode_remaining is not None:
-            if total_frames > prev_frames:
-                self.timecode_remaining -= total_frames - prev_frames
-            else:
-                self.timecode_remaining += prev_frames - total_frames
-    def on_timecode_remaining_change(self, tc, total_frames, **kwargs):
-        tc = kwargs.get('obj')
-        self.timecode_remaining_str = str(tc)
+        self.update_timecode_views()
     async def stop_freerun(self, timecode=None):
         if timecode is None:
             timecode = self.timecode
@@ -470,3 +939,52 @@ class KpTransport(ObjectBase):
             self.shuttling_reverse = False
         self.active = self.playing or self.recording or self.paused or self.shuttle
         self.stopped = not self.active
+
+class KpTransportTimecodeView(ObjectBase):
+    timecode_str = Property('00:00:00:00')
+    timecode_remaining = Property()
+    timecode_remaining_str = Property('00:00:00:00')
+    __attribute_names = ['transport', 'max_rate']
+    def __init__(self, **kwargs):
+        super(KpTransportTimecodeView, self).__init__(**kwargs)
+        self.last_update_ts = None
+        self._update_handle = None
+        self.update()
+    @property
+    def loop(self):
+        return self.transport.loop
+    def on_timecode_change(self):
+        # Changes within 1/max_rate of the last update are deferred, with
+        # the latest value rendered when the deferred update runs
+        if self._update_handle is not None:
+            return
+        if not self.max_rate:
+            self.update()
+            return
+        now = self.loop.time()
+        next_ts = self.last_update_ts + 1. / self.max_rate
+        if now >= next_ts:
+            self.update(now)
+        else:
+            self._update_handle = self.loop.call_at(next_ts, self.update)
+    def update(self, now=None):
+        if self._update_handle is not None:
+            self._update_handle.cancel()
+            self._update_handle = None
+        if now is None:
+            now = self.loop.time()
+        self.last_update_ts = now
+        transport = self.transport
+        remaining = transport.get_timecode_remaining()
+        self.timecode_str = transport.get_timecode_str()
+        self.timecode_remaining = remaining
+        if remaining is None:
+            self.timecode_remaining_str = '00:00:00:00'
+        else:
+            self.timecode_remaining_str = str(remaining)
+    def stop(self):
+        if self._update_handle is not None:
+            self._update_handle.cancel()
+            self._update_handle = None
+    def close(self):
+        self.transport.remove_timecode_view(self)
@@ -0,0 +1,190 @@
+import asyncio
+
+from pydispatch import Property, DictProperty
+
+from kpkontrol.base import ObjectBase
+from kpkontrol.session import SessionPool
+from kpkontrol.cache import DescriptorRegistry
+from kpkontrol.scheduler import PollScheduler
+from kpkontrol.device import KpDevice
+
+
+class KpFleet(ObjectBase):
+    connected = Property(False)
+    devices = DictProperty()
+    _events_ = [
+        'on_device_added', 'on_device_removed',
+        'on_device_connected', 'on_device_error',
+        'on_parameter_value', 'on_events_received', 'on_transport_state',
+        'on_clip_added', 'on_clip_changed', 'on_clip_removed',
+    ]
+    # Device events re-emitted by the fleet with the device as the first argument
+    device_events = [
+        'on_events_received', 'on_clip_added', 'on_clip_changed', 'on_clip_removed',
+    ]
+    def __init__(self, **kwargs):
+        super(KpFleet, self).__init__(**kwargs)
+        self.loop = kwargs.get('loop')
+        if self.loop is None:
+            self.loop = asyncio.get_event_loop()
+        # Each device holds a long-poll connection open at all times, so
+        # the pool is only limited per host. A global limit would let the
+        # held listen requests starve commands as the fleet grows.
+        self.session_pool = kwargs.get('session_pool')
+        # Only a pool created here is closed by stop()
+        self.owns_session_pool = self.session_pool is None
+        if self.owns_session_pool:
+            self.session_pool = SessionPool(limit=0)
+        self.scheduler = kwargs.get('scheduler')
+        if self.scheduler is None:
+            self.scheduler = PollScheduler(
+                loop=self.loop,
+                max_concurrent=kwargs.get('max_concurrent_polls', 32),
+            )
+        self.connect_concurrency = kwargs.get('connect_concurrency', 16)
+        # Delay in seconds between starting each device connection
+        self.connect_stagger = kwargs.get('connect_stagger', .02)
+        self.device_kwargs = kwargs.get('device_kwargs', {}).copy()
+        # Devices on the same firmware share their parsed descriptors
+        self.device_kwargs.setdefault('descriptor_registry', DescriptorRegistry())
+        self.connect_errors = {}
+        self._device_handlers = {}
+        for host_address in kwargs.get('host_addresses', []):
+            self.add_device(host_address)
+    @classmethod
+    async def create(cls, **kwargs):
+        obj = cls(**kwargs)
+        await obj.connect()
+        return obj
+    @property
+    def connected_devices(self):
+        return [d for d in self.devices.values() if d.connected]
+    def add_device(self, host_address, **kwargs):
+        if host_address in self.devices:
+            return self.devices[host_address]
+        device_kwargs = self.device_kwargs.copy()
+        device_kwargs.update(kwargs)
+        device_kwargs.update(dict(
+            host_address=host_address,
+            loop=self.loop,
+            session_pool=self.session_pool,
+            scheduler=self.scheduler,
+        ))
+        device = KpDevice(**device_kwargs)
+        self._bind_device(device)
+        self.devices[host_address] = device
+        self.emit('on_device_added', self, device)
+        if self.connected:
+            asyncio.ensure_future(self._connect_device(device), loop=self.loop)
+        return device
+    async def remove_device(self, device):
+        if not isinstance(device, KpDevice):
+            device = self.devices[device]
+        if self.devices.get(device.host_address) is not device:
+            return
+        del self.devices[device.host_address]
+        self.connect_errors.pop(device.host_address, None)
+        await device.stop()
+        self._unbind_device(device)
+        self.emit('on_device_removed', self, device)
+    def _bind_device(self, device):
+        # Handlers are closures over the device, so references are kept
+        # here for pydispatch's weak references
+        handlers = {}
+        for event in self.device_events:
+            handlers[event] = self._build_forwarder(event, device)
+        handlers['on_parameter_value'] = self._build_forwarder('on_parameter_value', device)
+        device.bind(**handlers)
+        transport_handler = self._build_forwarder('on_transport_state', device)
+        device.transport.bind(transport_str=transport_handler)
+        handlers['transport'] = transport_handler
+        self._device_handlers[device.host_address] = handlers
+    def _unbind_device(self, device):
+        handlers = self._device_handlers.pop(device.host_address, None)
+        if handlers is None:
+            return
+        device.transport.unbind(handlers.pop('transport'))
+        device.unbind(*handlers.values())
+    def _build_forwarder(self, event, device):
+        emit = self.emit
+        if event == 'on_events_received':
+            def forward(instance, events, **kwargs):
+                emit(event, device, events)
+        elif event == 'on_transport_state':
+            def forward(instance, value, **kwargs):
+                emit(event, device, value)
+        elif event == 'on_parameter_value':
+            def forward(instance, value, **kwargs):
+                emit(event, device, instance, value)
+        else:
+            def forward(instance, clip, **kwargs):
+                emit(event, device, clip)
+        return forward
+    async def connect(self):
+        if self.connected:
+            return
+        self.connected = True
+        devices = list(self.devices.values())
+        sem = asyncio.Semaphore(self.connect_concurrency)
+        async def connect_device(i, device):
+            # Spread connection starts out so descriptor fetches and the
+            # first listen requests don't all land at once
+            await asyncio.sleep(i * self.connect_stagger)
+            async with sem:
+                await self._connect_device(device)
+        await asyncio.gather(*[connect_device(i, d) for i, d in enumerate(devices)])
+    async def _connect_device(self, device):
+        if device.connected:
+            return
+        try:
+            await device.connect()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            self.connect_errors[device.host_address] = exc
+            self.emit('on_device_error', self, device, exc)
+            return
+        self.connect_errors.pop(device.host_address, None)
+        self.emit('on_device_connected', self, device)
+    async def stop(self):
+        self.connected = False
+        await asyncio.gather(*[d.stop() for d in self.devices.values()])
+        if self.owns_session_pool:
+            await self.session_pool.close(self.loop)
+    async def _fan_out(self, f, devices=None):
+        if devices is None:
+            devices = self.connected_devices
+        devices = list(devices)
+        results = await asyncio.gather(
+            *[f(device) for device in devices],
+            return_exceptions=True,
+        )
+        return {d.host_address:result for d, result in zip(devices, results)}
+    async def get_parameter(self, parameter, devices=None):
+        async def get(device):
+            return await device.get_parameter(parameter)
+        return await self._fan_out(get, devices)
+    async def set_parameter(self, parameter, value, devices=None):
+        async def set_value(device):
+            return await device.set_parameter(parameter, value)
+        return await self._fan_out(set_value, devices)
+    async def transport_command(self, command, *args, **kwargs):
+        devices = kwargs.get('devices')
+        async def send(device):
+            m = getattr(device.transport, command)
+            return await m(*args)
+        return await self._fan_out(send, devices)
+    async def play(self, devices=None):
+        return await self.transport_command('play', devices=devices)
+    async def record(self, devices=None):
+        return await self.transport_command('record', devices=devices)
+    async def pause(self, devices=None):
+        return await self.transport_command('pause', devices=devices)
+    async def stop_transport(self, devices=None):
+        return await self.transport_command('stop', devices=devices)
+    async def go_to_clip(self, clip, devices=None):
+        return await self.transport_command('go_to_clip', clip, devices=devices)
+    def __repr__(self):
+        return '<{self.__class__.__name__}: {self}>'.format(self=self)
+    def __str__(self):
+        return '{} devices ({} connected)'.format(len(self.devices), len(self.connected_devices))
@@ -1,13 +1,17 @@
 import datetime
+import hashlib
+import random
+from collections.abc import Mapping
 import ipaddress
 from urllib.parse import urlparse
 import json
 
+from pydispatch import Dispatcher
 from pydispatch.properties import Property, DictProperty
 
 from kpkontrol.base import ObjectBase
 from kpkontrol.parameters import EnumParameter, ParameterEnumItem
-from kpkontrol.timecode import FrameRate, FrameFormat, Timecode
+from kpkontrol.timecode import FrameRate, FrameFormat, Timecode, TimecodeValue
 
 class DeviceParameter(ObjectBase):
     value = Property()
@@ -35,22 +39,69 @@ class DeviceParameter(ObjectBase):
             self.value = value
         return response
     async def get_value(self):
-        self.value = await self.device.get_parameter(self.parameter)
+        self.process_response(await self.device.get_parameter(self.parameter))
+    def process_response(self, value):
+        self.value = value
+    def build_event_decoder(self):
+        return self.parameter.build_event_decoder()
     def __repr__(self):
         return '<{self.__class__.__name__} {self.parameter}: {self.value}>'.format(self=self)
     def __str__(self):
         return self.name
 
+class LazyParameterMap(Mapping):
+    # Maps parameter ids to DeviceParameters, creating each one on first
+    # access. Values set before then are kept as raw responses and applied
+    # when the DeviceParameter is created. Note that values() and items()
+    # create every DeviceParameter.
+    def __init__(self, **kwargs):
+        self.descriptors = kwargs.get('descriptors')
+        self.factory = kwargs.get('factory')
+        self.materialized = {}
+        self.raw_values = {}
+    def __getitem__(self, key):
+        device_param = self.materialized.get(key)
+        if device_param is None:
+            param = self.descriptors[key]
+            device_param = self.materialized[key] = self.factory(param)
+            if key in self.raw_values:
+                device_param.process_response(self.raw_values.pop(key))
+        return device_param
+    def __contains__(self, key):
+        return key in self.descriptors
+    def __iter__(self):
+        return iter(self.descriptors)
+    def __len__(self):
+        return len(self.descriptors)
+    def is_materialized(self, key):
+        return key in self.materialized
+    def set_raw_value(self, key, value):
+        device_param = self.materialized.get(key)
+        if device_param is not None:
+            device_param.process_response(value)
+        else:
+            self.raw_values[key] = value
+    def __repr__(self):
+        return '<{self.__class__.__name__}: {n} of {t} created>'.format(
+            self=self, n=len(self.materialized), t=len(self.descriptors),
+        )
+
 class DeviceEnumParameter(DeviceParameter):
     enum_items = DictProperty()
     def __init__(self, **kwargs):
         super(DeviceEnumParameter, self).__init__(**kwargs)
-        for param_item in self.parameter.enum_items.values():
-            device_item = DeviceEnumItem(
-                device_parameter=self,
-                parameter_item=param_item,
-            )
-            self.enum_items[device_item.name] = device_item
+        self.enum_items = {
+            param_item.name:DeviceEnumItem(self, param_item)
+            for param_item in self.parameter.enum_items.values()
+        }
+        self.bind(value=self._on_value)
+    def _on_value(self, instance, value, **kwargs):
+        # Only the previous and new items change state
+        old = kwargs.get('old')
+        if isinstance(old, DeviceEnumItem):
+            old._on_active_changed(False)
+        if isinstance(value, DeviceEnumItem):
+            value._on_active_changed(True)
     async def set_value(self, value):
         key = self.parameter.format_value(value)
         param = self.enum_items[key]
@@ -58,18 +109,50 @@ class DeviceEnumParameter(DeviceParameter):
         if isinstance(response, ParameterEnumItem):
             self.value = self.enum_items[response.name]
         return response
-    async def get_value(self):
-        value = await self.device.get_parameter(self.parameter)
+    def process_response(self, value):
         if value is None:
             return
         self.value = self.enum_items[value.name]
+    def build_event_decoder(self):
+        items_by_value = self.parameter.enum_items_by_value
+        device_items = self.enum_items
+        items_by_text = {
+            str(v):device_items[item.name] for v, item in items_by_value.items()
+        }
+        def decode_enum_event(d):
+            device_item = items_by_text.get(d['int_value'])
+            if device_item is not None:
+                return device_item
+            item = items_by_value.get(int(d['int_value']))
+            if item is None:
+                return device_items.get(d['str_value'])
+            return device_items[item.name]
+        return decode_enum_event
 
-class DeviceEnumItem(ObjectBase):
-    active = Property(False)
-    def __init__(self, **kwargs):
-        self.device_parameter = kwargs.get('device_parameter')
-        self.parameter_item = kwargs.get('parameter_item')
-        self.device_parameter.bind(value=self.on_device_parameter_value)
+class DeviceEnumItemEvents(Dispatcher):
+    _events_ = ['active']
+
+class DeviceEnumItem(object):
+    # Items are kept small since every enum option on every device has one.
+    # A Dispatcher is only created once something binds to "active".
+    __slots__ = ('device_parameter', 'parameter_item', '_events', '__weakref__')
+    def __init__(self, device_parameter, parameter_item):
+        self.device_parameter = device_parameter
+        self.parameter_item = parameter_item
+        self._events = None
+    @property
+    def active(self):
+        return self.device_parameter.value is self
+    def bind(self, **kwargs):
+        if self._events is None:
+            self._events = DeviceEnumItemEvents()
+        self._events.bind(**kwargs)
+    def unbind(self, *args):
+        if self._events is not None:
+            self._events.unbind(*args)
+    def _on_active_changed(self, active):
+        if self._events is not None:
+            self._events.emit('active', self, active, old=not active)
     @property
     def name(self):
         return self.parameter_item.name
@@ -81,8 +164,6 @@ class DeviceEnumItem(ObjectBase):
         return self.parameter_item.value
     async def set_active(self):
         await self.device_parameter.set_value(self.name)
-    def on_device_parameter_value(self, instance, value, **kwargs):
-        self.active = value is self
     def __repr__(self):
         return '<{self.__class__.__name__} {self.parameter_item}: active={self.active}'.format(self=self)
     def __str__(self):
@@ -177,11 +258,17 @@ class NetworkDevice(ObjectBase):
         return self.device_parameter.device
     def _on_ip_prop(self, *args, **kwargs):
         self.device_id = '{self.ip_address}:{self.port}'.format(self=self)
-    def _check_gang_params(self, *args, **kwargs):
+    def _check_gang_params(self, param_id=None):
+        # If param_id is given, only the state derived from it is updated
         all_params = self.device.all_parameters
-        if self.is_host_device:
+        is_host_device = self.is_host_device
+        if is_host_device and param_id in (None, 'eParamID_GangEnable'):
             self.gang_enabled = str(all_params['eParamID_GangEnable'].value) == 'ON'
+        if is_host_device and param_id in (None, 'eParamID_GangMaster'):
             self.gang_master = str(all_params['eParamID_GangMaster'].value) == 'ON'
+        if param_id not in (None, 'eParamID_GangList'):
+            return
+        if is_host_device:
             addrs = all_params['eParamID_GangList'].value.split(',')
             for addr in addrs:
                 if addr in self.gang_members:
@@ -195,11 +282,12 @@ class NetworkDevice(ObjectBase):
         else:
             self.gang_enabled = self.ip_address in all_params['eParamID_GangList'].value
     def on_device_parameter_value(self, instance, value, **kwargs):
-        if 'Gang' not in instance.id:
+        if instance.id not in self.device.gang_parameter_ids:
             return
-        self._check_gang_params()
+        self._check_gang_params(instance.id)
     def on_device_network_devices(self, instance, value, **kwargs):
-        self._check_gang_params()
+        # Only gang membership depends on the other network devices
+        self._check_gang_params('eParamID_GangList')
     def __repr__(self):
         return '<{self.__class__.__name__}: {self}>'.format(self=self)
     def __str__(self):
@@ -210,8 +298,35 @@ class ClipFormat(ObjectBase):
     __attribute_names = [
         'width', 'height', 'frame_rate', 'interlaced', 'fourcc',
     ]
+    # Shared instances by attribute values, and by the raw values they were
+    # parsed from
+    _instances = {}
+    _parsed_instances = {}
+    def __init__(self, **kwargs):
+        super(ClipFormat, self).__init__(**kwargs)
+        self._frozen = True
+    def __setattr__(self, name, value):
+        if self.__dict__.get('_frozen'):
+            raise AttributeError('{!r} is immutable'.format(self))
+        super(ClipFormat, self).__setattr__(name, value)
+    @classmethod
+    def get(cls, **kwargs):
+        frame_rate = kwargs.get('frame_rate')
+        key = (
+            kwargs.get('width'), kwargs.get('height'),
+            frame_rate.value if frame_rate is not None else None,
+            kwargs.get('interlaced'), kwargs.get('fourcc'),
+        )
+        obj = cls._instances.get(key)
+        if obj is None:
+            obj = cls._instances[key] = cls(**kwargs)
+        return obj
     @classmethod
     def from_json(cls, data):
+        key = (data['width'], data['height'], data['fourcc'], data['framerate'], data['interlace'])
+        obj = cls._parsed_instances.get(key)
+        if obj is not None:
+            return obj
         kwargs = dict(
             width=int(data['width']),
             height=int(data['height']),
@@ -219,9 +334,14 @@ class ClipFormat(ObjectBase):
         )
         kwargs['frame_rate'] = FrameRate.from_float(data['framerate'])
         kwargs['interlaced'] = data['interlace'] == '1'
-        return cls(**kwargs)
+        obj = cls._parsed_instances[key] = cls.get(**kwargs)
+        return obj
     @classmethod
     def from_string(cls, s):
+        obj = cls._parsed_instances.get(s)
+        if obj is not None:
+            return obj
+        key = s
         kwargs = {}
         w, s = s.split('x')
         kwargs['width'] = int(w)
@@ -236,7 +356,8 @@ class ClipFormat(ObjectBase):
             kwargs['interlaced'] = False
             kwargs['height'] = int(h.rstrip('PsF'))
         kwargs['frame_rate'] = FrameRate.from_float(fr)
-        return cls(**kwargs)
+        obj = cls._parsed_instances[key] = cls.get(**kwargs)
+        return obj
     def __repr__(self):
         return '<{self.__class__.__name__}: {self}>'.format(self=self)
     def __str__(self):
@@ -263,11 +384,12 @@ class Clip(ObjectBase):
             audio_channels=int(data['attributes']['Audio Chan']),
         )
         fmt = kwargs['format'] = ClipFormat.from_json(data)
-        tc = kwargs['start_timecode'] = Timecode.parse(
+        # Stored as TimecodeValue since clip metadata is never observed
+        kwargs['start_timecode'] = TimecodeValue.parse(
             data['attributes']['Starting TC'],
             frame_rate=fmt.frame_rate,
         )
-        kwargs['duration_tc'] = Timecode.parse(
+        kwargs['duration_tc'] = TimecodeValue.parse(
             data['duration'],
             frame_rate=fmt.frame_rate,
             drop_frame=False,
@@ -280,3 +402,202 @@ class Clip(ObjectBase):
         return '<{self.__class__.__name__}: {self}>'.format(self=self)
     def __str__(self):
         return self.name
+
+class ClipDiffer(object):
+    # Tracks a hash of the last GetClips response body and of each clip
+    # record in it. Records are checked as they are parsed, so only new or
+    # changed ones need to be built into Clip objects.
+    def __init__(self):
+        self.body_hash = None
+        self.record_hashes = {}
+    def check_record(self, text, data):
+        # Nothing is stored here. Callers mark each change with
+        # record_applied/record_removed once it has been applied, so a
+        # failed update only repeats the changes that weren't.
+        name = data['clipname']
+        h = hashlib.sha1(text.encode('UTF-8')).digest()
+        prev = self.record_hashes.get(name)
+        if prev is None:
+            return 'added', name, h
+        elif prev != h:
+            return 'changed', name, h
+        return None, name, h
+    def find_removed(self, names, body_hash):
+        # Nothing can have been removed if the body is identical
+        if body_hash == self.body_hash:
+            return []
+        return [name for name in self.record_hashes if name not in names]
+    def record_applied(self, name, record_hash):
+        self.record_hashes[name] = record_hash
+    def record_removed(self, name):
+        self.record_hashes.pop(name, None)
+    def finish(self, body_hash):
+        self.body_hash = body_hash
+
+class _ClipIndexNode(object):
+    __slots__ = (
+        'key', 'frame_format', 'start', 'end', 'clip', 'priority', 'left', 'right', 'max_end',
+    )
+    def __init__(self, clip, frame_format, start, end):
+        self.key = (start, clip.name)
+        # The tree this node is in. Kept here since the clip's timecodes can
+        # be replaced after it is indexed.
+        self.frame_format = frame_format
+        self.start = start
+        self.end = end
+        self.clip = clip
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+        self.max_end = end
+    def update(self):
+        max_end = self.end
+        if self.left is not None and self.left.max_end > max_end:
+            max_end = self.left.max_end
+        if self.right is not None and self.right.max_end > max_end:
+            max_end = self.right.max_end
+        self.max_end = max_end
+
+def _treap_split(node, key):
+    # Split into nodes with keys less than key and the rest
+    if node is None:
+        return None, None
+    if node.key < key:
+        node.right, right = _treap_split(node.right, key)
+        node.update()
+        return node, right
+    left, node.left = _treap_split(node.left, key)
+    node.update()
+    return left, node
+
+def _treap_merge(left, right):
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _treap_merge(left.right, right)
+        left.update()
+        return left
+    right.left = _treap_merge(left, right.left)
+    right.update()
+    return right
+
+def _treap_remove(node, key):
+    if node is None:
+        return None
+    if key == node.key:
+        return _treap_merge(node.left, node.right)
+    if key < node.key:
+        node.left = _treap_remove(node.left, key)
+    else:
+        node.right = _treap_remove(node.right, key)
+    node.update()
+    return node
+
+def _treap_overlapping(node, start, end, result):
+    # Nodes whose [start, end) overlaps the given range, in key order.
+    # Subtrees are skipped by their max_end and key ordering, so this
+    # visits O(log n + k) nodes.
+    if node is None or node.max_end <= start:
+        return
+    _treap_overlapping(node.left, start, end, result)
+    if node.start >= end:
+        return
+    if node.end > start:
+        result.append(node)
+    _treap_overlapping(node.right, start, end, result)
+
+class ClipIndex(object):
+    # Interval index over the timecode range covered by each clip, as a
+    # treap ordered by start frame and augmented with the maximum end frame
+    # of each subtree. Clips are kept in a separate tree per frame format
+    # since frame counts in different formats can't be compared.
+    def __init__(self, clips=None):
+        self.trees = {}
+        self.nodes = {}
+        if clips is not None:
+            for clip in clips:
+                self.add(clip)
+    def __len__(self):
+        return len(self.nodes)
+    def __contains__(self, clip):
+        if isinstance(clip, Clip):
+            node = self.nodes.get(clip.name)
+            return node is not None and node.clip is clip
+        return clip in self.nodes
+    def __iter__(self):
+        for frame_format in list(self.trees.keys()):
+            stack = []
+            node = self.trees.get(frame_format)
+            while stack or node is not None:
+                if node is not None:
+                    stack.append(node)
+                    node = node.left
+                else:
+                    node = stack.pop()
+                    yield node.clip
+                    node = node.right
+    def add(self, clip):
+        if clip.name in self.nodes:
+            self.remove(clip.name)
+        tc = clip.start_timecode
+        start = tc.total_frames
+        frame_format = tc.frame_format
+        node = _ClipIndexNode(
+            clip, frame_format, start, start + max(clip.duration_tc.total_frames, 1),
+        )
+        left, right = _treap_split(self.trees.get(frame_format), node.key)
+        self.trees[frame_format] = _treap_merge(_treap_merge(left, node), right)
+        self.nodes[clip.name] = node
+    def update(self, clip):
+        self.add(clip)
+    def remove(self, clip):
+        if isinstance(clip, Clip):
+            clip = clip.name
+        node = self.nodes.pop(clip, None)
+        if node is None:
+            return
+        frame_format = node.frame_format
+        root = _treap_remove(self.trees.get(frame_format), node.key)
+        if root is None:
+            del self.trees[frame_format]
+        else:
+            self.trees[frame_format] = root
+    def clear(self):
+        self.trees.clear()
+        self.nodes.clear()
+    def _get_frames(self, tc, frame_format):
+        if isinstance(tc, str):
+            return TimecodeValue.parse(tc, frame_format.rate, frame_format.drop_frame).total_frames
+        if isinstance(tc, (Timecode, TimecodeValue)):
+            if tc.frame_format != frame_format:
+                return None
+            return tc.total_frames
+        return tc
+    def _find_overlapping(self, start_tc, end_tc):
+        nodes = []
+        for frame_format, root in self.trees.items():
+            start = self._get_frames(start_tc, frame_format)
+            end = self._get_frames(end_tc, frame_format)
+            if start is None or end is None:
+                continue
+            _treap_overlapping(root, start, end, nodes)
+        return nodes
+    def clip_at(self, tc):
+        # The clip containing the given timecode, or the latest starting one
+        # if clips overlap
+        nodes = []
+        for frame_format, root in self.trees.items():
+            frames = self._get_frames(tc, frame_format)
+            if frames is None:
+                continue
+            _treap_overlapping(root, frames, frames + 1, nodes)
+        if not len(nodes):
+            return None
+        return max(nodes, key=lambda n: n.key).clip
+    def clips_in_range(self, start_tc, end_tc):
+        # Clips overlapping [start_tc, end_tc), ordered by start
+        nodes = self._find_overlapping(start_tc, end_tc)
+        nodes.sort(key=lambda n: n.key)
+        return [n.clip for n in nodes]
@@ -5,25 +5,137 @@ import ipaddress
 
 from kpkontrol.base import ObjectBase
 
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_TRAILING = re.compile(r'[ \t\n\r;]*')
+_NUMBER = re.compile(r'-?(?:0|[1-9][0-9]*)(\.[0-9]+)?([eE][-+]?[0-9]+)?')
+_IDENTIFIER = re.compile(r'[a-zA-Z_][a-zA-Z0-9_]*')
+_CONSTANTS = {'true':True, 'false':False, 'null':None}
+# Fast path for the most common member format (``key:"value",``)
+_STRING_MEMBER = re.compile(
+    r'(?:"([^"\\\n\r]*)"|([a-zA-Z_][a-zA-Z0-9_]*))[ \t\n\r]*:[ \t\n\r]*"([^"\\\n\r]*)"[ \t\n\r]*([,}])[ \t\n\r]*'
+)
+
+# The device responds with javascript literals (unquoted object keys and
+# a trailing semicolon) rather than json. These are parsed in a single pass
+# without rebuilding the string.
 def parse_crap_json(s):
-    def split_quotes(_s):
-        pre = None
-        while '"' in _s:
-            start, sep, _s = _s.partition('"')
-            if pre is None:
-                pre = start
-            else:
-                yield pre, '"{}"'.format(start)
-                pre = None
-        yield _s, ''
-    s = ''.join(s.splitlines()).strip(';')
-    cleaned = ''
-    c = re.compile('([a-zA-Z_]+):')
-    for non_quoted, quoted in split_quotes(s):
-        non_quoted = c.sub(r'"\1":', non_quoted)
-        cleaned = ''.join([cleaned, non_quoted, quoted])
-    return json.loads(cleaned)
+    idx = _TRAILING.match(s, 0).end()
+    value, idx = _parse_value(s, idx)
+    idx = _TRAILING.match(s, idx).end()
+    if idx != len(s):
+        raise json.JSONDecodeError('Extra data', s, idx)
+    return value
+
+def _parse_value(s, idx):
+    try:
+        c = s[idx]
+    except IndexError:
+        raise json.JSONDecodeError('Expecting value', s, idx)
+    if c == '"':
+        return _parse_string(s, idx)
+    elif c == '{':
+        return _parse_object(s, idx)
+    elif c == '[':
+        return _parse_array(s, idx)
+    m = _NUMBER.match(s, idx)
+    if m is not None:
+        frac, exp = m.groups()
+        if frac or exp:
+            return float(m.group()), m.end()
+        return int(m.group()), m.end()
+    m = _IDENTIFIER.match(s, idx)
+    if m is not None and m.group() in _CONSTANTS:
+        return _CONSTANTS[m.group()], m.end()
+    raise json.JSONDecodeError('Expecting value', s, idx)
+
+def _parse_string(s, idx):
+    start = idx + 1
+    end = s.find('"', start)
+    while end != -1:
+        # Count preceding backslashes to check for an escaped quote
+        nbs = 0
+        i = end - 1
+        while i >= start and s[i] == '\\':
+            nbs += 1
+            i -= 1
+        if not nbs % 2:
+            break
+        end = s.find('"', end + 1)
+    if end == -1:
+        raise json.JSONDecodeError('Unterminated string', s, idx)
+    value = s[start:end]
+    if '\n' in value or '\r' in value:
+        value = ''.join(value.splitlines())
+    if '\\' in value:
+        value = json.loads('"{}"'.format(value))
+    return value, end + 1
+
+def _parse_object(s, idx):
+    obj = {}
+    idx = _WHITESPACE.match(s, idx + 1).end()
+    if s[idx:idx+1] == '}':
+        return obj, idx + 1
+    while True:
+        m = _STRING_MEMBER.match(s, idx)
+        if m is not None:
+            quoted_key, key, value, c = m.groups()
+            if key is None:
+                key = quoted_key
+            obj[key] = value
+            idx = m.end()
+            if c == '}':
+                return obj, idx
+            if s[idx:idx+1] == '}':
+                return obj, idx + 1
+            continue
+        if s[idx:idx+1] == '"':
+            key, idx = _parse_string(s, idx)
+        else:
+            m = _IDENTIFIER.match(s, idx)
+            if m is None:
+                raise json.JSONDecodeError('Expecting property name', s, idx)
+            key, idx = m.group(), m.end()
+        idx = _WHITESPACE.match(s, idx).end()
+        if s[idx:idx+1] != ':':
+            raise json.JSONDecodeError("Expecting ':' delimiter", s, idx)
+        idx = _WHITESPACE.match(s, idx + 1).end()
+        obj[key], idx = _parse_value(s, idx)
+        idx = _WHITESPACE.match(s, idx).end()
+        c = s[idx:idx+1]
+        if c == ',':
+            idx = _WHITESPACE.match(s, idx + 1).end()
+            if s[idx:idx+1] == '}':
+                return obj, idx + 1
+        elif c == '}':
+            return obj, idx + 1
+        else:
+            raise json.JSONDecodeError("Expecting ',' delimiter", s, idx)
+
+def _parse_array(s, idx):
+    arr = []
+    idx = _WHITESPACE.match(s, idx + 1).end()
+    if s[idx:idx+1] == ']':
+        return arr, idx + 1
+    while True:
+        value, idx = _parse_value(s, idx)
+        arr.append(value)
+        idx = _WHITESPACE.match(s, idx).end()
+        c = s[idx:idx+1]
+        if c == ',':
+            idx = _WHITESPACE.match(s, idx + 1).end()
+            if s[idx:idx+1] == ']':
+                return arr, idx + 1
+        elif c == ']':
+            return arr, idx + 1
+        else:
+            raise json.JSONDecodeError("Expecting ',' delimiter", s, idx)
+
+
+def decode_str_event(d):
+    return d['str_value']
 
+def decode_int_event(d):
+    return int(d['int_value'])
 
 class ParameterBase(ObjectBase):
     #{u'data', u'enum', u'integer', u'octets', u'octets_read_only', u'string'}
@@ -63,6 +175,8 @@ class ParameterBase(ObjectBase):
         return cls(**kwargs)
     def format_value(self, value):
         return str(value)
+    def build_event_decoder(self):
+        return decode_str_event
     async def parse_response(self, r):
         s = await r.text()
         if isinstance(s, bytes):
@@ -101,6 +215,17 @@ class EnumParameter(ParameterBase):
         return item
     def item_from_value(self, value):
         return self.enum_items_by_value[value]
+    def build_event_decoder(self):
+        items_by_value = self.enum_items_by_value
+        # Looked up by the event's int_value text first, to skip the int()
+        # for the usual form of the value
+        items_by_text = {str(v):item for v, item in items_by_value.items()}
+        def decode_enum_event(d):
+            item = items_by_text.get(d['int_value'])
+            if item is None:
+                item = items_by_value.get(int(d['int_value']))
+            return item
+        return decode_enum_event
     def format_value(self, value):
         if isinstance(value, numbers.Number):
             item = self.item_from_value(value)
@@ -161,6 +286,8 @@ class IntParameter(ParameterBase):
         else:
             suffix = self.value_suffix_plural
         return '{} {}'.format(value, suffix)
+    def build_event_decoder(self):
+        return decode_int_event
     async def parse_response(self, r):
         parsed = await super(IntParameter, self).parse_response(r)
         return int(parsed['value'])
@@ -0,0 +1,151 @@
+import asyncio
+import random
+
+
+class ScheduledTask(object):
+    def __init__(self, callback, interval, **kwargs):
+        self.callback = callback
+        self.interval = interval
+        self.name = kwargs.get('name')
+        self.priority = kwargs.get('priority', 0)
+        # Fraction of the interval to randomize each run by
+        self.jitter = kwargs.get('jitter', .1)
+        self.scheduler = None
+        self.next_run = None
+        self.fut = None
+        self.num_runs = 0
+        self.num_errors = 0
+        self.last_error = None
+    @property
+    def running(self):
+        return self.fut is not None
+    def get_next_delay(self, interval=None):
+        if interval is None:
+            interval = self.interval
+        jitter = self.jitter
+        if jitter:
+            interval *= 1 + random.uniform(-jitter, jitter)
+        return interval
+    def set_interval(self, interval, run_now=False):
+        self.interval = interval
+        if self.scheduler is not None:
+            self.scheduler.reschedule(self, run_now=run_now)
+    def trigger(self):
+        if self.scheduler is not None:
+            self.scheduler.reschedule(self, run_now=True)
+    def __repr__(self):
+        return '<{self.__class__.__name__}: {self}>'.format(self=self)
+    def __str__(self):
+        return '{self.name} (interval={self.interval})'.format(self=self)
+
+class PollScheduler(object):
+    def __init__(self, **kwargs):
+        self.loop = kwargs.get('loop')
+        if self.loop is None:
+            self.loop = asyncio.get_event_loop()
+        # Limit on the number of callbacks running at once across all tasks
+        self.max_concurrent = kwargs.get('max_concurrent', 16)
+        self.tasks = set()
+        self.num_running = 0
+        self._wakeup = asyncio.Event()
+        self._run_fut = None
+    def add_task(self, callback, interval, **kwargs):
+        task = ScheduledTask(callback, interval, **kwargs)
+        task.scheduler = self
+        # Start at a random phase within the interval so tasks added at
+        # the same time (many devices connecting) don't poll in lockstep
+        if kwargs.get('run_now'):
+            delay = 0
+        else:
+            delay = random.uniform(0, interval)
+        task.next_run = self.loop.time() + delay
+        self.tasks.add(task)
+        self._wakeup.set()
+        if self._run_fut is None or self._run_fut.done():
+            self._run_fut = asyncio.ensure_future(self._run(), loop=self.loop)
+        return task
+    async def remove_task(self, task):
+        self.tasks.discard(task)
+        task.scheduler = None
+        self._wakeup.set()
+        fut = task.fut
+        if fut is not None:
+            await asyncio.wait([fut])
+    def reschedule(self, task, run_now=False):
+        if task not in self.tasks:
+            return
+        now = self.loop.time()
+        if run_now:
+            task.next_run = now
+        elif not task.running:
+            next_run = now + task.get_next_delay()
+            if next_run < task.next_run:
+                task.next_run = next_run
+        self._wakeup.set()
+    def _start_task(self, task):
+        self.num_running += 1
+        task.next_run = None
+        task.fut = asyncio.ensure_future(self._run_task(task), loop=self.loop)
+    async def _run_task(self, task):
+        try:
+            await task.callback()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            task.num_errors += 1
+            task.last_error = exc
+        finally:
+            task.num_runs += 1
+            task.fut = None
+            self.num_running -= 1
+            if task.next_run is None:
+                task.next_run = self.loop.time() + task.get_next_delay()
+            self._wakeup.set()
+    async def _run(self):
+        loop = self.loop
+        while len(self.tasks):
+            self._wakeup.clear()
+            now = loop.time()
+            due = []
+            next_run = None
+            for task in self.tasks:
+                if task.running:
+                    continue
+                if task.next_run <= now:
+                    due.append(task)
+                elif next_run is None or task.next_run < next_run:
+                    next_run = task.next_run
+            if len(due):
+                due.sort(key=lambda t: (-t.priority, t.next_run))
+                for task in due:
+                    if self.num_running >= self.max_concurrent:
+                        break
+                    self._start_task(task)
+                if self.num_running < self.max_concurrent:
+                    continue
+                # All slots are busy, wait for one to finish
+                next_run = None
+            timeout = None
+            if next_run is not None:
+                timeout = max(0, next_run - now)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+    def __repr__(self):
+        return '<{self.__class__.__name__}: {self}>'.format(self=self)
+    def __str__(self):
+        return 'tasks={}, running={}'.format(len(self.tasks), self.num_running)
+
+_schedulers = {}
+
+def get_scheduler(loop=None):
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    for _loop in list(_schedulers.keys()):
+        if _loop.is_closed():
+            del _schedulers[_loop]
+    scheduler = _schedulers.get(loop)
+    if scheduler is None:
+        scheduler = _schedulers[loop] = PollScheduler(loop=loop)
+    return scheduler
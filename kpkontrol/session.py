@@ -0,0 +1,187 @@
+import asyncio
+
+import aiohttp
+
+
+class ConnectionStats(object):
+    def __init__(self):
+        self.requests = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.dns_cache_hits = 0
+        self.dns_cache_misses = 0
+        self.by_host = {}
+    @property
+    def reuse_ratio(self):
+        total = self.connections_created + self.connections_reused
+        if not total:
+            return 0.
+        return self.connections_reused / total
+    def _host_stats(self, host):
+        d = self.by_host.get(host)
+        if d is None:
+            d = self.by_host[host] = {'requests':0, 'created':0, 'reused':0}
+        return d
+    def build_trace_config(self):
+        async def on_request_start(session, ctx, params):
+            ctx.host = '{}:{}'.format(params.url.host, params.url.port)
+            self.requests += 1
+            self._host_stats(ctx.host)['requests'] += 1
+        async def on_connection_create_end(session, ctx, params):
+            self.connections_created += 1
+            self._host_stats(ctx.host)['created'] += 1
+        async def on_connection_reuseconn(session, ctx, params):
+            self.connections_reused += 1
+            self._host_stats(ctx.host)['reused'] += 1
+        async def on_dns_cache_hit(session, ctx, params):
+            self.dns_cache_hits += 1
+        async def on_dns_cache_miss(session, ctx, params):
+            self.dns_cache_misses += 1
+        tc = aiohttp.TraceConfig()
+        tc.on_request_start.append(on_request_start)
+        tc.on_connection_create_end.append(on_connection_create_end)
+        tc.on_connection_reuseconn.append(on_connection_reuseconn)
+        tc.on_dns_cache_hit.append(on_dns_cache_hit)
+        tc.on_dns_cache_miss.append(on_dns_cache_miss)
+        return tc
+    def as_dict(self):
+        keys = [
+            'requests', 'connections_created', 'connections_reused',
+            'dns_cache_hits', 'dns_cache_misses', 'reuse_ratio',
+        ]
+        d = {k:getattr(self, k) for k in keys}
+        d['by_host'] = {k:v.copy() for k, v in self.by_host.items()}
+        return d
+    def __repr__(self):
+        return '<{self.__class__.__name__}: {self}>'.format(self=self)
+    def __str__(self):
+        return 'requests={self.requests}, created={self.connections_created}, reused={self.connections_reused}'.format(self=self)
+
+class PoolEntry(object):
+    def __init__(self, pool, loop):
+        self.pool = pool
+        self.loop = loop
+        self.refcount = 0
+        self.last_used = loop.time()
+        self._evict_handle = None
+        self.stats = ConnectionStats()
+        self.session = self._build_session()
+    def _build_session(self):
+        pool = self.pool
+        connector = aiohttp.TCPConnector(
+            limit=pool.limit,
+            limit_per_host=pool.limit_per_host,
+            keepalive_timeout=pool.keepalive_timeout,
+            use_dns_cache=True,
+            ttl_dns_cache=pool.ttl_dns_cache,
+            loop=self.loop,
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            loop=self.loop,
+            trace_configs=[self.stats.build_trace_config()],
+        )
+    @property
+    def closed(self):
+        return self.session.closed or self.loop.is_closed()
+    def acquire(self):
+        self.cancel_eviction()
+        self.refcount += 1
+        self.last_used = self.loop.time()
+        return self.session
+    def release(self):
+        if self.refcount > 0:
+            self.refcount -= 1
+        self.last_used = self.loop.time()
+        if self.refcount == 0:
+            self.schedule_eviction()
+    def schedule_eviction(self, timeout=None):
+        self.cancel_eviction()
+        if timeout is None:
+            timeout = self.pool.idle_timeout
+        if timeout is None:
+            return
+        self._evict_handle = self.loop.call_later(timeout, self._on_idle_timeout)
+    def cancel_eviction(self):
+        h = self._evict_handle
+        if h is not None:
+            h.cancel()
+            self._evict_handle = None
+    def _on_idle_timeout(self):
+        self._evict_handle = None
+        if self.refcount > 0:
+            return
+        remaining = self.last_used + self.pool.idle_timeout - self.loop.time()
+        if remaining > 0:
+            self.schedule_eviction(remaining)
+            return
+        self.pool._evict(self)
+    async def close(self):
+        self.cancel_eviction()
+        if not self.session.closed:
+            await self.session.close()
+
+class SessionPool(object):
+    def __init__(self, **kwargs):
+        self.limit = kwargs.get('limit', 100)
+        self.limit_per_host = kwargs.get('limit_per_host', 4)
+        self.keepalive_timeout = kwargs.get('keepalive_timeout', 30.)
+        self.ttl_dns_cache = kwargs.get('ttl_dns_cache', 300)
+        self.idle_timeout = kwargs.get('idle_timeout', 60.)
+        self.entries = {}
+    def _get_entry(self, loop=None, create=True):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self._prune()
+        entry = self.entries.get(loop)
+        if entry is not None and entry.closed:
+            entry.cancel_eviction()
+            del self.entries[loop]
+            entry = None
+        if entry is None and create:
+            entry = self.entries[loop] = PoolEntry(self, loop)
+        return entry
+    def _prune(self):
+        for loop in list(self.entries.keys()):
+            if loop.is_closed():
+                del self.entries[loop]
+    def _entry_for_session(self, session):
+        for entry in self.entries.values():
+            if entry.session is session:
+                return entry
+        return None
+    def _evict(self, entry):
+        if self.entries.get(entry.loop) is entry:
+            del self.entries[entry.loop]
+        if not entry.loop.is_closed():
+            asyncio.ensure_future(entry.close(), loop=entry.loop)
+    def owns(self, session):
+        return self._entry_for_session(session) is not None
+    def get_session(self, loop=None):
+        entry = self._get_entry(loop)
+        entry.last_used = entry.loop.time()
+        if entry.refcount == 0 and entry._evict_handle is None:
+            entry.schedule_eviction()
+        return entry.session
+    def acquire(self, loop=None):
+        entry = self._get_entry(loop)
+        return entry.acquire()
+    def release(self, session):
+        entry = self._entry_for_session(session)
+        if entry is None:
+            return False
+        entry.release()
+        return True
+    def stats(self, loop=None):
+        entry = self._get_entry(loop, create=False)
+        if entry is None:
+            return None
+        return entry.stats
+    async def close(self, loop=None):
+        entry = self._get_entry(loop, create=False)
+        if entry is None:
+            return
+        del self.entries[entry.loop]
+        await entry.close()
+
+session_pool = SessionPool()
@@ -0,0 +1,551 @@
+import asyncio
+import itertools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from pydispatch import Property, DictProperty
+
+from kpkontrol.base import ObjectBase
+from kpkontrol.fleet import KpFleet
+
+
+class RemoteError(Exception):
+    def __init__(self, type_name, msg):
+        self.type_name = type_name
+        self.msg = msg
+        super(RemoteError, self).__init__(type_name, msg)
+    @classmethod
+    def from_exception(cls, exc):
+        return cls(exc.__class__.__name__, str(exc))
+    def __str__(self):
+        return '{}: {}'.format(self.type_name, self.msg)
+
+def encode_value(value):
+    # Values sent between processes are reduced to plain types. Enum items
+    # are sent by name and addresses as strings.
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [encode_value(v) for v in value]
+    if isinstance(value, dict):
+        return {k:encode_value(v) for k, v in value.items()}
+    if isinstance(value, Exception):
+        return RemoteError.from_exception(value)
+    return str(value)
+
+class PipeChannel(object):
+    # Sends and receives on a multiprocessing Connection from threads so the
+    # event loop never blocks on a full pipe or a partly received message.
+    # Messages go out in order from a single sender thread, and received
+    # messages are passed to on_message on the loop in the order they arrive.
+    def __init__(self, conn, loop, on_message, on_closed):
+        self.conn = conn
+        self.loop = loop
+        self.on_message = on_message
+        self.on_closed = on_closed
+        self.closed = False
+        self._sender = ThreadPoolExecutor(max_workers=1)
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+    def start(self):
+        self._reader.start()
+    def send(self, msg):
+        if self.closed:
+            return
+        fut = self.loop.run_in_executor(self._sender, self.conn.send, msg)
+        fut.add_done_callback(self._on_send_done)
+    def _on_send_done(self, fut):
+        if not fut.cancelled() and fut.exception() is not None:
+            self._set_closed()
+    def _read_loop(self):
+        while True:
+            try:
+                msg = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            if not self._call_soon(self.on_message, msg):
+                return
+        self._call_soon(self._set_closed)
+    def _call_soon(self, cb, *args):
+        try:
+            self.loop.call_soon_threadsafe(cb, *args)
+        except RuntimeError:
+            # The loop has been closed
+            return False
+        return True
+    def _set_closed(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.on_closed()
+    async def drain(self):
+        # Wait for everything queued by send() to be written
+        await self.loop.run_in_executor(self._sender, _noop)
+    async def close(self):
+        await self.drain()
+        self._sender.shutdown(wait=False)
+        self.conn.close()
+
+def _noop():
+    pass
+
+def encode_clip(clip):
+    return {attr:encode_value(getattr(clip, attr)) for attr in clip.attribute_names_}
+
+# Message types
+# coordinator -> worker
+MSG_CALL = 'c'
+MSG_ADD_DEVICE = 'a'
+MSG_REMOVE_DEVICE = 'r'
+MSG_STOP = 's'
+# worker -> coordinator
+MSG_READY = 'R'
+MSG_RESULT = 'X'
+MSG_STATE = 'S'
+MSG_DEVICE = 'D'
+MSG_STOPPED = 'T'
+
+class ShardWorker(object):
+    def __init__(self, conn, host_addresses, **kwargs):
+        self.conn = conn
+        self.host_addresses = host_addresses
+        # Changes are coalesced and sent at most once per flush_interval
+        self.flush_interval = kwargs.pop('flush_interval', .01)
+        # Maximum rate (Hz) of timecode updates sent for each device
+        self.timecode_rate = kwargs.pop('timecode_rate', 30)
+        self.fleet_kwargs = kwargs
+        self.fleet = None
+        self.loop = None
+        self.param_deltas = {}
+        self.timecodes = {}
+        self.transport_states = {}
+        # (host_address, event, payload) for device events, in order
+        self.device_events = []
+        self._device_handlers = {}
+        self._flush_handle = None
+        self._stopped = None
+        self.channel = None
+    async def run(self):
+        self.loop = asyncio.get_event_loop()
+        self._stopped = asyncio.Event()
+        self.channel = PipeChannel(self.conn, self.loop, self.handle_message, self._stopped.set)
+        self.fleet = KpFleet(loop=self.loop, **self.fleet_kwargs)
+        self.fleet.bind(
+            on_device_added=self.on_device_added,
+            on_device_removed=self.on_device_removed,
+            on_device_connected=self.on_device_connected,
+            on_device_error=self.on_device_error,
+            on_parameter_value=self.on_parameter_value,
+            on_transport_state=self.on_transport_state,
+            on_events_received=self.on_events_received,
+            on_clip_added=self.on_clip_added,
+            on_clip_changed=self.on_clip_changed,
+            on_clip_removed=self.on_clip_removed,
+        )
+        for host_address in self.host_addresses:
+            self.fleet.add_device(host_address)
+        # The coordinator going away closes the channel and stops the worker
+        self.channel.start()
+        await self.fleet.connect()
+        self.flush()
+        self.send((MSG_READY,))
+        await self._stopped.wait()
+        await self.fleet.stop()
+        self.flush()
+        self.send((MSG_STOPPED,))
+        await self.channel.drain()
+    def send(self, msg):
+        self.channel.send(msg)
+    def handle_message(self, msg):
+        msg_type = msg[0]
+        if msg_type == MSG_CALL:
+            asyncio.ensure_future(self.do_call(*msg[1:]), loop=self.loop)
+        elif msg_type == MSG_ADD_DEVICE:
+            self.fleet.add_device(msg[1], **msg[2])
+        elif msg_type == MSG_REMOVE_DEVICE:
+            asyncio.ensure_future(self.do_remove_device(*msg[1:]), loop=self.loop)
+        elif msg_type == MSG_STOP:
+            self._stopped.set()
+    async def do_call(self, req_id, method, args, host_addresses):
+        devices = self.fleet.devices
+        devices = [devices[h] for h in host_addresses if h in devices]
+        try:
+            results = await getattr(self.fleet, method)(*args, devices=devices)
+            results = {h:encode_value(r) for h, r in results.items()}
+        except Exception as exc:
+            results = RemoteError.from_exception(exc)
+        # Send pending state first so it is current when the result arrives
+        self.flush()
+        self.send((MSG_RESULT, req_id, results))
+    async def do_remove_device(self, req_id, host_address):
+        if host_address in self.fleet.devices:
+            await self.fleet.remove_device(host_address)
+        self.send((MSG_RESULT, req_id, None))
+    def schedule_flush(self):
+        if self._flush_handle is None:
+            self._flush_handle = self.loop.call_later(self.flush_interval, self.flush)
+    def flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not any([self.param_deltas, self.timecodes, self.transport_states, self.device_events]):
+            return
+        params = [(h, pid, v) for (h, pid), v in self.param_deltas.items()]
+        msg = (
+            MSG_STATE, params, list(self.timecodes.items()),
+            list(self.transport_states.items()), self.device_events,
+        )
+        self.param_deltas.clear()
+        self.timecodes.clear()
+        self.transport_states.clear()
+        self.device_events = []
+        self.send(msg)
+    def on_device_added(self, fleet, device, **kwargs):
+        host_address = device.host_address
+        def on_timecode_str(instance, value, **kwargs):
+            self.timecodes[host_address] = value
+            self.schedule_flush()
+        view = device.transport.add_timecode_view(max_rate=self.timecode_rate)
+        view.bind(timecode_str=on_timecode_str)
+        self._device_handlers[host_address] = (view, on_timecode_str)
+    def on_device_removed(self, fleet, device, **kwargs):
+        handlers = self._device_handlers.pop(device.host_address, None)
+        if handlers is not None:
+            view, handler = handlers
+            view.unbind(handler)
+            view.close()
+        self.flush()
+        self.send((MSG_DEVICE, device.host_address, 'removed', None))
+    def on_device_connected(self, fleet, device, **kwargs):
+        self.flush()
+        self.send((MSG_DEVICE, device.host_address, 'connected', None))
+    def on_device_error(self, fleet, device, exc, **kwargs):
+        self.send((MSG_DEVICE, device.host_address, 'error', encode_value(exc)))
+    def on_parameter_value(self, device, param, value, **kwargs):
+        self.param_deltas[(device.host_address, param.id)] = encode_value(value)
+        self.schedule_flush()
+    def on_transport_state(self, device, value, **kwargs):
+        self.transport_states[device.host_address] = value
+        self.schedule_flush()
+    def on_events_received(self, device, events, **kwargs):
+        if not device.apply_values:
+            events = {pid:data['value'] for pid, data in events.items()}
+        self.add_device_event(device, 'on_events_received', encode_value(events))
+    def on_clip_added(self, device, clip, **kwargs):
+        self.add_device_event(device, 'on_clip_added', encode_clip(clip))
+    def on_clip_changed(self, device, clip, **kwargs):
+        self.add_device_event(device, 'on_clip_changed', encode_clip(clip))
+    def on_clip_removed(self, device, clip, **kwargs):
+        self.add_device_event(device, 'on_clip_removed', encode_clip(clip))
+    def add_device_event(self, device, event, payload):
+        self.device_events.append((device.host_address, event, payload))
+        self.schedule_flush()
+
+def _shard_main(conn, host_addresses, kwargs):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    worker = ShardWorker(conn, host_addresses, **kwargs)
+    try:
+        loop.run_until_complete(worker.run())
+    finally:
+        loop.close()
+        conn.close()
+
+class ParameterProxy(ObjectBase):
+    value = Property()
+    __attribute_names = ['id', 'device', 'value']
+    def __repr__(self):
+        return '<{self.__class__.__name__} {self.id}: {self.value}>'.format(self=self)
+
+class ClipProxy(ObjectBase):
+    # Clip attributes as sent by encode_clip (timecodes, formats and
+    # timestamps as strings)
+    __attribute_names = [
+        'name', 'device', 'duration_tc', 'duration_timedelta', 'total_frames',
+        'timestamp', 'format', 'audio_channels', 'start_timecode',
+    ]
+    def __repr__(self):
+        return '<{self.__class__.__name__}: {self}>'.format(self=self)
+    def __str__(self):
+        return self.name
+
+class DeviceProxy(ObjectBase):
+    connected = Property(False)
+    transport_str = Property('')
+    timecode_str = Property('00:00:00:00')
+    __attribute_names = ['host_address', 'shard']
+    def __init__(self, **kwargs):
+        super(DeviceProxy, self).__init__(**kwargs)
+        self.all_parameters = {}
+        self.clips = {}
+    def get_parameter_proxy(self, param_id):
+        p = self.all_parameters.get(param_id)
+        if p is None:
+            p = self.all_parameters[param_id] = ParameterProxy(id=param_id, device=self)
+        return p
+    def update_clip(self, data):
+        clip = self.clips.get(data['name'])
+        if clip is None:
+            clip = self.clips[data['name']] = ClipProxy(device=self, **data)
+        else:
+            for key, val in data.items():
+                setattr(clip, key, val)
+        return clip
+    def remove_clip(self, data):
+        clip = self.clips.pop(data['name'], None)
+        if clip is None:
+            clip = ClipProxy(device=self, **data)
+        return clip
+    def __repr__(self):
+        return '<{self.__class__.__name__}: {self}>'.format(self=self)
+    def __str__(self):
+        return '{self.host_address} (shard {self.shard.index})'.format(self=self)
+
+class Shard(object):
+    def __init__(self, fleet, index):
+        self.fleet = fleet
+        self.index = index
+        self.host_addresses = set()
+        self.process = None
+        self.conn = None
+        self.channel = None
+        self.ready = None
+        self.stopped = None
+        self.pending = {}
+    @property
+    def running(self):
+        return self.process is not None and self.process.is_alive()
+    def start(self, mp_context, fleet_kwargs):
+        loop = self.fleet.loop
+        self.ready = loop.create_future()
+        self.stopped = loop.create_future()
+        self.conn, child_conn = mp_context.Pipe()
+        self.process = mp_context.Process(
+            target=_shard_main,
+            args=(child_conn, sorted(self.host_addresses), fleet_kwargs),
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.channel = PipeChannel(self.conn, loop, self._on_message, self._on_closed)
+        self.channel.start()
+    def send(self, msg):
+        self.channel.send(msg)
+    def _on_message(self, msg):
+        self.fleet._handle_shard_message(self, msg)
+    def _on_closed(self):
+        exc = RemoteError('ShardClosed', 'shard {} exited'.format(self.index))
+        for fut in itertools.chain([self.ready, self.stopped], self.pending.values()):
+            if not fut.done():
+                fut.set_exception(exc)
+        self.pending.clear()
+    async def close(self):
+        loop = self.fleet.loop
+        if self.process is None:
+            return
+        try:
+            if self.running:
+                self.send((MSG_STOP,))
+            await self.stopped
+        except (RemoteError, OSError):
+            pass
+        await loop.run_in_executor(None, self.process.join)
+        await self.channel.close()
+        self.process = None
+    def __repr__(self):
+        return '<{self.__class__.__name__}: {self.index}>'.format(self=self)
+
+class ShardedFleet(ObjectBase):
+    connected = Property(False)
+    devices = DictProperty()
+    _events_ = [
+        'on_device_added', 'on_device_removed',
+        'on_device_connected', 'on_device_error',
+        'on_parameter_value', 'on_transport_state', 'on_timecode',
+        'on_events_received', 'on_clip_added', 'on_clip_changed', 'on_clip_removed',
+    ]
+    def __init__(self, **kwargs):
+        super(ShardedFleet, self).__init__(**kwargs)
+        self.loop = kwargs.get('loop')
+        if self.loop is None:
+            self.loop = asyncio.get_event_loop()
+        num_shards = kwargs.get('num_shards')
+        if num_shards is None:
+            num_shards = os.cpu_count() or 1
+        self.mp_context = multiprocessing.get_context(kwargs.get('start_method', 'spawn'))
+        # Passed to the KpFleet in each worker
+        self.fleet_kwargs = kwargs.get('fleet_kwargs', {}).copy()
+        for key in ['flush_interval', 'timecode_rate']:
+            if key in kwargs:
+                self.fleet_kwargs[key] = kwargs[key]
+        self.shards = [Shard(self, i) for i in range(num_shards)]
+        self.connect_errors = {}
+        self._req_ids = itertools.count()
+        for host_address in kwargs.get('host_addresses', []):
+            self.add_device(host_address)
+    @classmethod
+    async def create(cls, **kwargs):
+        obj = cls(**kwargs)
+        await obj.connect()
+        return obj
+    @property
+    def connected_devices(self):
+        return [d for d in self.devices.values() if d.connected]
+    def _get_shard_for_new_device(self):
+        return min(self.shards, key=lambda s: (len(s.host_addresses), s.index))
+    def add_device(self, host_address, **kwargs):
+        if host_address in self.devices:
+            return self.devices[host_address]
+        shard = self._get_shard_for_new_device()
+        device = DeviceProxy(host_address=host_address, shard=shard)
+        shard.host_addresses.add(host_address)
+        self.devices[host_address] = device
+        self.emit('on_device_added', self, device)
+        if shard.running:
+            shard.send((MSG_ADD_DEVICE, host_address, kwargs))
+        return device
+    async def remove_device(self, device):
+        if not isinstance(device, DeviceProxy):
+            device = self.devices[device]
+        if self.devices.get(device.host_address) is not device:
+            return
+        del self.devices[device.host_address]
+        self.connect_errors.pop(device.host_address, None)
+        device.shard.host_addresses.discard(device.host_address)
+        shard = device.shard
+        if shard.running:
+            req_id = next(self._req_ids)
+            fut = shard.pending[req_id] = self.loop.create_future()
+            shard.send((MSG_REMOVE_DEVICE, req_id, device.host_address))
+            await fut
+        device.connected = False
+        self.emit('on_device_removed', self, device)
+    async def connect(self):
+        if self.connected:
+            return
+        self.connected = True
+        for shard in self.shards:
+            shard.start(self.mp_context, self.fleet_kwargs)
+        await asyncio.gather(*[shard.ready for shard in self.shards])
+    async def stop(self):
+        self.connected = False
+        await asyncio.gather(*[shard.close() for shard in self.shards])
+        for device in self.devices.values():
+            device.connected = False
+    def _handle_shard_message(self, shard, msg):
+        msg_type = msg[0]
+        if msg_type == MSG_STATE:
+            self._apply_state(*msg[1:])
+        elif msg_type == MSG_RESULT:
+            req_id, results = msg[1:]
+            fut = shard.pending.pop(req_id, None)
+            if fut is None or fut.done():
+                return
+            if isinstance(results, Exception):
+                fut.set_exception(results)
+            else:
+                fut.set_result(results)
+        elif msg_type == MSG_DEVICE:
+            self._on_device_message(*msg[1:])
+        elif msg_type == MSG_READY:
+            if not shard.ready.done():
+                shard.ready.set_result(True)
+        elif msg_type == MSG_STOPPED:
+            if not shard.stopped.done():
+                shard.stopped.set_result(True)
+    def _apply_state(self, params, timecodes, transport_states, device_events):
+        devices = self.devices
+        for host_address, param_id, value in params:
+            device = devices.get(host_address)
+            if device is None:
+                continue
+            param = device.get_parameter_proxy(param_id)
+            param.value = value
+            self.emit('on_parameter_value', device, param, value)
+        for host_address, value in transport_states:
+            device = devices.get(host_address)
+            if device is None:
+                continue
+            device.transport_str = value
+            self.emit('on_transport_state', device, value)
+        for host_address, value in timecodes:
+            device = devices.get(host_address)
+            if device is None:
+                continue
+            device.timecode_str = value
+            self.emit('on_timecode', device, value)
+        for host_address, event, payload in device_events:
+            device = devices.get(host_address)
+            if device is None:
+                continue
+            if event == 'on_events_received':
+                # Same payload shape as KpDevice, with ParameterProxy objects
+                events = {}
+                for param_id, value in payload.items():
+                    param = device.get_parameter_proxy(param_id)
+                    events[param_id] = {'parameter':param, 'value':value}
+                self.emit(event, device, events)
+            elif event == 'on_clip_removed':
+                self.emit(event, device, device.remove_clip(payload))
+            else:
+                self.emit(event, device, device.update_clip(payload))
+    def _on_device_message(self, host_address, status, exc):
+        device = self.devices.get(host_address)
+        if device is None:
+            return
+        if status == 'connected':
+            self.connect_errors.pop(host_address, None)
+            device.connected = True
+            self.emit('on_device_connected', self, device)
+        elif status == 'error':
+            self.connect_errors[host_address] = exc
+            self.emit('on_device_error', self, device, exc)
+        elif status == 'removed':
+            device.connected = False
+    async def _call_shard(self, shard, method, args, host_addresses):
+        req_id = next(self._req_ids)
+        fut = shard.pending[req_id] = self.loop.create_future()
+        shard.send((MSG_CALL, req_id, method, args, host_addresses))
+        return await fut
+    async def _call(self, method, args, devices=None):
+        if devices is None:
+            devices = self.connected_devices
+        by_shard = {}
+        for device in devices:
+            if not isinstance(device, DeviceProxy):
+                device = self.devices[device]
+            by_shard.setdefault(device.shard, []).append(device.host_address)
+        coros = [self._call_shard(shard, method, args, addrs) for shard, addrs in by_shard.items()]
+        results = {}
+        for shard_results in await asyncio.gather(*coros):
+            results.update(shard_results)
+        return results
+    async def get_parameter(self, parameter, devices=None):
+        return await self._call('get_parameter', (_param_id(parameter),), devices)
+    async def set_parameter(self, parameter, value, devices=None):
+        return await self._call('set_parameter', (_param_id(parameter), encode_value(value)), devices)
+    async def transport_command(self, command, *args, **kwargs):
+        args = tuple(encode_value(getattr(a, 'name', a)) for a in args)
+        return await self._call('transport_command', (command,) + args, kwargs.get('devices'))
+    async def play(self, devices=None):
+        return await self.transport_command('play', devices=devices)
+    async def record(self, devices=None):
+        return await self.transport_command('record', devices=devices)
+    async def pause(self, devices=None):
+        return await self.transport_command('pause', devices=devices)
+    async def stop_transport(self, devices=None):
+        return await self.transport_command('stop', devices=devices)
+    async def go_to_clip(self, clip, devices=None):
+        return await self.transport_command('go_to_clip', clip, devices=devices)
+    def __repr__(self):
+        return '<{self.__class__.__name__}: {self}>'.format(self=self)
+    def __str__(self):
+        return '{} devices ({} connected), {} shards'.format(
+            len(self.devices), len(self.connected_devices), len(self.shards),
+        )
+
+def _param_id(parameter):
+    if isinstance(parameter, str):
+        return parameter
+    return parameter.id
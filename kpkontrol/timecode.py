@@ -1,10 +1,12 @@
 import asyncio
 import datetime
 import numbers
+import operator
 
 from pydispatch import Property
 from pyltc.frames import FrameRate as _FrameRate
-from pyltc.frames import FrameFormat, Frame
+from pyltc.frames import FrameFormat as _FrameFormat
+from pyltc.frames import Frame
 from kpkontrol.base import ObjectBase
 
 class FrameRate(_FrameRate):
@@ -20,11 +22,71 @@ class FrameRate(_FrameRate):
         119.88:(120000, 1001),
         120:(120, 1),
     }
+    # pyltc's FrameRate.__new__ returns the instance stored in cls._registry
+    # for the rate. Defining the dict here keeps these separate from pyltc's
+    # own FrameRate instances.
+    _registry = {}
+    def __init__(self, numerator, denom=1):
+        # __init__ still runs each time __new__ returns an existing instance
+        if self.__dict__.get('_initialized'):
+            return
+        super(FrameRate, self).__init__(numerator, denom)
+        self._initialized = True
     @classmethod
     def from_float(cls, value):
         if not isinstance(value, numbers.Number):
             value = float(value)
         return super(FrameRate, cls).from_float(value)
+    def __getnewargs__(self):
+        return (self.numerator, self.denom)
+    def __hash__(self):
+        return hash(self.value)
+
+class FrameFormat(_FrameFormat):
+    # Instances are interned by rate and drop_frame and can't be modified
+    _registry = {}
+    def __new__(cls, **kwargs):
+        rate = kwargs.get('rate')
+        if not isinstance(rate, FrameRate):
+            if isinstance(rate, _FrameRate):
+                rate = FrameRate(rate.numerator, rate.denom)
+            else:
+                rate = FrameRate.from_float(rate)
+        drop_frame = bool(kwargs.get('drop_frame'))
+        key = (rate.value, drop_frame)
+        obj = cls._registry.get(key)
+        if obj is None:
+            obj = super(FrameFormat, cls).__new__(cls)
+            _FrameFormat.__init__(obj, rate=rate, drop_frame=drop_frame)
+            obj._frozen = True
+            cls._registry[key] = obj
+        return obj
+    def __init__(self, **kwargs):
+        # Initialized once in __new__
+        pass
+    def __setattr__(self, name, value):
+        if self.__dict__.get('_frozen'):
+            raise AttributeError('{!r} is immutable'.format(self))
+        super(FrameFormat, self).__setattr__(name, value)
+    def __getnewargs_ex__(self):
+        return ((), {'rate':self.rate, 'drop_frame':self.drop_frame})
+    def __hash__(self):
+        return hash((self.rate.value, self.drop_frame))
+
+def _parse_tc_string(tc_str, frame_rate, drop_frame=False):
+    if ';' in tc_str:
+        drop_frame = True
+        tc_str = ':'.join(tc_str.split(';'))
+    keys = ['hours', 'minutes', 'seconds', 'frames']
+    kwargs = {k:int(v) for k, v in zip(keys, tc_str.split(':'))}
+    kwargs['frame_format'] = FrameFormat(rate=frame_rate, drop_frame=drop_frame)
+    return kwargs
+
+def _calc_total_seconds(frame):
+    s = int((frame.total_frames-frame.value) / frame.frame_format.rate)
+    micro_s = frame.frame_times[frame.value]
+    s += float(micro_s)
+    return s
 
 class Timecode(Frame, ObjectBase):
     total_frames = Property(0)
@@ -33,22 +95,13 @@ class Timecode(Frame, ObjectBase):
         return ObjectBase.__new__(cls)
     @classmethod
     def parse(cls, tc_str, frame_rate, drop_frame=False):
-        if ';' in tc_str:
-            drop_frame = True
-            tc_str = ':'.join(tc_str.split(';'))
-        keys = ['hours', 'minutes', 'seconds', 'frames']
-        kwargs = {k:int(v) for k, v in zip(keys, tc_str.split(':'))}
-        kwargs['frame_format'] = FrameFormat(rate=frame_rate, drop_frame=drop_frame)
-        return cls(**kwargs)
+        return cls(**_parse_tc_string(tc_str, frame_rate, drop_frame))
     @classmethod
     def from_frames(cls, total_frames, frame_format):
         return cls(frame_format=frame_format, total_frames=total_frames)
     @property
     def total_seconds(self):
-        s = int((self.total_frames-self.value) / self.frame_format.rate)
-        micro_s = self.frame_times[self.value]
-        s += float(micro_s)
-        return s
+        return _calc_total_seconds(self)
     @property
     def timedelta(self):
         return datetime.timedelta(seconds=self.total_seconds)
@@ -92,46 +145,37 @@ class Timecode(Frame, ObjectBase):
         self.freerun_lock = asyncio.Lock()
         self.freerun_nframes = 0
         self.freerun_start_ts = self.freerun_tick_ts = loop.time()
-        self.freerun_fut = asyncio.ensure_future(self.freerun())
-    async def freerun(self):
-        loop = self.loop
-        fr = self.frame_format.rate
-        timeout = 1. / fr
         self._freerunning.set()
-        while self._freerunning.is_set():
-            async with self.freerun_lock:
-                self.incr()
-                self.freerun_nframes += 1
-                now = self.freerun_tick_ts = loop.time()
-                frame_time = (self.freerun_nframes-1) / fr
-                elapsed = now - self.freerun_start_ts
-                offset = elapsed - frame_time
-                self.freerun_offset = offset * fr
-            next_timeout = timeout - offset
-            if next_timeout < 0:
-                next_timeout = 0
-            await asyncio.sleep(next_timeout)
-        self._freerun_stopped.set()
+        self.frame_clock = get_frame_clock(loop)
+        self.frame_clock.add_timecode(self)
+    def _freerun_tick(self, group, index, now):
+        # Called by the FrameClockGroup with the index of the current frame
+        # on its timeline. Any frames missed since the last tick are applied
+        # as a single jump.
+        nframes = index - self.freerun_start_index + 1
+        num_frames = nframes - self.freerun_nframes
+        self.freerun_tick_ts = now
+        self.freerun_offset = (now - group.get_frame_ts(index)) * group.fps
+        if num_frames <= 0:
+            return
+        self.freerun_nframes = nframes
+        if num_frames == 1:
+            self.incr()
+        else:
+            self.set_total_frames(self.total_frames + num_frames)
     async def set_async(self, **kwargs):
         if hasattr(self, 'freerun_lock'):
+            # The frame count since the last reset is tracked separately
+            # from total_frames, so a jump doesn't affect the freerun timing
             async with self.freerun_lock:
-                prev_frames = self.total_frames
                 self.set(**kwargs)
-                if prev_frames < self.total_frames:
-                    diff = prev_frames - self.total_frames
-                    self.freerun_nframes += diff
-                    self.freerun_start_ts -= float(diff / self.frame_format.rate)
-                elif prev_frames > self.total_frames:
-                    diff = self.total_frames - prev_frames
-                    self.freerun_nframes -= diff
-                    self.freerun_start_ts += float(diff / self.frame_format.rate)
         else:
             self.set(**kwargs)
     async def set_from_string_async(self, tc_str):
         if hasattr(self, 'freerun_lock'):
             async with self.freerun_lock:
-                self.freerun_start_ts = self.loop.time()
-                self.freerun_nframes = 0
+                if self._freerunning is not None:
+                    self.frame_clock.reset_timecode(self)
                 self.set_from_string(tc_str)
         else:
             self.set_from_string(tc_str)
@@ -141,8 +185,195 @@ class Timecode(Frame, ObjectBase):
         if freerunning is None:
             return
         freerunning.clear()
+        self.frame_clock.remove_timecode(self)
         if stop_event is not None:
-            await stop_event.wait()
-        await self.freerun_fut
+            stop_event.set()
         self._freerunning = None
         self._freerun_stopped = None
+
+
+# Immutable timecode for stored values (such as clip metadata) that are never
+# observed or freerun. Use to_timecode() to get a Timecode when needed.
+class TimecodeValue(object):
+    __slots__ = ('total_frames', 'frame_format')
+    def __init__(self, total_frames, frame_format):
+        object.__setattr__(self, 'total_frames', int(total_frames))
+        object.__setattr__(self, 'frame_format', frame_format)
+    @classmethod
+    def parse(cls, tc_str, frame_rate, drop_frame=False):
+        frame = Frame(**_parse_tc_string(tc_str, frame_rate, drop_frame))
+        return cls(frame.total_frames, frame.frame_format)
+    @classmethod
+    def from_frames(cls, total_frames, frame_format):
+        return cls(total_frames, frame_format)
+    @classmethod
+    def from_timecode(cls, tc):
+        return cls(tc.total_frames, tc.frame_format)
+    def to_timecode(self):
+        return Timecode.from_frames(self.total_frames, self.frame_format)
+    def to_frame(self):
+        return Frame(frame_format=self.frame_format, total_frames=self.total_frames)
+    def copy(self):
+        return self
+    def get_hmsf_values(self):
+        return self.to_frame().get_hmsf_values()
+    @property
+    def total_seconds(self):
+        return _calc_total_seconds(self.to_frame())
+    @property
+    def timedelta(self):
+        return datetime.timedelta(seconds=self.total_seconds)
+    @property
+    def datetime(self):
+        dt = datetime.datetime.combine(datetime.date(2000, 1, 1), datetime.time())
+        return dt + self.timedelta
+    def __setattr__(self, name, value):
+        raise AttributeError('{!r} is immutable'.format(self))
+    def __delattr__(self, name):
+        raise AttributeError('{!r} is immutable'.format(self))
+    def __reduce__(self):
+        return (self.__class__, (self.total_frames, self.frame_format))
+    def _coerce_value(self, other):
+        # Same rules as Frame
+        if isinstance(other, (TimecodeValue, Frame)):
+            if self.frame_format != other.frame_format:
+                return NotImplemented
+            return other.total_frames
+        if isinstance(other, numbers.Number):
+            return other
+        return NotImplemented
+    def _coerce_op(self, other, op, reverse_op=False):
+        other = self._coerce_value(other)
+        if other is NotImplemented:
+            return other
+        if reverse_op:
+            return op(other, self.total_frames)
+        return op(self.total_frames, other)
+    def _arith_op(self, other, op, reverse_op=False):
+        total_frames = self._coerce_op(other, op, reverse_op)
+        if total_frames is NotImplemented:
+            return total_frames
+        return self.__class__(total_frames, self.frame_format)
+    def __add__(self, other): return self._arith_op(other, operator.add)
+    def __radd__(self, other): return self._arith_op(other, operator.add, True)
+    def __sub__(self, other): return self._arith_op(other, operator.sub)
+    def __rsub__(self, other): return self._arith_op(other, operator.sub, True)
+    def __eq__(self, other): return self._coerce_op(other, operator.eq)
+    def __ne__(self, other): return self._coerce_op(other, operator.ne)
+    def __lt__(self, other): return self._coerce_op(other, operator.lt)
+    def __le__(self, other): return self._coerce_op(other, operator.le)
+    def __gt__(self, other): return self._coerce_op(other, operator.gt)
+    def __ge__(self, other): return self._coerce_op(other, operator.ge)
+    def __hash__(self):
+        # Consistent with equality to plain frame counts
+        return hash(self.total_frames)
+    def __int__(self):
+        return self.total_frames
+    def __repr__(self):
+        return '<{self.__class__.__name__}: {self} ({self.frame_format})>'.format(self=self)
+    def __str__(self):
+        return self.to_frame().get_tc_string()
+
+
+# Ticks all freerunning timecodes sharing a frame rate. Frame deadlines are
+# computed from a fixed start time so timer lateness doesn't accumulate.
+class FrameClockGroup(object):
+    def __init__(self, clock, rate):
+        self.clock = clock
+        self.loop = clock.loop
+        self.rate = rate
+        self.fps = float(rate.value)
+        # Timecode compares by value, so these are keyed by id()
+        self.timecodes = {}
+        self.start_ts = self.loop.time()
+        self.next_index = None
+        self.handle = None
+        self.num_ticks = 0
+    def get_frame_index(self, now=None):
+        if now is None:
+            now = self.loop.time()
+        return int((now - self.start_ts) * self.fps)
+    def get_frame_ts(self, index):
+        return self.start_ts + index / self.fps
+    def add_timecode(self, tc):
+        index = self.get_frame_index()
+        self.timecodes[id(tc)] = tc
+        tc.freerun_start_index = index
+        # Advance immediately like the first frame of a freerun task would
+        tc._freerun_tick(self, index, self.loop.time())
+        if self.handle is None:
+            self._schedule(index + 1)
+    def reset_timecode(self, tc):
+        tc.freerun_start_index = self.get_frame_index()
+        tc.freerun_nframes = 1
+        tc.freerun_start_ts = self.loop.time()
+    def remove_timecode(self, tc):
+        self.timecodes.pop(id(tc), None)
+        if not len(self.timecodes):
+            self.stop()
+    def stop(self):
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+    def _schedule(self, index):
+        self.next_index = index
+        self.handle = self.loop.call_at(self.get_frame_ts(index), self._tick)
+    def _tick(self):
+        self.handle = None
+        now = self.loop.time()
+        # The timer may fire slightly before the deadline
+        index = max(self.get_frame_index(now), self.next_index)
+        self.num_ticks += 1
+        # Schedule first so an error in a callback can't stop the clock
+        self._schedule(index + 1)
+        for tc in list(self.timecodes.values()):
+            if tc.freerun_lock.locked():
+                # Missed frames are caught up on the next tick
+                continue
+            tc._freerun_tick(self, index, now)
+    def __repr__(self):
+        return '<{self.__class__.__name__}: {self}>'.format(self=self)
+    def __str__(self):
+        return '{} ({} timecodes)'.format(self.rate, len(self.timecodes))
+
+
+# One timer per frame rate is shared by all freerunning timecodes on a loop
+class FrameClock(object):
+    def __init__(self, loop=None):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self.loop = loop
+        self.groups = {}
+    def get_group(self, rate):
+        key = rate.value
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = FrameClockGroup(self, rate)
+        return group
+    def add_timecode(self, tc):
+        group = self.get_group(tc.frame_format.rate)
+        tc.frame_clock_group = group
+        group.add_timecode(tc)
+    def reset_timecode(self, tc):
+        tc.frame_clock_group.reset_timecode(tc)
+    def remove_timecode(self, tc):
+        group = getattr(tc, 'frame_clock_group', None)
+        if group is None:
+            return
+        tc.frame_clock_group = None
+        group.remove_timecode(tc)
+        if not len(group.timecodes) and self.groups.get(group.rate.value) is group:
+            del self.groups[group.rate.value]
+
+_frame_clocks = {}
+
+def get_frame_clock(loop=None):
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    for _loop in list(_frame_clocks.keys()):
+        if _loop.is_closed():
+            del _frame_clocks[_loop]
+    clock = _frame_clocks.get(loop)
+    if clock is None:
+        clock = _frame_clocks[loop] = FrameClock(loop=loop)
+    return clock
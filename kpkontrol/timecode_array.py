@@ -0,0 +1,197 @@
+import numbers
+
+import numpy as np
+
+from kpkontrol.timecode import FrameRate
+
+# Vectorized versions of the conversions done by Timecode (and pyltc's Frame).
+# Results match the scalar implementation exactly, including its drop-frame
+# arithmetic, so they can be used interchangeably.
+
+_ZERO = ord('0')
+_COLON = ord(':')
+_SEMICOLON = ord(';')
+
+class _FormatInfo(object):
+    def __init__(self, rate, drop_frame):
+        self.rate = rate
+        self.drop_frame = bool(drop_frame)
+        self.rounded = int(rate.rounded)
+        self.numerator = rate.value.numerator
+        self.denominator = rate.value.denominator
+        self.float_value = rate.float_value
+        # Same as Frame.df_frame_numbers
+        if self.rounded == 30:
+            self.drop_num = 2
+        elif self.rounded == 60:
+            self.drop_num = 4
+        else:
+            self.drop_num = 0
+        # Constants from Frame.set_total_frames
+        self.ten_minute_frames = int(rate * 60 * 10)
+        self.minute_frames = int(rate * 60)
+        self.drops_per_ten_minutes = int(rate.rounded * 60 * 10) - self.ten_minute_frames
+
+_format_infos = {}
+
+def _get_format_info(frame_format=None, frame_rate=None, drop_frame=False):
+    if frame_format is not None:
+        frame_rate = frame_format.rate
+        drop_frame = frame_format.drop_frame
+    elif isinstance(frame_rate, numbers.Number):
+        frame_rate = FrameRate.from_float(frame_rate)
+    key = (frame_rate.value, bool(drop_frame))
+    info = _format_infos.get(key)
+    if info is None:
+        info = _format_infos[key] = _FormatInfo(frame_rate, drop_frame)
+    return info
+
+def _as_frames(total_frames):
+    return np.asarray(total_frames, dtype=np.int64)
+
+def _drop_frame_label(info, frames, seconds, minutes, drop_mask=True):
+    # Frame.set_value skips the dropped frame numbers at the start of each
+    # minute (except every tenth)
+    if not info.drop_num:
+        return frames
+    drop = (seconds == 0) & (minutes % 10 != 0) & (frames >= 0) & (frames < info.drop_num)
+    drop &= drop_mask
+    return np.where(drop, info.drop_num, frames)
+
+def _split_frames(info, total_frames):
+    t = total_frames
+    if info.drop_frame:
+        d, m = np.divmod(t, info.ten_minute_frames)
+        add_frames = info.drops_per_ten_minutes * d
+        add_frames = np.where(
+            m < info.drop_num,
+            add_frames,
+            add_frames + info.drop_num * ((m - info.drop_num) // info.minute_frames),
+        )
+        t = np.where(add_frames > 0, t + add_frames, t)
+    total_seconds, frames = np.divmod(t, info.rounded)
+    total_minutes, seconds = np.divmod(total_seconds, 60)
+    minutes = total_minutes % 60
+    hours = (total_minutes // 60) % 24
+    if info.drop_frame:
+        frames = _drop_frame_label(info, frames, seconds, minutes)
+    return hours, minutes, seconds, frames
+
+# Frame counts to an array of (hours, minutes, seconds, frames)
+def frames_to_hmsf(total_frames, frame_format):
+    info = _get_format_info(frame_format)
+    hmsf = _split_frames(info, _as_frames(total_frames))
+    return np.stack(hmsf, axis=-1)
+
+def _hmsf_to_frames(info, hours, minutes, seconds, frames, drop_mask):
+    frames = _drop_frame_label(info, frames, seconds, minutes, drop_mask)
+    result = (seconds + minutes * 60 + hours * 3600) * info.rounded + frames
+    if info.drop_num:
+        total_minutes = hours * 60 + minutes
+        dropped = info.drop_num * (total_minutes - total_minutes // 10)
+        result = np.where(drop_mask, result - dropped, result)
+    return result
+
+# Array of (hours, minutes, seconds, frames) to frame counts
+def hmsf_to_frames(hmsf, frame_format):
+    info = _get_format_info(frame_format)
+    hmsf = np.asarray(hmsf, dtype=np.int64)
+    hours, minutes, seconds, frames = [hmsf[..., i] for i in range(4)]
+    return _hmsf_to_frames(info, hours, minutes, seconds, frames, info.drop_frame)
+
+# Same as str(Timecode)
+def frames_to_strings(total_frames, frame_format):
+    info = _get_format_info(frame_format)
+    total_frames = _as_frames(total_frames)
+    shape = total_frames.shape
+    hours, minutes, seconds, frames = [
+        a.ravel() for a in _split_frames(info, total_frames)
+    ]
+    # Frame numbers above 99 (at 100fps and up) widen the last field
+    wide = frames >= 100
+    width = 12 if wide.any() else 11
+    buf = np.zeros((frames.size, width), dtype=np.uint8)
+    for col, values in [(0, hours), (3, minutes), (6, seconds)]:
+        buf[:, col] = values // 10 + _ZERO
+        buf[:, col+1] = values % 10 + _ZERO
+    buf[:, 2] = _COLON
+    buf[:, 5] = _COLON
+    buf[:, 8] = _SEMICOLON if info.drop_frame else _COLON
+    buf[:, 9] = frames // 10 + _ZERO
+    buf[:, 10] = frames % 10 + _ZERO
+    if width == 12:
+        buf[wide, 9] = frames[wide] // 100 + _ZERO
+        buf[wide, 10] = (frames[wide] // 10) % 10 + _ZERO
+        buf[wide, 11] = frames[wide] % 10 + _ZERO
+    result = buf.view('S{}'.format(width)).ravel().astype('U{}'.format(width))
+    return result.reshape(shape)
+
+def _parse_string(tc_str):
+    # Same rules as Timecode.parse
+    drop_frame = ';' in tc_str
+    values = [int(v) for v in tc_str.replace(';', ':').split(':')[:4]]
+    values.extend([0] * (4 - len(values)))
+    return values + [drop_frame]
+
+# Same as Timecode.parse, where any string containing ';' is drop-frame
+def strings_to_frames(tc_strs, frame_rate, drop_frame=False):
+    info = _get_format_info(frame_rate=frame_rate, drop_frame=True)
+    tc_strs = np.asarray(tc_strs)
+    shape = tc_strs.shape
+    tc_strs = tc_strs.ravel()
+    n = tc_strs.size
+    hours, minutes, seconds, frames = [np.zeros(n, dtype=np.int64) for i in range(4)]
+    drop_mask = np.zeros(n, dtype=bool)
+    try:
+        bytes_arr = tc_strs.astype('S')
+    except UnicodeEncodeError:
+        bytes_arr = None
+    if bytes_arr is not None and n and bytes_arr.dtype.itemsize >= 11:
+        # Fast path for "HH:MM:SS:FF", with any number of frame digits
+        width = bytes_arr.dtype.itemsize
+        buf = np.frombuffer(bytes_arr.tobytes(), dtype=np.uint8).reshape(n, width)
+        lengths = np.char.str_len(bytes_arr)
+        digits = buf.astype(np.int64) - _ZERO
+        is_digit = (digits >= 0) & (digits <= 9)
+        is_sep = (buf == _COLON) | (buf == _SEMICOLON)
+        valid = (lengths >= 11) & is_sep[:, [2, 5, 8]].all(axis=1)
+        valid &= is_digit[:, [0, 1, 3, 4, 6, 7]].all(axis=1)
+        for col in range(9, width):
+            in_str = col < lengths
+            valid &= is_digit[:, col] | ~in_str
+            frames = np.where(in_str, frames * 10 + digits[:, col], frames)
+        hours = digits[:, 0] * 10 + digits[:, 1]
+        minutes = digits[:, 3] * 10 + digits[:, 4]
+        seconds = digits[:, 6] * 10 + digits[:, 7]
+        drop_mask = (buf[:, [2, 5, 8]] == _SEMICOLON).any(axis=1)
+        fallback = np.flatnonzero(~valid)
+    else:
+        fallback = np.arange(n)
+    if len(fallback):
+        parsed = np.array([_parse_string(str(s)) for s in tc_strs[fallback]], dtype=np.int64)
+        hours[fallback], minutes[fallback], seconds[fallback], frames[fallback] = parsed[:, :4].T
+        drop_mask[fallback] = parsed[:, 4].astype(bool)
+    if drop_frame:
+        drop_mask[:] = True
+    result = _hmsf_to_frames(info, hours, minutes, seconds, frames, drop_mask)
+    return result.reshape(shape)
+
+# Same as Timecode.total_seconds
+def frames_to_seconds(total_frames, frame_format):
+    info = _get_format_info(frame_format)
+    total_frames = _as_frames(total_frames)
+    frames = _split_frames(info, total_frames)[3]
+    # int((total_frames - frames) / rate), truncated towards zero
+    num = (total_frames - frames) * info.denominator
+    whole, rem = np.divmod(num, info.numerator)
+    whole = np.where((num < 0) & (rem != 0), whole + 1, whole)
+    return whole.astype(np.float64) + frames / info.float_value
+
+# Same as Timecode.timedelta, as timedelta64[us]
+def frames_to_timedeltas(total_frames, frame_format):
+    seconds = frames_to_seconds(total_frames, frame_format)
+    # datetime.timedelta splits off the fractional seconds and rounds the
+    # microseconds half to even
+    frac, whole = np.modf(seconds)
+    microseconds = whole.astype(np.int64) * 1000000 + np.rint(frac * 1e6).astype(np.int64)
+    return microseconds.astype('timedelta64[us]')
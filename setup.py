@@ -39,6 +39,9 @@ setup(
         'python-dispatch',
         'python-ltc>=0.0.3',
     ],
+    extras_require={
+        'numpy':['numpy'],
+    },
     include_package_data=True,
     setup_requires=['pypandoc'],
     long_description=get_long_description(),
@@ -7,6 +7,8 @@ from aiohttp import web
 
 import pytest
 
+from kpkontrol.session import session_pool
+
 from fake_device import FakeDevice
 
 TEST_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -150,6 +152,9 @@ class KPHttpHandler(object):
             query = u.query
         if path == '/options':
             param_id = u.query_string.lstrip('?')
+            self.server.requests.append(('get', param_id, None))
+            if param_id in self.server.failing_params:
+                return {'response':'<html>Internal Server Error</html>'}
             return await self.param_get_response(param_id)
         elif path == '/config':
             param_id = query.getall('paramName')
@@ -158,6 +163,7 @@ class KPHttpHandler(object):
             value = query.getall('newValue')
             if isinstance(value, list):
                 value = value[0]
+            self.server.requests.append(('set', param_id, value))
             return await self.param_set_response(param_id, value)
         for resp_data in KP_RESPONSE_DATA:
             if resp_data['url_path'] != path:
@@ -219,7 +225,14 @@ class KPDeviceHttpHandler(KPHttpHandler):
 class KPHttpServer(object):
     handler_cls = KPHttpHandler
     def __init__(self, *args, **kwargs):
-        pass
+        # (method, param_id, value) for each GetParameter/SetParameter received
+        self.requests = []
+        # GetParameter requests for these respond with an unparsable body
+        self.failing_params = set()
+    def count_requests(self, method, param_id):
+        return len([r for r in self.requests if r[:2] == (method, param_id)])
+    def get_set_values(self, param_id):
+        return [r[2] for r in self.requests if r[:2] == ('set', param_id)]
     async def start(self, loop=None):
         if loop is None:
             loop = asyncio.get_event_loop()
@@ -250,6 +263,8 @@ class KPHttpServer(object):
     async def stop(self):
         if not self.running.is_set():
             return
+        # Pooled keep-alive connections would otherwise hold up the shutdown
+        await session_pool.close(self.loop)
         self.running.clear()
         await self.run_coro
 
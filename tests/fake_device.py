@@ -23,7 +23,11 @@ class FakeDevice(object):
     def __init__(self, **kwargs):
         self._running = False
         self._timecode = None
+        self._parameter_changed = None
+        self.listen_timeout = kwargs.get('listen_timeout', .5)
         self.connections = set()
+        # Changed parameter ids waiting to be reported, per connection
+        self.changed_params = {}
         self.loop = kwargs.get('loop')
         self.parameters = {}
         self.host_address = kwargs.get('host_address')
@@ -45,6 +49,7 @@ class FakeDevice(object):
     async def start(self):
         if self.loop is None:
             self.loop = asyncio.get_event_loop()
+        self._parameter_changed = asyncio.Event()
         for key, val in DEFAULT_PARAMETER_VALS.items():
             await self.set_formatted_value(key, val)
 
@@ -106,7 +111,7 @@ class FakeDevice(object):
         elif clip.name == old:
             return
         else:
-            self.timecode = clip.start_timecode.copy()
+            self.timecode = clip.start_timecode.to_timecode()
     def build_default_timecode(self):
         fr = timecode.FrameRate.from_float(29.97)
         ff = timecode.FrameFormat(rate=fr, drop_frame=True)
@@ -183,6 +188,10 @@ class FakeDevice(object):
             value = int(value)
         old = self.get_formatted_value(param_id)
         self.parameter_values[param_id] = value
+        for changed in self.changed_params.values():
+            changed.add(param_id)
+        if self._parameter_changed is not None:
+            self._parameter_changed.set()
         if param_id == 'eParamID_TransportCommand':
             await self.update_transport_command(old)
         elif param_id == 'eParamID_TransportState':
@@ -231,6 +240,16 @@ class FakeDevice(object):
         else:
             d = {'param_id':param_id, 'str_value':str(value), 'value':value, 'int_value':value}
         return d
+    def format_event(self, param_id):
+        d = self.format_response(param_id)
+        if 'services' in d:
+            return d
+        # Config events carry both int_value and str_value for all types
+        if 'int_value' not in d:
+            d['int_value'] = d['value']
+        if 'str_value' not in d:
+            d['str_value'] = d.get('value_name', str(d['int_value']))
+        return d
     async def build_network_services_data(self, devices):
         l = []
         for device in devices:
@@ -254,9 +273,20 @@ class FakeDevice(object):
         l = []
         if connection_id not in self.connections:
             self.connections.add(connection_id)
+            self.changed_params[connection_id] = set()
             params = ['eParamID_NetworkServices']
         else:
+            # Hold the request until something changes, as the device does
+            changed = self.changed_params[connection_id]
+            if not len(changed):
+                self._parameter_changed.clear()
+                try:
+                    await asyncio.wait_for(self._parameter_changed.wait(), self.listen_timeout)
+                except asyncio.TimeoutError:
+                    pass
             params = ['eParamID_DisplayTimecode']
+            params.extend(sorted(changed - set(params)))
+            changed.clear()
         for param_id in params:
-            l.append(self.format_response(param_id))
+            l.append(self.format_event(param_id))
         return json.dumps(l)
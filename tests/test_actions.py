@@ -1,11 +1,14 @@
 import asyncio
 import datetime
+import hashlib
 import ipaddress
+import json
 from fractions import Fraction
 
 import pytest
 
 from kpkontrol import actions, objects, timecode, parameters
+from kpkontrol.device import KpDevice
 
 @pytest.mark.asyncio
 async def test_get_clips(kp_http_server):
@@ -28,8 +31,8 @@ async def test_get_clips(kp_http_server):
         assert isinstance(clip, objects.Clip)
         assert isinstance(clip.format, objects.ClipFormat)
         assert isinstance(clip.format.frame_rate, timecode.FrameRate)
-        assert isinstance(clip.start_timecode, timecode.Timecode)
-        assert isinstance(clip.duration_tc, timecode.Timecode)
+        assert isinstance(clip.start_timecode, timecode.TimecodeValue)
+        assert isinstance(clip.duration_tc, timecode.TimecodeValue)
 
     clip = results[0]
 
@@ -138,3 +141,171 @@ async def test_get_parameters(kp_http_server, all_parameter_defs):
 
     await session.close()
     await kp_http_server.stop()
+
+@pytest.mark.asyncio
+async def test_prepared_actions(kp_http_server, all_parameter_defs):
+    await kp_http_server.start()
+    host_address = kp_http_server.host_address
+
+    action = actions.GetAllParameters(host_address)
+    all_parameters = await action()
+    session = action.session
+
+    assert actions.GetClips.get_class_query_params() is actions.GetClips.get_class_query_params()
+    assert actions.GetClips.get_class_query_params() == {'action':'get_clips'}
+    assert actions.Connect.get_class_query_params() is not actions.ListenForEvents.get_class_query_params()
+
+    param = all_parameters['by_id']['eParamID_SysName']
+
+    action = actions.GetParameter(host_address, parameter=param)
+    req = action.prepared
+    assert req.method == 'get'
+    assert req.url == 'http://{}/options?eParamID_SysName'.format(host_address)
+    await action(session=session)
+    await action(session=session)
+    assert action.prepared is req
+
+    action = actions.SetParameter(host_address, parameter=param, value='foo')
+    req = action.prepared
+    assert req.method == 'post'
+    assert req.url == 'http://{}/config'.format(host_address)
+    assert req.data == 'paramName=eParamID_SysName&newValue=foo'
+    assert await action(session=session) == 'foo'
+    assert action.prepared is req
+
+    response = await action(session=session, value='bar baz')
+    assert response == 'bar baz'
+    assert action.prepared is not req
+    assert action.prepared.url is req.url
+    assert action.prepared.data == 'paramName=eParamID_SysName&newValue=bar+baz'
+
+    # send() leaves the shared action unchanged
+    shared_req = action.prepared
+    assert await action.send(session, value='qux') == 'qux'
+    assert action.prepared is shared_req
+    assert action.value == 'bar baz'
+
+    await session.close()
+    await kp_http_server.stop()
+
+@pytest.mark.asyncio
+async def test_concurrent_prepared_actions(kp_http_server, all_parameter_defs):
+    await kp_http_server.start()
+    host_address = kp_http_server.host_address
+
+    device = KpDevice(host_address=host_address)
+    await device.connect()
+    param = device.all_parameters['eParamID_SysName']
+
+    values = ['foo{}'.format(i) for i in range(8)]
+    responses = await asyncio.gather(*[device.set_parameter(param, v) for v in values])
+
+    # Each caller gets the response for its own value
+    assert responses == values
+    assert sorted(kp_http_server.get_set_values(param.id)) == sorted(values)
+    # No per-call state is kept on the shared action
+    action = device.prepared_actions[(actions.SetParameter, param.id)]
+    assert action.value is None
+    assert action.result is None
+
+    await device.stop()
+    await kp_http_server.stop()
+
+def test_clip_list_parser():
+    body = '''{"clips": [
+        {"clipname": "a,]}.mov", "attributes": {"Audio Chan": "2"}},
+        {"clipname": "\u00e9.mov"} ,{"clipname": "c.mov"}
+    ]}'''
+    expected = json.loads(body)['clips']
+    data = body.encode('UTF-8')
+    for chunk_size in [1, 2, 7, len(data)]:
+        parser = actions.ClipListParser()
+        items = []
+        for i in range(0, len(data), chunk_size):
+            items.extend(parser.feed(data[i:i+chunk_size]))
+        items.extend(parser.feed(b'', final=True))
+        assert items == expected
+        assert parser.complete
+
+    parser = actions.ClipListParser()
+    parser.feed(data[:40])
+    with pytest.raises(ValueError):
+        parser.feed(b'', final=True)
+
+@pytest.mark.asyncio
+async def test_get_clips_stream(kp_http_server):
+    await kp_http_server.start()
+    host_address = kp_http_server.host_address
+
+    action = actions.GetClips(host_address)
+    clip_list = await action()
+
+    clips = []
+    async for clip in action.stream():
+        assert isinstance(clip, objects.Clip)
+        clips.append(clip)
+
+    assert [c.name for c in clips] == [c.name for c in clip_list]
+    for clip, expected in zip(clips, clip_list):
+        assert clip.total_frames == expected.total_frames
+        assert str(clip.format) == str(expected.format)
+        assert str(clip.start_timecode) == str(expected.start_timecode)
+
+    # Stopping early releases the response
+    async with action.stream() as stream:
+        async for clip in stream:
+            break
+    assert stream.closed
+
+    # Records are the raw text and decoded data of each clip, and the digest
+    # covers the whole body
+    async with action.stream(records=True) as stream:
+        records = [record async for record in stream]
+    assert [data['clipname'] for text, data in records] == [c.name for c in clip_list]
+    for text, data in records:
+        assert json.loads(text) == data
+    async with action.session.get(action.full_url) as r:
+        body = await r.read()
+    assert stream.digest == hashlib.sha1(body).hexdigest()
+
+    await action.session.close()
+    await kp_http_server.stop()
+
+def test_event_decoders(all_parameter_defs):
+    by_id = {}
+    for d in all_parameter_defs.values():
+        param = parameters.ParameterBase.from_json(d)
+        by_id[param.id] = param
+
+    action = actions.ListenForEvents('localhost', all_parameters={'by_id':by_id})
+    action.build_decoders()
+    assert set(action.decoders.keys()) == set(by_id.keys())
+
+    enum_param = by_id['eParamID_TransportState']
+    item = enum_param.item_from_value(3)
+    events = [
+        {'param_id':'eParamID_TransportState', 'int_value':'3', 'str_value':item.description},
+        {'param_id':'eParamID_DisplayTimecode', 'int_value':'0', 'str_value':'01:00:00;00'},
+        {'param_id':'eParamID_IPAddress_3', 'int_value':'-1062731391', 'str_value':'192.168.1.129'},
+        {'services':[], 'param_id':'eParamID_NetworkServices'},
+        {'param_id':'eParamID_Foo'},
+        {'no_param_id':True},
+    ]
+    for d in all_parameter_defs.values():
+        if d['param_type'] == 'integer':
+            events.append({'param_id':d['param_id'], 'int_value':'42', 'str_value':'42'})
+            int_param_id = d['param_id']
+            break
+
+    decoded = action.decode_events(events)
+    assert set(decoded.keys()) == {
+        'eParamID_TransportState', 'eParamID_DisplayTimecode',
+        'eParamID_IPAddress_3', 'eParamID_NetworkServices', int_param_id,
+    }
+    assert decoded['eParamID_TransportState']['parameter'] is enum_param
+    assert decoded['eParamID_TransportState']['value'] is item
+    assert decoded['eParamID_DisplayTimecode']['value'] == '01:00:00;00'
+    # Octet values are passed through as the event's str_value
+    assert decoded['eParamID_IPAddress_3']['value'] == '192.168.1.129'
+    assert decoded['eParamID_NetworkServices']['value'] == []
+    assert decoded[int_param_id]['value'] == 42
@@ -0,0 +1,155 @@
+import asyncio
+import os
+import json
+import pytest
+
+from kpkontrol import actions
+from kpkontrol.cache import DescriptorCache, DescriptorRegistry
+from kpkontrol.device import KpDevice
+from kpkontrol.session import session_pool
+
+def test_descriptor_cache(tmpdir):
+    cache = DescriptorCache(path=str(tmpdir), max_entries=3)
+
+    key = cache.build_key('WORF', 33685518)
+    assert cache.get(key) is None
+    assert cache.misses == 1
+
+    data = [{'param_id':'eParamID_Foo'}]
+    cache.set(key, json.dumps(data))
+    assert cache.get(key) == data
+    assert cache.hits == 1
+
+    # Corrupted entries are discarded
+    fn = os.path.join(str(tmpdir), '{}.json'.format(key))
+    with open(fn, 'r') as f:
+        cached = json.load(f)
+    cached['payload'] = cached['payload'].replace('Foo', 'Bar')
+    with open(fn, 'w') as f:
+        json.dump(cached, f)
+    assert cache.get(key) is None
+    assert not os.path.exists(fn)
+
+    # Oldest entries are evicted beyond max_entries
+    keys = []
+    for i in range(5):
+        key = cache.build_key('WORF', i)
+        keys.append(key)
+        cache.set(key, json.dumps(data))
+        fn = os.path.join(str(tmpdir), '{}.json'.format(key))
+        os.utime(fn, (i, i))
+    cache.evict()
+    assert len(list(cache.iter_entries())) == 3
+    for key in keys[:2]:
+        assert cache.get(key) is None
+    for key in keys[2:]:
+        assert cache.get(key) == data
+
+@pytest.mark.asyncio
+async def test_device_descriptor_cache(kp_http_server, all_parameter_defs, tmpdir):
+    await kp_http_server.start()
+    host_address = kp_http_server.host_address
+
+    cache = DescriptorCache(path=str(tmpdir))
+
+    device1 = KpDevice(host_address=host_address, descriptor_cache=cache)
+    await device1.connect()
+    assert cache.misses == 1
+    assert len(list(cache.iter_entries())) == 1
+
+    device2 = KpDevice(host_address=host_address, descriptor_cache=cache)
+    await device2.connect()
+    assert cache.hits == 1
+
+    assert set(device2.all_parameters.keys()) == set(all_parameter_defs.keys())
+    assert set(device1.all_parameters.keys()) == set(device2.all_parameters.keys())
+
+    await device1.stop()
+    await device2.stop()
+    await kp_http_server.stop()
+
+@pytest.mark.asyncio
+async def test_descriptor_registry(kp_http_server, all_parameter_defs, tmpdir):
+    await kp_http_server.start()
+    host_address = kp_http_server.host_address
+
+    registry = DescriptorRegistry()
+
+    devices = []
+    for i in range(3):
+        device = KpDevice(host_address=host_address, descriptor_registry=registry)
+        await device.connect()
+        devices.append(device)
+    assert registry.misses == 1
+    assert registry.hits == 2
+    assert len(registry.by_hash) == 1
+
+    device1, device2, device3 = devices
+    for param_id, param in device1.parameter_descriptors.items():
+        assert device2.parameter_descriptors[param_id] is param
+        assert device3.parameter_descriptors[param_id] is param
+        # Per-device state is not shared
+        assert device1.all_parameters[param_id] is not device2.all_parameters[param_id]
+        assert device1.all_parameters[param_id].parameter is param
+
+    param = device1.parameter_descriptors['eParamID_SysName']
+
+    # With the disk cache, known devices skip the descriptor request
+    cache = DescriptorCache(path=str(tmpdir))
+    device4 = KpDevice(host_address=host_address, descriptor_registry=registry, descriptor_cache=cache)
+    await device4.connect()
+    assert registry.hits == 3
+    assert len(registry.by_key) == 1
+    device5 = KpDevice(host_address=host_address, descriptor_registry=registry, descriptor_cache=cache)
+    await device5.connect()
+    assert registry.hits == 4
+    # Resolved from the registry without reading the disk cache
+    assert cache.misses == 1
+    assert cache.hits == 0
+    assert device5.parameter_descriptors['eParamID_SysName'] is param
+    devices.extend([device4, device5])
+
+    for device in devices:
+        await device.stop()
+    await kp_http_server.stop()
+
+@pytest.mark.asyncio
+async def test_descriptor_cache_key_errors(kp_http_server, all_parameter_defs, tmpdir):
+    await kp_http_server.start()
+    host_address = kp_http_server.host_address
+
+    cache = DescriptorCache(path=str(tmpdir))
+    kp_http_server.failing_params.add('eParamID_ProductID')
+
+    # The device can't be identified, so it bootstraps without the cache
+    device = KpDevice(host_address=host_address, descriptor_cache=cache)
+    await device.connect()
+    assert set(device.all_parameters.keys()) == set(all_parameter_defs.keys())
+    assert len(list(cache.iter_entries())) == 0
+
+    await device.stop()
+    await kp_http_server.stop()
+
+@pytest.mark.asyncio
+async def test_descriptor_cache_pooled_session(kp_http_server, all_parameter_defs, tmpdir):
+    await kp_http_server.start()
+    host_address = kp_http_server.host_address
+
+    loop = asyncio.get_event_loop()
+    cache = DescriptorCache(path=str(tmpdir))
+
+    # Idle sessions are evicted right away, so one borrowed without being
+    # acquired would be closed during the cache key requests
+    idle_timeout = session_pool.idle_timeout
+    session_pool.idle_timeout = 0
+    try:
+        action = actions.GetAllParameters(host_address, cache=cache)
+        params = await action()
+        assert action.session_borrowed
+        assert action.cache_key is not None
+        assert set(params['by_id'].keys()) == set(all_parameter_defs.keys())
+        assert len(list(cache.iter_entries())) == 1
+    finally:
+        session_pool.idle_timeout = idle_timeout
+        await session_pool.close(loop)
+    await kp_http_server.stop()
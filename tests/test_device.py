@@ -2,6 +2,7 @@ import asyncio
 import pytest
 
 from kpkontrol.device import KpDevice
+from kpkontrol.timecode import FrameFormat, Timecode
 
 @pytest.mark.asyncio
 async def test_device(kp_http_server, all_parameter_defs):
@@ -52,3 +53,294 @@ async def test_device(kp_http_server, all_parameter_defs):
     assert device.session is None
 
     await kp_http_server.stop()
+
+@pytest.mark.asyncio
+async def test_concurrent_bootstrap(kp_http_server, all_parameter_defs):
+    await kp_http_server.start()
+    host_address = kp_http_server.host_address
+
+    values = {}
+    for limit in [1, 8]:
+        device = KpDevice(host_address=host_address, bootstrap_concurrency=limit)
+        await device.connect()
+
+        assert device.bootstrap_time is not None and device.bootstrap_time > 0
+        assert not len(device.bootstrap_errors)
+
+        values[limit] = {
+            pid:str(p.value) for pid, p in device.all_parameters.items()
+        }
+        await device.stop()
+
+    assert values[1] == values[8]
+
+    await kp_http_server.stop()
+
+@pytest.mark.asyncio
+async def test_bootstrap_errors(kp_http_server, all_parameter_defs):
+    await kp_http_server.start()
+    host_address = kp_http_server.host_address
+
+    expected = KpDevice(host_address=host_address)
+    await expected.connect()
+    await expected.stop()
+
+    failing_id = 'eParamID_VideoInConvert'
+    kp_http_server.failing_params.add(failing_id)
+    kp_http_server.requests.clear()
+
+    device = KpDevice(host_address=host_address)
+    await device.connect()
+
+    assert kp_http_server.count_requests('get', failing_id) == 1
+    assert set(device.bootstrap_errors.keys()) == {failing_id}
+    assert isinstance(device.bootstrap_errors[failing_id], ValueError)
+
+    # The rest of the values were still loaded
+    for pid, param in device.all_parameters.items():
+        if pid == failing_id:
+            continue
+        assert str(param.value) == str(expected.all_parameters[pid].value)
+
+    await device.stop()
+    await kp_http_server.stop()
+
+@pytest.mark.asyncio
+async def test_coalesced_writes(kp_http_server, all_parameter_defs):
+    await kp_http_server.start()
+    host_address = kp_http_server.host_address
+
+    device = KpDevice(host_address=host_address, coalesce_writes=True)
+    await device.connect()
+
+    param = device.all_parameters['eParamID_SysName']
+
+    values = ['a', 'b', 'c', 'd', 'e']
+    responses = await asyncio.gather(*[param.set_value(v) for v in values])
+
+    # The first value goes out immediately, the rest collapse into the last
+    assert kp_http_server.get_set_values(param.id) == ['a', 'e']
+    assert responses == ['e'] * len(values)
+    assert param.value == 'e'
+    assert not len(device._pending_writes)
+
+    await device.stop()
+    await kp_http_server.stop()
+
+@pytest.mark.asyncio
+async def test_coalesced_writes_cancelled(kp_http_server, all_parameter_defs):
+    await kp_http_server.start()
+    host_address = kp_http_server.host_address
+
+    device = KpDevice(host_address=host_address, coalesce_writes=True)
+    await device.connect()
+
+    param = device.all_parameters['eParamID_SysName']
+
+    async def start_writes():
+        writes = [asyncio.ensure_future(param.set_value(v)) for v in ['a', 'b']]
+        while param.id not in device._pending_writes:
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return writes
+
+    # Callers sharing a cancelled write don't wait forever
+    writes = await start_writes()
+    device._pending_writes[param.id]['task'].cancel()
+    for fut in writes:
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(fut, 1)
+    assert not len(device._pending_writes)
+
+    # Writes in flight are cancelled by stop()
+    writes = await start_writes()
+    await device.stop()
+    for fut in writes:
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(fut, 1)
+    assert not len(device._pending_writes)
+
+    await kp_http_server.stop()
+
+@pytest.mark.asyncio
+async def test_single_flight_gets(kp_http_server, all_parameter_defs):
+    await kp_http_server.start()
+    host_address = kp_http_server.host_address
+
+    device = KpDevice(host_address=host_address, get_cache_ttl=60)
+    await device.connect()
+
+    param = device.all_parameters['eParamID_SysName']
+    device._recent_gets.clear()
+    kp_http_server.requests.clear()
+
+    responses = await asyncio.gather(*[device.get_parameter(param) for i in range(5)])
+    assert kp_http_server.count_requests('get', param.id) == 1
+    assert len(set(responses)) == 1
+    assert param.id not in device._inflight_gets
+
+    # Reused within the ttl
+    assert await device.get_parameter(param) == responses[0]
+    assert kp_http_server.count_requests('get', param.id) == 1
+
+    # Writes invalidate the cached value
+    await device.set_parameter(param, 'foo')
+    assert await device.get_parameter(param) == 'foo'
+    assert kp_http_server.count_requests('get', param.id) == 2
+
+    await device.stop()
+    await kp_http_server.stop()
+
+@pytest.mark.asyncio
+async def test_clip_events(kp_http_server, all_parameter_defs):
+    await kp_http_server.start()
+    host_address = kp_http_server.host_address
+
+    device = KpDevice(host_address=host_address)
+    events = []
+    def on_clip_event(name):
+        def handler(instance, clip, **kwargs):
+            events.append((name, clip.name))
+        return handler
+    # Keep references since the callbacks are stored weakly
+    handlers = {k:on_clip_event(k) for k in ['added', 'changed', 'removed']}
+    device.bind(
+        on_clip_added=handlers['added'],
+        on_clip_changed=handlers['changed'],
+        on_clip_removed=handlers['removed'],
+    )
+    await device.connect()
+
+    assert sorted(events) == [
+        ('added', 'A003SC10TK22.mov'), ('added', 'A003SC10TK23.mov'),
+    ]
+    assert set(device.clips.keys()) == {'A003SC10TK22.mov', 'A003SC10TK23.mov'}
+
+    # Unchanged responses don't emit anything
+    events.clear()
+    await device.update_clips()
+    assert events == []
+
+    await device.stop()
+    await kp_http_server.stop()
+
+@pytest.mark.asyncio
+async def test_lazy_parameters(kp_http_server, all_parameter_defs):
+    await kp_http_server.start()
+    host_address = kp_http_server.host_address
+
+    eager_device = KpDevice(host_address=host_address)
+    await eager_device.connect()
+    await eager_device.stop()
+
+    device = KpDevice(host_address=host_address, lazy_parameters=True)
+    await device.connect()
+
+    all_parameters = device.all_parameters
+    assert set(all_parameters.keys()) == set(all_parameter_defs.keys())
+    assert len(all_parameters.materialized) < len(all_parameters) / 4
+    assert device.name == eager_device.name
+    assert device.serial_number == eager_device.serial_number
+
+    # Values received before the parameter is created are applied on access
+    pid = sorted(all_parameters.raw_values.keys())[0]
+    assert not all_parameters.is_materialized(pid)
+    param = all_parameters[pid]
+    assert all_parameters.is_materialized(pid)
+    assert pid not in all_parameters.raw_values
+    assert str(param.value) == str(eager_device.all_parameters[pid].value)
+
+    await device.set_parameter('eParamID_CurrentClip', 'A003SC10TK22.mov')
+    await device.update_clips()
+    assert device.transport.clip.name == 'A003SC10TK22.mov'
+
+    await device.stop()
+    await kp_http_server.stop()
+
+@pytest.mark.asyncio
+async def test_transport_timecode_views(kp_http_server):
+    await kp_http_server.start()
+
+    device = KpDevice(host_address=kp_http_server.host_address)
+    await device.connect()
+    await device.set_parameter('eParamID_CurrentClip', 'A003SC10TK22.mov')
+    await device.update_clips()
+    transport = device.transport
+    clip = transport.clip
+
+    # Strings are rendered from the timecode when read
+    tc = transport.timecode
+    duration = clip.duration_tc.total_frames
+    assert transport.get_timecode_str() == str(tc) == "18:25:06;12"
+    assert transport.frames_remaining == duration
+    assert transport.get_timecode_remaining().total_frames == duration
+    tc.incr()
+    assert transport.get_timecode_str() == str(tc)
+    assert transport.frames_remaining == duration - 1
+    assert str(transport.get_timecode_remaining()) == str(
+        Timecode.from_frames(duration - 1, FrameFormat(rate=tc.frame_format.rate))
+    )
+
+    # Nothing is rendered until something is bound to the Properties
+    assert transport.timecode_view is None
+
+    transport_updates = []
+    def on_transport_timecode_str(instance, value, **kwargs):
+        transport_updates.append(value)
+    transport.bind(timecode_str=on_transport_timecode_str)
+    assert transport.timecode_view is not None
+    assert transport.timecode_str == str(tc)
+    assert transport.timecode_remaining.total_frames == duration - 1
+    assert transport.timecode_remaining_str == str(transport.timecode_remaining)
+
+    # Without a timecode_rate every frame is rendered
+    for i in range(5):
+        tc.incr()
+        assert transport_updates[-1] == transport.timecode_str == str(tc)
+    assert len(transport_updates) == 5
+    assert transport.timecode_remaining.total_frames == duration - 6
+
+    transport.unbind(on_transport_timecode_str)
+    assert transport.timecode_view is None
+    tc.incr()
+    assert len(transport_updates) == 5
+
+    # With a timecode_rate the Properties follow at up to that many updates
+    # per second
+    transport.timecode_rate = 10
+    transport.bind(timecode_str=on_transport_timecode_str)
+    transport_updates.clear()
+
+    view = transport.add_timecode_view()
+    throttled = transport.add_timecode_view(max_rate=10)
+    assert view.timecode_str == throttled.timecode_str == transport.timecode_str
+
+    updates = []
+    def on_timecode_str(instance, value, **kwargs):
+        updates.append(value)
+    throttled.bind(timecode_str=on_timecode_str)
+
+    for i in range(10):
+        tc.incr()
+        assert view.timecode_str == transport.get_timecode_str()
+        assert view.timecode_remaining == transport.get_timecode_remaining()
+        assert view.timecode_remaining_str == str(transport.get_timecode_remaining())
+
+    # Updates within the rate limit are deferred and only the latest is rendered
+    assert len(updates) <= 1
+    assert len(transport_updates) <= 1
+    await asyncio.sleep(.15)
+    assert updates[-1] == throttled.timecode_str == transport.get_timecode_str()
+    assert len(updates) <= 2
+    assert transport_updates[-1] == transport.timecode_str == str(tc)
+    assert len(transport_updates) <= 2
+    assert transport.timecode_remaining.total_frames == duration - 17
+
+    throttled.close()
+    view.close()
+    assert not len(transport.timecode_views)
+    tc.incr()
+    assert view.timecode_str != transport.get_timecode_str()
+
+    await device.stop()
+    await kp_http_server.stop()
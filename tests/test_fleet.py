@@ -0,0 +1,111 @@
+import asyncio
+import pytest
+
+from kpkontrol.fleet import KpFleet
+from kpkontrol.session import SessionPool
+
+@pytest.mark.asyncio
+async def test_fleet(kp_http_device_servers):
+    server_devices = []
+    for server in kp_http_device_servers.values():
+        server.device.listen_timeout = 2.
+        await server.start()
+        server_devices.append(server.device)
+    for device in server_devices[:]:
+        await device.build_network_services_data(server_devices)
+
+    servers_by_addr = {s.host_address:s for s in kp_http_device_servers.values()}
+
+    connected = []
+    def on_device_connected(fleet, device, **kwargs):
+        connected.append(device.host_address)
+
+    fleet = KpFleet(host_addresses=list(servers_by_addr.keys()), connect_stagger=.05)
+    fleet.bind(on_device_connected=on_device_connected)
+    await fleet.connect()
+
+    assert set(connected) == set(servers_by_addr.keys())
+    assert not len(fleet.connect_errors)
+    for device in fleet.devices.values():
+        assert device.connected
+        assert device.session_pool is fleet.session_pool
+        assert device.scheduler is fleet.scheduler
+    sessions = set([d.session for d in fleet.devices.values()])
+    assert len(sessions) == 1
+    # Parsed descriptors are shared between the fleet's devices
+    descriptors = set([id(d.parameter_descriptors) for d in fleet.devices.values()])
+    assert len(descriptors) == 1
+
+    received = {}
+    def on_parameter_value(device, param, value, **kwargs):
+        if param.id == 'eParamID_DisplayTimecode' and value == '01:00:00;00':
+            received[device.host_address] = value
+    fleet.bind(on_parameter_value=on_parameter_value)
+
+    async def wait_for(f):
+        while not f():
+            await asyncio.sleep(.05)
+
+    # Wait for the initial listen response from each unit
+    await asyncio.wait_for(
+        wait_for(lambda: all(d.listen_stats.events for d in fleet.devices.values())), 2.,
+    )
+
+    # Events from every unit are re-emitted by the fleet
+    for server in servers_by_addr.values():
+        await server.device.set_formatted_value('eParamID_DisplayTimecode', '01:00:00;00')
+    await asyncio.wait_for(wait_for(lambda: len(received) == len(servers_by_addr)), 2.)
+
+    results = await fleet.get_parameter('eParamID_SysName')
+    for host_address, value in results.items():
+        assert value == servers_by_addr[host_address].device.name
+
+    results = await fleet.set_parameter('eParamID_GangList', 'foo')
+    assert set(results.keys()) == set(servers_by_addr.keys())
+    for server in servers_by_addr.values():
+        assert server.device.get_parameter_value('eParamID_GangList') == 'foo'
+
+    results = await fleet.play()
+    assert not any(isinstance(r, Exception) for r in results.values())
+    await asyncio.wait_for(
+        wait_for(lambda: all(d.transport.playing for d in fleet.devices.values())), 2.,
+    )
+
+    # Commands can be sent to a subset of devices
+    device = fleet.devices[sorted(fleet.devices.keys())[0]]
+    results = await fleet.stop_transport(devices=[device])
+    assert list(results.keys()) == [device.host_address]
+    await asyncio.wait_for(wait_for(lambda: not device.transport.playing), 2.)
+
+    await fleet.remove_device(device)
+    assert device.host_address not in fleet.devices
+    assert not device.connected
+
+    await fleet.stop()
+    for device in fleet.devices.values():
+        assert not device.connected
+    for server in kp_http_device_servers.values():
+        await server.stop()
+
+@pytest.mark.asyncio
+async def test_fleet_session_pool(kp_http_device_servers):
+    loop = asyncio.get_event_loop()
+    server = kp_http_device_servers[sorted(kp_http_device_servers.keys())[0]]
+    await server.start()
+
+    # A pool passed in by the caller is left open
+    pool = SessionPool(limit=0)
+    fleet = await KpFleet.create(host_addresses=[server.host_address], session_pool=pool)
+    session = fleet.devices[server.host_address].session
+    await fleet.stop()
+    assert not session.closed
+    assert pool.stats(loop) is not None
+    await pool.close(loop)
+
+    # The fleet's own pool is closed on stop
+    fleet = await KpFleet.create(host_addresses=[server.host_address])
+    session = fleet.devices[server.host_address].session
+    await fleet.stop()
+    assert session.closed
+
+    await server.stop()
@@ -139,6 +139,18 @@ async def test_dummy_device(kp_http_device_servers):
         assert device.transport.timecode == next_clip.start_timecode
         assert device.transport.timecode == server.device.timecode
 
+        # Cue to a timecode inside another clip
+        other_clip = [c for c in device.clips.values() if c is not next_clip][0]
+        target = other_clip.start_timecode + 30
+        assert device.clip_at(target) is other_clip
+        assert device.clips_in_range(target, target + 1) == [other_clip]
+        await device.transport.go_to_timecode_anywhere(target)
+        await wait_for_events(device)
+
+        assert device.transport.clip is other_clip
+        assert device.transport.timecode == target
+        assert device.transport.timecode == server.device.timecode
+
     for device in devices.values():
         await device.stop(close_session=False)
     session.close()
@@ -211,3 +223,122 @@ async def test_device_gang(kp_http_device_servers):
     session.close()
     for server in kp_http_device_servers.values():
         await server.stop()
+
+@pytest.mark.asyncio
+async def test_event_listener(kp_http_device_servers):
+    loop = asyncio.get_event_loop()
+    server = kp_http_device_servers[sorted(kp_http_device_servers.keys())[0]]
+    server.device.listen_timeout = 2.
+    await server.start()
+
+    device = await KpDevice.create(host_address=server.host_address)
+    await asyncio.sleep(.5)
+
+    received = asyncio.Event()
+    def on_parameter_value(instance, value, **kwargs):
+        if instance.id == 'eParamID_DisplayTimecode' and value == '01:00:00;00':
+            received.set()
+    device.bind(on_parameter_value=on_parameter_value)
+
+    # The held listen request should return as soon as the value changes
+    start_ts = loop.time()
+    await server.device.set_formatted_value('eParamID_DisplayTimecode', '01:00:00;00')
+    await asyncio.wait_for(received.wait(), 2.)
+    assert loop.time() - start_ts < 1.
+
+    stats = device.listen_stats
+    assert stats.requests > 1
+    assert stats.errors == 0
+    assert stats.last_rearm_delay == 0
+
+    await device.stop()
+    await server.stop()
+
+@pytest.mark.asyncio
+async def test_events_received_payload(kp_http_device_servers):
+    server = kp_http_device_servers[sorted(kp_http_device_servers.keys())[0]]
+    server.device.listen_timeout = 2.
+    await server.start()
+
+    for apply_values in [False, True]:
+        device = await KpDevice.create(host_address=server.host_address, apply_values=apply_values)
+        await asyncio.sleep(.5)
+
+        received = asyncio.Event()
+        payloads = []
+        def on_events_received(instance, events, **kwargs):
+            if 'eParamID_SysName' in events:
+                payloads.append(events)
+                received.set()
+        device.bind(on_events_received=on_events_received)
+
+        name = 'Foo{}'.format(apply_values)
+        await server.device.set_formatted_value('eParamID_SysName', name)
+        await asyncio.wait_for(received.wait(), 2.)
+
+        data = payloads[0]['eParamID_SysName']
+        if apply_values:
+            assert data == name
+        else:
+            assert data == {'parameter':device.all_parameters['eParamID_SysName'], 'value':name}
+        assert device.all_parameters['eParamID_SysName'].value == name
+        assert device.name == name
+
+        await device.stop()
+    await server.stop()
+
+@pytest.mark.asyncio
+async def test_gang_events(kp_http_device_servers):
+    server_devices = []
+    for server in kp_http_device_servers.values():
+        server.device.listen_timeout = 2.
+        await server.start()
+        server_devices.append(server.device)
+    for device in server_devices[:]:
+        await device.build_network_services_data(server_devices)
+
+    master_name, slave_name = sorted(kp_http_device_servers.keys())[:2]
+    master_server = kp_http_device_servers[master_name]
+    slave_server = kp_http_device_servers[slave_name]
+
+    master_device = await KpDevice.create(host_address=master_server.host_address)
+    await asyncio.sleep(.5)
+
+    host_device = master_device.network_host_device
+    slave_network_device = master_device.network_devices[slave_server.host_address]
+
+    # Gang changes made on the unit are applied from config events
+    await master_server.device.set_formatted_value('eParamID_GangEnable', 'ON')
+    await master_server.device.set_formatted_value('eParamID_GangMaster', 'ON')
+    await master_server.device.set_formatted_value('eParamID_GangList', slave_server.host_address)
+
+    async def wait_for(f):
+        while not f():
+            await asyncio.sleep(.05)
+    await asyncio.wait_for(wait_for(lambda: len(host_device.gang_members)), 2.)
+
+    assert host_device.gang_enabled
+    assert host_device.gang_master
+    assert host_device.gang_members[slave_server.host_address] is slave_network_device
+    assert slave_network_device.gang_enabled
+
+    def count_gang_polls():
+        return [
+            master_server.count_requests('get', pid)
+            for pid in master_device.gang_parameter_ids
+        ]
+
+    # The verification poll is skipped while events are arriving
+    master_server.requests.clear()
+    assert master_device.events_active
+    await master_device.verify_gang_params()
+    assert count_gang_polls() == [0, 0, 0]
+
+    master_device.listen_stats.last_response_ts -= master_device.listen_stale_timeout
+    assert not master_device.events_active
+    await master_device.verify_gang_params()
+    assert count_gang_polls() == [1, 1, 1]
+
+    await master_device.stop()
+    for server in kp_http_device_servers.values():
+        await server.stop()
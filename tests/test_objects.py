@@ -1,6 +1,14 @@
+import hashlib
+import json
+import random
+
+import pytest
+
 from kpkontrol import actions, objects, timecode
+from kpkontrol.objects import Clip, ClipIndex
 from kpkontrol.parameters import (
     ParameterBase, EnumParameter, ParameterEnumItem, IntParameter, StrParameter,
+    parse_crap_json,
 )
 
 def get_base_attr_data():
@@ -83,6 +91,73 @@ def test_enum_parameter(parameter_test_data):
 
         assert param.format_value(item.value) == param.format_value(item.name) == item.name
 
+def test_attribute_data_cache():
+    names, ordered_names, defaults, mutable_defaults = ParameterBase._get_attribute_data()
+    assert ParameterBase._get_attribute_data() is ParameterBase._get_attribute_data()
+    assert '_attribute_data_' in ParameterBase.__dict__
+    assert set(ordered_names) == names == ParameterBase._build_attribute_data()[0]
+    assert mutable_defaults == set(['class_names', 'relations'])
+
+    # Subclasses build their own
+    int_names = IntParameter._get_attribute_data()[0]
+    assert int_names >= names
+    assert int_names != names
+
+    # Mutable defaults are copied per instance
+    param1 = ParameterBase(id='a')
+    param2 = ParameterBase(id='b')
+    assert param1.class_names == param2.class_names == []
+    param1.class_names.append('foo')
+    assert param2.class_names == []
+    assert defaults['class_names'] == []
+
+def test_device_enum_items(parameter_test_data):
+    parameter_test_data['param_type'] = 'enum'
+    parameter_test_data['enum_values'] = [
+        {'value':i, 'short_text':'item{}'.format(i), 'text':'Item {}'.format(i)}
+        for i in range(16)
+    ]
+    param = ParameterBase.from_json(parameter_test_data)
+    device_param = objects.DeviceParameter.create(parameter=param)
+
+    assert isinstance(device_param, objects.DeviceEnumParameter)
+    items = device_param.enum_items
+    assert len(items) == 16
+    for item in items.values():
+        assert not hasattr(item, '__dict__')
+        assert item._events is None
+        assert not item.active
+
+    changes = []
+    def on_active(instance, value, **kwargs):
+        changes.append((instance.name, value))
+    for name in ['item0', 'item1', 'item2']:
+        items[name].bind(active=on_active)
+    assert items['item3']._events is None
+
+    device_param.process_response(param.enum_items['item0'])
+    assert device_param.value is items['item0']
+    assert items['item0'].active
+    assert changes == [('item0', True)]
+
+    changes.clear()
+    device_param.process_response(param.enum_items['item1'])
+    assert not items['item0'].active
+    assert items['item1'].active
+    assert changes == [('item0', False), ('item1', True)]
+
+    # Items without bindings are skipped
+    changes.clear()
+    device_param.process_response(param.enum_items['item5'])
+    assert changes == [('item1', False)]
+    assert items['item5'].active
+    assert sum(item.active for item in items.values()) == 1
+
+    items['item2'].unbind(on_active)
+    changes.clear()
+    device_param.process_response(param.enum_items['item2'])
+    assert not len(changes)
+
 def test_clip_format(clip_format_defs):
     for d in clip_format_defs:
         frame_rate = timecode.FrameRate(d['rate_fraction'].numerator, d['rate_fraction'].denominator)
@@ -96,3 +171,222 @@ def test_clip_format(clip_format_defs):
         assert clip_fmt1.height == clip_fmt2.height == d['height']
         assert clip_fmt1.interlaced is clip_fmt2.interlaced is d['interlaced']
         assert clip_fmt1.frame_rate == clip_fmt2.frame_rate == frame_rate
+
+def test_format_interning(clip_format_defs):
+    fr = timecode.FrameRate.from_float(29.97)
+    assert timecode.FrameRate.from_float('29.97') is fr
+    assert timecode.FrameRate(30000, 1001) is fr
+    assert fr.float_value == 30000 / 1001
+
+    ff = timecode.FrameFormat(rate=fr, drop_frame=True)
+    assert timecode.FrameFormat(rate=29.97, drop_frame=True) is ff
+    assert timecode.FrameFormat(rate=fr) is timecode.FrameFormat(rate=fr, drop_frame=False)
+    assert timecode.FrameFormat(rate=fr) is not ff
+    assert len(set([ff, timecode.FrameFormat(rate=fr, drop_frame=True)])) == 1
+    with pytest.raises(AttributeError):
+        ff.drop_frame = False
+
+    tc1 = timecode.Timecode.parse('01:00:00;00', fr)
+    tc2 = timecode.Timecode.parse('02:00:00;00', '29.97')
+    assert tc1.frame_format is tc2.frame_format is ff
+
+    for d in clip_format_defs:
+        fmt = objects.ClipFormat.from_string(d['format_string'])
+        assert objects.ClipFormat.from_string(d['format_string']) is fmt
+        assert objects.ClipFormat.get(
+            width=fmt.width, height=fmt.height, frame_rate=fmt.frame_rate,
+            interlaced=fmt.interlaced, fourcc=None,
+        ) is fmt
+        with pytest.raises(AttributeError):
+            fmt.width = 0
+
+    data = {
+        'width':'1920', 'height':'1080', 'framerate':'29.97',
+        'interlace':'1', 'fourcc':'apcn',
+    }
+    fmt = objects.ClipFormat.from_json(data)
+    assert objects.ClipFormat.from_json(data.copy()) is fmt
+    assert fmt.frame_rate is fr
+    assert objects.ClipFormat.from_json(dict(data, fourcc='apch')) is not fmt
+
+def test_parse_crap_json():
+    s = '''[
+        {value:"0", text:"Bar", short_text:"bar", selected:"false"},
+        {value:"1", text:"Baz", short_text:"baz", selected:"true"}
+    ];'''
+    assert parse_crap_json(s) == [
+        {'value':'0', 'text':'Bar', 'short_text':'bar', 'selected':'false'},
+        {'value':'1', 'text':'Baz', 'short_text':'baz', 'selected':'true'},
+    ]
+
+    data = {'value':1, 'value_name':'baz', 'str_value':None, 'ok':True, 'f':1.5}
+    assert parse_crap_json(json.dumps(data)) == data
+
+    assert parse_crap_json('{a:"b\\"c", d : [ ], "e":{f:-2}};') == {
+        'a':'b"c', 'd':[], 'e':{'f':-2},
+    }
+    assert parse_crap_json('{str_value:"foo\nbar"}') == {'str_value':'foobar'}
+
+    for s in ['', '{a:"1"', '[1 2]', '{a "1"}', '{a:"1"} x']:
+        with pytest.raises(ValueError):
+            parse_crap_json(s)
+
+def test_clip_differ():
+    def build_records(**kwargs):
+        records = []
+        for name, duration in kwargs.items():
+            data = {'clipname':name, 'duration':duration}
+            records.append((json.dumps(data), data))
+        return records
+
+    def run(records, apply=True):
+        body = json.dumps([text for text, data in records]).encode('UTF-8')
+        body_hash = hashlib.sha1(body).hexdigest()
+        statuses = {}
+        names = set()
+        for text, data in records:
+            status, name, h = differ.check_record(text, data)
+            names.add(name)
+            if status is None:
+                continue
+            statuses[name] = status
+            if apply:
+                differ.record_applied(name, h)
+        removed = differ.find_removed(names, body_hash)
+        if apply:
+            for name in removed:
+                differ.record_removed(name)
+            differ.finish(body_hash)
+        return statuses, removed
+
+    differ = objects.ClipDiffer()
+
+    statuses, removed = run(build_records(a='1', b='2'))
+    assert statuses == {'a':'added', 'b':'added'}
+    assert removed == []
+
+    statuses, removed = run(build_records(a='1', b='2'))
+    assert statuses == {}
+    assert removed == []
+
+    statuses, removed = run(build_records(a='1', b='3', c='4'))
+    assert statuses == {'b':'changed', 'c':'added'}
+    assert removed == []
+
+    statuses, removed = run(build_records(b='3'))
+    assert statuses == {}
+    assert set(removed) == {'a', 'c'}
+
+    # Changes are only recorded once applied
+    records = build_records(b='4', d='5')
+    statuses, removed = run(records, apply=False)
+    assert statuses == {'b':'changed', 'd':'added'}
+    text, data = records[0]
+    status, name, h = differ.check_record(text, data)
+    differ.record_applied(name, h)
+    statuses, removed = run(records)
+    assert statuses == {'d':'added'}
+
+def test_clip_index():
+    fr = timecode.FrameRate.from_float(29.97)
+    ff = timecode.FrameFormat(rate=fr, drop_frame=True)
+    other_ff = timecode.FrameFormat(rate=timecode.FrameRate.from_float(25), drop_frame=False)
+    rnd = random.Random(1)
+
+    def build_clip(name, start, duration, frame_format=ff):
+        return Clip(
+            name=name,
+            start_timecode=timecode.TimecodeValue(start, frame_format),
+            duration_tc=timecode.TimecodeValue(duration, frame_format),
+        )
+
+    clips = {}
+    for i in range(500):
+        name = 'clip_{}'.format(i)
+        clips[name] = build_clip(name, rnd.randrange(0, 100000), rnd.randrange(1, 2000))
+    index = ClipIndex(clips.values())
+
+    def check(index, clips):
+        assert len(index) == len(clips)
+        ordered = sorted(clips.values(), key=lambda c: (c.start_timecode.total_frames, c.name))
+        assert [c.name for c in index if c.start_timecode.frame_format is ff] == [
+            c.name for c in ordered if c.start_timecode.frame_format is ff
+        ]
+        for i in range(200):
+            start = rnd.randrange(-100, 105000)
+            end = start + rnd.randrange(1, 3000)
+            expected = [
+                c for c in ordered if c.start_timecode.frame_format is ff
+                and c.start_timecode.total_frames < end
+                and c.start_timecode.total_frames + c.duration_tc.total_frames > start
+            ]
+            result = index.clips_in_range(
+                timecode.TimecodeValue(start, ff), timecode.TimecodeValue(end, ff),
+            )
+            assert result == expected
+
+            containing = [
+                c for c in expected
+                if c.start_timecode.total_frames <= start < c.start_timecode.total_frames + c.duration_tc.total_frames
+            ]
+            clip = index.clip_at(timecode.TimecodeValue(start, ff))
+            if not len(containing):
+                assert clip is None
+            else:
+                assert clip is containing[-1]
+
+    check(index, clips)
+
+    # Incremental changes
+    for name in rnd.sample(sorted(clips.keys()), 100):
+        index.remove(clips.pop(name))
+    for name in rnd.sample(sorted(clips.keys()), 100):
+        clip = clips[name] = build_clip(name, rnd.randrange(0, 100000), rnd.randrange(1, 2000))
+        index.update(clip)
+    for i in range(500, 600):
+        name = 'clip_{}'.format(i)
+        clips[name] = build_clip(name, rnd.randrange(0, 100000), rnd.randrange(1, 2000))
+        index.add(clips[name])
+    check(index, clips)
+
+    # Timecode objects, strings and other frame formats
+    clip = build_clip('other', 1000, 100, other_ff)
+    index.add(clip)
+    clips[clip.name] = clip
+    assert index.clip_at(timecode.TimecodeValue(1050, other_ff)) is clip
+    assert index.clip_at(timecode.TimecodeValue(1100, other_ff)) is None
+    # Strings are parsed in each frame format
+    assert clip in index.clips_in_range('00:00:40:10', '00:00:40:11')
+    assert clip not in index.clips_in_range('00:00:44:00', '00:00:45:00')
+    assert clip in index.clips_in_range(timecode.TimecodeValue(0, other_ff), timecode.TimecodeValue(1001, other_ff))
+    tc = clips['clip_550'].start_timecode
+    assert index.clip_at(tc.to_timecode()) is index.clip_at(tc)
+    assert index.clip_at(tc) is not None
+    assert clip not in index.clips_in_range(tc, tc + 1)
+
+    index.remove('other')
+    assert other_ff not in index.trees
+    clips.pop('other')
+
+    # Clips updated in place (as KpDevice does) after their drop-frame flag
+    # changed are moved out of the tree they were indexed in
+    ndf = timecode.FrameFormat(rate=fr, drop_frame=False)
+    clip = clips['clip_550']
+    start = clip.start_timecode.total_frames
+    clip.start_timecode = timecode.TimecodeValue(start, ndf)
+    clip.duration_tc = timecode.TimecodeValue(clip.duration_tc.total_frames, ndf)
+    index.update(clip)
+    assert len(index) == len(clips)
+    assert list(index).count(clip) == 1
+    assert index.clip_at(timecode.TimecodeValue(start, ndf)) is clip
+    assert clip not in index.clips_in_range(
+        timecode.TimecodeValue(start, ff), timecode.TimecodeValue(start + 1, ff),
+    )
+    index.remove(clip)
+    assert ndf not in index.trees
+    clips.pop(clip.name)
+    check(index, clips)
+
+    index.clear()
+    assert not len(index)
+    assert index.clip_at(tc) is None
@@ -0,0 +1,101 @@
+import asyncio
+import pytest
+
+from kpkontrol.scheduler import PollScheduler, get_scheduler
+from kpkontrol.device import KpDevice
+
+@pytest.mark.asyncio
+async def test_scheduler_priority():
+    loop = asyncio.get_event_loop()
+    scheduler = PollScheduler(loop=loop, max_concurrent=1)
+
+    order = []
+    max_running = 0
+
+    def build_callback(name):
+        async def callback():
+            nonlocal max_running
+            max_running = max(max_running, scheduler.num_running)
+            order.append(name)
+            await asyncio.sleep(.01)
+        return callback
+
+    low = scheduler.add_task(build_callback('low'), 10, name='low', run_now=True)
+    high = scheduler.add_task(build_callback('high'), 10, name='high', priority=1, run_now=True)
+
+    while low.num_runs < 1 or high.num_runs < 1:
+        await asyncio.sleep(.01)
+
+    assert order == ['high', 'low']
+    assert max_running == 1
+
+    # Neither should run again until triggered
+    await asyncio.sleep(.1)
+    assert order == ['high', 'low']
+    low.trigger()
+    await asyncio.sleep(.1)
+    assert order == ['high', 'low', 'low']
+
+    # Shortening the interval takes effect without waiting out the old one
+    high.set_interval(.05)
+    await asyncio.sleep(.2)
+    assert order.count('high') >= 2
+
+    await scheduler.remove_task(low)
+    await scheduler.remove_task(high)
+    assert not len(scheduler.tasks)
+    await asyncio.sleep(.01)
+    assert scheduler._run_fut.done()
+
+@pytest.mark.asyncio
+async def test_scheduler_errors():
+    loop = asyncio.get_event_loop()
+    scheduler = PollScheduler(loop=loop)
+
+    async def callback():
+        raise Exception('oops')
+
+    task = scheduler.add_task(callback, .05, run_now=True)
+    while task.num_runs < 2:
+        await asyncio.sleep(.01)
+    assert task.num_errors == task.num_runs
+    assert str(task.last_error) == 'oops'
+    await scheduler.remove_task(task)
+
+@pytest.mark.asyncio
+async def test_device_poll_intervals(kp_http_server):
+    await kp_http_server.start()
+    loop = asyncio.get_event_loop()
+
+    device = KpDevice(host_address=kp_http_server.host_address)
+    device.record_settle_time = .2
+    await device.connect()
+
+    scheduler = get_scheduler(loop)
+    assert device.scheduler is scheduler
+    while not len(device.poll_tasks):
+        await asyncio.sleep(.01)
+    clips_task = device.poll_tasks['clips']
+    assert clips_task in scheduler.tasks
+
+    intervals = device.poll_intervals['clips']
+    assert device.poll_state == 'idle'
+    assert clips_task.interval == intervals['idle']
+
+    device.transport.recording = True
+    assert device.poll_state == 'recording'
+    assert clips_task.interval == intervals['recording']
+
+    device.transport.recording = False
+    assert device.poll_state == 'after_record'
+    assert clips_task.interval == intervals['after_record']
+
+    await asyncio.sleep(.3)
+    assert device.poll_state == 'idle'
+    assert clips_task.interval == intervals['idle']
+
+    await device.stop()
+    assert not len(device.poll_tasks)
+    assert clips_task not in scheduler.tasks
+
+    await kp_http_server.stop()
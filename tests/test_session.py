@@ -0,0 +1,97 @@
+import asyncio
+import pytest
+
+from kpkontrol import actions
+from kpkontrol.session import SessionPool, session_pool
+from kpkontrol.device import KpDevice
+
+@pytest.mark.asyncio
+async def test_pooled_actions(kp_http_server):
+    await kp_http_server.start()
+    host_address = kp_http_server.host_address
+
+    loop = asyncio.get_event_loop()
+
+    action1 = actions.GetClips(host_address)
+    await action1()
+    action2 = actions.GetClips(host_address)
+    await action2()
+
+    assert action1.session_borrowed and action2.session_borrowed
+    assert action1.session is action2.session
+    assert session_pool.owns(action1.session)
+
+    stats = session_pool.stats(loop)
+    assert stats.requests == 2
+    assert stats.connections_created == 1
+    assert stats.connections_reused == 1
+    assert stats.by_host[host_address]['reused'] == 1
+
+    # Explicitly passed sessions bypass the pool
+    session = action1.session
+    action3 = actions.GetClips(host_address, session=session)
+    await action3()
+    assert not action3.session_borrowed
+    assert stats.requests == 3
+
+    await session_pool.close(loop)
+    assert session.closed
+    assert session_pool.stats(loop) is None
+
+    # A closed pool session is replaced on next use
+    await action1()
+    assert action1.session is not session
+    assert not action1.session.closed
+
+    await session_pool.close(loop)
+    await kp_http_server.stop()
+
+@pytest.mark.asyncio
+async def test_idle_eviction():
+    loop = asyncio.get_event_loop()
+    pool = SessionPool(idle_timeout=.2)
+
+    session = pool.acquire(loop)
+    assert pool.acquire(loop) is session
+    pool.release(session)
+    await asyncio.sleep(.4)
+
+    # Still held once
+    assert pool.owns(session)
+    assert not session.closed
+
+    pool.release(session)
+    await asyncio.sleep(.1)
+    assert pool.get_session(loop) is session
+    await asyncio.sleep(.4)
+
+    assert not pool.owns(session)
+    assert session.closed
+
+@pytest.mark.asyncio
+async def test_device_borrows_session(kp_http_server):
+    await kp_http_server.start()
+    host_address = kp_http_server.host_address
+
+    loop = asyncio.get_event_loop()
+
+    device1 = KpDevice(host_address=host_address)
+    device2 = KpDevice(host_address=host_address)
+    await device1.connect()
+    await device2.connect()
+
+    assert device1.session_borrowed and device2.session_borrowed
+    assert device1.session is device2.session
+    assert device1.connection_stats is session_pool.stats(loop)
+    assert device1.connection_stats.connections_reused > 0
+
+    session = device1.session
+    await device1.stop()
+    assert device1.session is None
+    assert not session.closed
+
+    await device2.stop()
+    assert not session.closed
+
+    await session_pool.close(loop)
+    await kp_http_server.stop()
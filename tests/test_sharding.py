@@ -0,0 +1,111 @@
+import asyncio
+import pytest
+
+from kpkontrol.sharding import ShardedFleet, DeviceProxy, RemoteError
+
+@pytest.mark.asyncio
+async def test_sharded_fleet(kp_http_device_servers):
+    server_devices = []
+    for server in kp_http_device_servers.values():
+        server.device.listen_timeout = 2.
+        await server.start()
+        server_devices.append(server.device)
+    for device in server_devices[:]:
+        await device.build_network_services_data(server_devices)
+
+    servers_by_addr = {s.host_address:s for s in kp_http_device_servers.values()}
+
+    fleet = ShardedFleet(host_addresses=list(servers_by_addr.keys()), num_shards=2)
+
+    clip_events = []
+    def on_clip_added(device, clip, **kwargs):
+        clip_events.append((device.host_address, clip.name))
+    events_received = {}
+    def on_events_received(device, events, **kwargs):
+        data = events.get('eParamID_DisplayTimecode')
+        if data is not None:
+            events_received[device.host_address] = data
+    fleet.bind(on_clip_added=on_clip_added, on_events_received=on_events_received)
+
+    # Devices are spread across the shards
+    shards = set([d.shard for d in fleet.devices.values()])
+    assert len(shards) == 2
+
+    await asyncio.wait_for(fleet.connect(), 30)
+    assert not len(fleet.connect_errors)
+    for device in fleet.devices.values():
+        assert isinstance(device, DeviceProxy)
+        assert device.connected
+
+    async def wait_for(f):
+        while not f():
+            await asyncio.sleep(.05)
+
+    # State from the initial parameter fetch is sent to the coordinator
+    await asyncio.wait_for(
+        wait_for(lambda: all('eParamID_SysName' in d.all_parameters for d in fleet.devices.values())), 5.,
+    )
+    for host_address, device in fleet.devices.items():
+        param = device.all_parameters['eParamID_SysName']
+        assert param.value == servers_by_addr[host_address].device.name
+
+    received = {}
+    def on_parameter_value(device, param, value, **kwargs):
+        if param.id == 'eParamID_DisplayTimecode' and value == '01:00:00;00':
+            received[device.host_address] = value
+    fleet.bind(on_parameter_value=on_parameter_value)
+
+    for server in servers_by_addr.values():
+        await server.device.set_formatted_value('eParamID_DisplayTimecode', '01:00:00;00')
+    await asyncio.wait_for(wait_for(lambda: len(received) == len(servers_by_addr)), 5.)
+
+    # Device events are forwarded with the same payloads as KpFleet
+    await asyncio.wait_for(wait_for(lambda: len(events_received) == len(servers_by_addr)), 5.)
+    for host_address, data in events_received.items():
+        device = fleet.devices[host_address]
+        assert data['parameter'] is device.all_parameters['eParamID_DisplayTimecode']
+    expected_clips = set()
+    for host_address, server in servers_by_addr.items():
+        for name in server.device.clips.keys():
+            expected_clips.add((host_address, name))
+    assert set(clip_events) == expected_clips
+    for host_address, name in clip_events:
+        clip = fleet.devices[host_address].clips[name]
+        assert clip.start_timecode == str(servers_by_addr[host_address].device.clips[name].start_timecode)
+
+    # Commands are routed to the shard owning each device
+    results = await fleet.get_parameter('eParamID_SysName')
+    for host_address, value in results.items():
+        assert value == servers_by_addr[host_address].device.name
+
+    results = await fleet.set_parameter('eParamID_GangList', 'foo')
+    assert set(results.keys()) == set(servers_by_addr.keys())
+    for server in servers_by_addr.values():
+        assert server.device.get_parameter_value('eParamID_GangList') == 'foo'
+
+    results = await fleet.get_parameter('eParamID_NotAParameter')
+    for result in results.values():
+        assert isinstance(result, RemoteError)
+
+    results = await fleet.play()
+    assert not any(isinstance(r, Exception) for r in results.values())
+    await asyncio.wait_for(
+        wait_for(lambda: all(d.transport_str == 'Playing Forward' for d in fleet.devices.values())), 5.,
+    )
+
+    device = fleet.devices[sorted(fleet.devices.keys())[0]]
+    results = await fleet.stop_transport(devices=[device])
+    assert list(results.keys()) == [device.host_address]
+
+    await fleet.remove_device(device)
+    assert device.host_address not in fleet.devices
+    assert not device.connected
+
+    await asyncio.wait_for(fleet.stop(), 30)
+    for shard in fleet.shards:
+        assert shard.process is None
+    for device in fleet.devices.values():
+        assert not device.connected
+
+    for server in kp_http_device_servers.values():
+        await server.stop()
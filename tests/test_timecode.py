@@ -1,4 +1,5 @@
 import asyncio
+import pickle
 import pytest
 from kpkontrol import timecode
 
@@ -167,3 +168,112 @@ async def test_timecode_freerun(frame_rate_defs):
     assert stop_event.is_set()
     assert tc._freerunning is None
     assert tc._freerun_stopped is None
+
+@pytest.mark.asyncio
+async def test_frame_clock():
+    loop = asyncio.get_event_loop()
+    clock = timecode.get_frame_clock(loop)
+
+    ff_25 = timecode.FrameFormat(rate=timecode.FrameRate.from_float(25))
+    ff_30 = timecode.FrameFormat(rate=timecode.FrameRate.from_float(30))
+    tcs_25 = [timecode.Timecode(frame_format=ff_25) for i in range(3)]
+    tc_30 = timecode.Timecode(frame_format=ff_30)
+
+    changes = []
+    def on_change(tc, total_frames, **kwargs):
+        changes.append((total_frames, kwargs['old']))
+    tcs_25[0].bind(on_change=on_change)
+
+    for tc in tcs_25 + [tc_30]:
+        await tc.start_freerun()
+
+    # Timecodes with the same rate share one group (and timer)
+    assert len(clock.groups) == 2
+    group = tcs_25[0].frame_clock_group
+    assert all(tc.frame_clock_group is group for tc in tcs_25)
+    assert tc_30.frame_clock_group is not group
+
+    await asyncio.sleep(.5)
+    values = set([tc.total_frames for tc in tcs_25])
+    assert len(values) == 1
+
+    # Frames missed while the timer is late arrive as a single jump. The
+    # timer is held back here instead of blocking the loop.
+    group.handle.cancel()
+    num_changes = len(changes)
+    start_frames = tcs_25[0].total_frames
+    await asyncio.sleep(.4)
+    assert len(changes) == num_changes
+    group._tick()
+    assert len(changes) == num_changes + 1
+    total_frames, old = changes[-1]
+    assert old == start_frames
+    assert total_frames - old >= 9
+
+    for tc in tcs_25 + [tc_30]:
+        await tc.stop_freerun()
+    assert not len(clock.groups)
+    assert group.handle is None
+
+def test_timecode_value(frame_rate_defs):
+    frac_val = frame_rate_defs['fraction']
+    fr = timecode.FrameRate(frac_val.numerator, frac_val.denominator)
+    if frac_val.denominator == 1001 and frac_val.numerator in [30000, 60000]:
+        df_flags = [True, False]
+    else:
+        df_flags = [False]
+    for df in df_flags:
+        frame_format = timecode.FrameFormat(rate=fr, drop_frame=df)
+        sep = ';' if df else ':'
+        tc_str = sep.join(['01:02:03', '04'])
+        tc = timecode.Timecode.parse(tc_str, fr, df)
+        value = timecode.TimecodeValue.parse(tc_str, fr, df)
+
+        assert value.total_frames == tc.total_frames
+        assert value.frame_format is frame_format
+        assert str(value) == str(tc) == tc_str
+        assert value.get_hmsf_values() == tc.get_hmsf_values()
+        assert value.total_seconds == tc.total_seconds
+        assert value.timedelta == tc.timedelta
+        assert value.datetime == tc.datetime
+        assert timecode.TimecodeValue.from_timecode(tc) == value
+
+        # Comparisons with Timecode objects and frame counts
+        assert value == tc and tc == value
+        assert value == tc.total_frames
+        assert value < tc.total_frames + 1
+        tc.incr()
+        assert value < tc and tc > value
+        assert value != tc
+        assert value.copy() is value
+
+        # Arithmetic returns new values
+        one_hour = timecode.TimecodeValue.parse('01:00:00:00', fr, df)
+        assert isinstance(value + 1, timecode.TimecodeValue)
+        assert (value + 1).total_frames == value.total_frames + 1
+        assert (1 + value) == value + 1
+        assert (value - one_hour).total_frames == value.total_frames - one_hour.total_frames
+        assert (value + one_hour) - one_hour == value
+        assert sorted([value + 2, value, value + 1]) == [value, value + 1, value + 2]
+
+        # Hashable and immutable
+        assert hash(value) == hash(timecode.TimecodeValue.parse(tc_str, fr, df))
+        assert len(set([value, timecode.TimecodeValue.parse(tc_str, fr, df)])) == 1
+        with pytest.raises(AttributeError):
+            value.total_frames = 0
+        with pytest.raises(AttributeError):
+            value.foo = 0
+        assert pickle.loads(pickle.dumps(value)) == value
+
+        # Values with different formats can't be compared
+        other_format = timecode.FrameFormat(rate=fr, drop_frame=not df)
+        other = timecode.TimecodeValue(value.total_frames, other_format)
+        assert other != value
+        with pytest.raises(TypeError):
+            value < other
+
+        observable = value.to_timecode()
+        assert isinstance(observable, timecode.Timecode)
+        assert observable == value
+        observable.incr()
+        assert observable > value
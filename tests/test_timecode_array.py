@@ -0,0 +1,100 @@
+import datetime
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from kpkontrol import timecode
+from kpkontrol import timecode_array
+
+FRAME_FORMATS = [
+    (flt_val, drop_frame)
+    for flt_val in sorted(timecode.FrameRate.defaults.keys())
+    for drop_frame in [False, True]
+]
+
+def build_frame_format(flt_val, drop_frame):
+    fr = timecode.FrameRate.from_float(flt_val)
+    return timecode.FrameFormat(rate=fr, drop_frame=drop_frame)
+
+def sample_frames(rng, frame_format, size):
+    # Random values over more than 24 hours plus the areas around minute
+    # and ten minute boundaries where drop-frame numbering changes
+    fr = frame_format.rate.rounded
+    day = fr * 60 * 60 * 25
+    values = [rng.integers(0, day, size)]
+    for boundary in [fr * 60, int(frame_format.rate * 60), int(frame_format.rate * 600)]:
+        starts = rng.integers(0, 24 * 6, size // 10) * boundary
+        offsets = rng.integers(-5, 6, starts.size)
+        values.append(starts + offsets)
+    values.append(np.arange(fr * 2))
+    values = np.concatenate(values)
+    return values[values >= 0]
+
+@pytest.mark.parametrize('flt_val,drop_frame', FRAME_FORMATS)
+def test_frames_conversions(flt_val, drop_frame):
+    rng = np.random.default_rng(int(flt_val * 100) + drop_frame)
+    frame_format = build_frame_format(flt_val, drop_frame)
+    total_frames = sample_frames(rng, frame_format, 300)
+
+    hmsf = timecode_array.frames_to_hmsf(total_frames, frame_format)
+    strings = timecode_array.frames_to_strings(total_frames, frame_format)
+    seconds = timecode_array.frames_to_seconds(total_frames, frame_format)
+    timedeltas = timecode_array.frames_to_timedeltas(total_frames, frame_format)
+    assert strings.shape == seconds.shape == timedeltas.shape == total_frames.shape
+
+    for i, total in enumerate(total_frames.tolist()):
+        tc = timecode.Timecode.from_frames(total, frame_format)
+        assert hmsf[i].tolist() == tc.get_hmsf_values()
+        assert strings[i] == str(tc)
+        assert seconds[i] == tc.total_seconds
+        assert timedeltas[i].item() == tc.timedelta
+
+    assert timecode_array.hmsf_to_frames(hmsf, frame_format).tolist() == [
+        timecode.Timecode(
+            frame_format=frame_format, hours=h, minutes=m, seconds=s, frames=f,
+        ).total_frames for h, m, s, f in hmsf.tolist()
+    ]
+
+@pytest.mark.parametrize('flt_val,drop_frame', FRAME_FORMATS)
+def test_strings_to_frames(flt_val, drop_frame):
+    rng = np.random.default_rng(int(flt_val * 100) + drop_frame)
+    frame_format = build_frame_format(flt_val, drop_frame)
+    fr = frame_format.rate
+
+    # Random (not necessarily valid) labels, including dropped frame numbers
+    size = 500
+    hmsf = np.stack([
+        rng.integers(0, 24, size), rng.integers(0, 60, size),
+        rng.integers(0, 60, size), rng.integers(0, fr.rounded, size),
+    ], axis=-1)
+    hmsf[:size//4, 2] = 0
+    hmsf[:size//4, 3] %= 5
+    sep = ';' if drop_frame else ':'
+    strings = ['{:02d}:{:02d}:{:02d}{}{:02d}'.format(h, m, s, sep, f) for h, m, s, f in hmsf.tolist()]
+    # Non-canonical strings use the slow path
+    strings.extend(['1:2:3:4', '1;2;3;4', '01:02', '0:0:0:0:5'])
+
+    result = timecode_array.strings_to_frames(strings, fr)
+    for s, total in zip(strings, result.tolist()):
+        assert total == timecode.Timecode.parse(s, fr).total_frames
+
+    result = timecode_array.strings_to_frames(np.array(strings).reshape(-1, 2), fr, drop_frame=drop_frame)
+    assert result.shape == (len(strings) // 2, 2)
+    for s, total in zip(strings, result.ravel().tolist()):
+        assert total == timecode.Timecode.parse(s, fr, drop_frame).total_frames
+
+    total_frames = sample_frames(rng, frame_format, 300)
+    total_frames = total_frames[total_frames < fr.rounded * 60 * 60 * 24]
+    strings = timecode_array.frames_to_strings(total_frames, frame_format)
+    result = timecode_array.strings_to_frames(strings, fr, drop_frame)
+    assert result.tolist() == [
+        timecode.Timecode.parse(s, fr, drop_frame).total_frames for s in strings.tolist()
+    ]
+    # Drop-frame numbering is only defined (and reversible) for 29.97 and 59.94
+    if not drop_frame or (fr.denom == 1001 and fr.rounded in [30, 60]):
+        assert np.array_equal(result, total_frames)
+
+def test_invalid_strings():
+    with pytest.raises(ValueError):
+        timecode_array.strings_to_frames(['00:00:00:0x'], 25)
+    assert timecode_array.strings_to_frames([], 25).shape == (0,)
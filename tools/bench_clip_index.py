@@ -0,0 +1,58 @@
+import argparse
+import random
+import timeit
+
+from kpkontrol.timecode import FrameRate, FrameFormat, TimecodeValue
+from kpkontrol.objects import Clip, ClipIndex
+
+def build_clips(num_clips, frame_format):
+    # Back to back takes with gaps, like a card recorded with record-run TC
+    clips = []
+    start = 0
+    for i in range(num_clips):
+        duration = random.randrange(300, 20000)
+        clips.append(Clip(
+            name='A001C{:05d}.mov'.format(i),
+            start_timecode=TimecodeValue(start, frame_format),
+            duration_tc=TimecodeValue(duration, frame_format),
+        ))
+        start += duration + random.randrange(0, 100)
+    return clips, start
+
+def linear_clip_at(clips, tc):
+    result = None
+    for clip in clips:
+        start = clip.start_timecode.total_frames
+        if start <= tc.total_frames < start + clip.duration_tc.total_frames:
+            if result is None or start > result.start_timecode.total_frames:
+                result = clip
+    return result
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('--clips', dest='clips', type=int, nargs='+', default=[100, 1000, 10000])
+    p.add_argument('--queries', dest='queries', type=int, default=1000)
+    args = p.parse_args()
+
+    random.seed(0)
+    frame_format = FrameFormat(rate=FrameRate.from_float(29.97), drop_frame=True)
+    for num_clips in args.clips:
+        clips, end = build_clips(num_clips, frame_format)
+        queries = [TimecodeValue(random.randrange(0, end), frame_format) for i in range(args.queries)]
+
+        t = min(timeit.repeat(lambda: ClipIndex(clips), number=1, repeat=3))
+        build_time = t / num_clips
+        index = ClipIndex(clips)
+        for tc in queries[:100]:
+            assert index.clip_at(tc) is linear_clip_at(clips, tc)
+
+        t = min(timeit.repeat(lambda: [index.clip_at(tc) for tc in queries], number=1, repeat=3))
+        index_time = t / len(queries)
+        t = min(timeit.repeat(lambda: [linear_clip_at(clips, tc) for tc in queries], number=1, repeat=1))
+        linear_time = t / len(queries)
+        print('{:>6} clips: insert {:6.1f} us, clip_at {:6.1f} us, linear scan {:9.1f} us'.format(
+            num_clips, build_time * 1e6, index_time * 1e6, linear_time * 1e6,
+        ))
+
+if __name__ == '__main__':
+    main()
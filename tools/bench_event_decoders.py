@@ -0,0 +1,129 @@
+import os
+import argparse
+import json
+import random
+import timeit
+
+from kpkontrol.actions import ListenForEvents
+from kpkontrol.parameters import ParameterBase, EnumParameter, IntParameter
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+PARAMS_FILE = os.path.join(TOOLS_DIR, '..', 'tests', 'data', 'kp-params-flat.json')
+
+def process_events_legacy(all_parameters, data):
+    # The previous ListenForEvents.process_response, kept for comparison
+    params = {}
+    for d in data:
+        if 'services' in d:
+            param = all_parameters['by_id']['eParamID_NetworkServices']
+            _d = {'parameter':param, 'value':d['services']}
+            params[param.id] = _d
+            continue
+        if 'param_id' not in d:
+            continue
+        if 'str_value' not in d:
+            continue
+        param = all_parameters['by_id'][d['param_id']]
+        _d = {'parameter':param}
+        if isinstance(param, IntParameter):
+            _d['value'] = int(d['int_value'])
+        elif isinstance(param, EnumParameter):
+            _d['value'] = param.enum_items_by_value[int(d['int_value'])]
+        else:
+            _d['value'] = d['str_value']
+        params[param.id] = _d
+    return params
+
+def load_parameters(filename):
+    with open(filename, 'r') as f:
+        data = json.load(f)
+    by_id = {}
+    for d in data:
+        param = ParameterBase.from_json(d)
+        by_id[param.id] = param
+    return {'by_id':by_id}
+
+def build_event(param):
+    if isinstance(param, EnumParameter):
+        item = random.choice(list(param.enum_items.values()))
+        return {'param_id':param.id, 'int_value':str(item.value), 'str_value':item.description}
+    elif isinstance(param, IntParameter):
+        v = random.randint(0, 100)
+        return {'param_id':param.id, 'int_value':str(v), 'str_value':str(v)}
+    return {'param_id':param.id, 'int_value':'0', 'str_value':'foo'}
+
+def build_bursts(all_parameters, num_bursts, burst_size):
+    params = [
+        p for p in all_parameters['by_id'].values()
+        if p.param_type in ['enum', 'integer', 'string'] and p.id != 'eParamID_NetworkServices'
+        and (not isinstance(p, EnumParameter) or len(p.enum_items))
+    ]
+    # Timecode and transport state dominate real event traffic
+    hot = [all_parameters['by_id'][k] for k in ['eParamID_DisplayTimecode', 'eParamID_TransportState']]
+    bursts = []
+    for i in range(num_bursts):
+        burst = [build_event(p) for p in hot]
+        burst.extend(build_event(random.choice(params)) for j in range(burst_size - len(hot)))
+        bursts.append(burst)
+    return bursts
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('-n', '--number', dest='number', type=int, default=20)
+    p.add_argument('-r', '--repeat', dest='repeat', type=int, default=5)
+    p.add_argument('--params', dest='params', default=PARAMS_FILE, help='Descriptor json file')
+    p.add_argument(
+        '--events', dest='events',
+        help='Recorded event bursts (json list of wait_for_config_events responses)',
+    )
+    p.add_argument('--bursts', dest='bursts', type=int, default=1000)
+    p.add_argument('--burst-size', dest='burst_size', type=int, default=8)
+    args = p.parse_args()
+
+    all_parameters = load_parameters(args.params)
+    if args.events:
+        with open(args.events, 'r') as f:
+            bursts = json.load(f)
+    else:
+        random.seed(0)
+        bursts = build_bursts(all_parameters, args.bursts, args.burst_size)
+
+    action = ListenForEvents('localhost', all_parameters=all_parameters)
+    action.build_decoders()
+    apply_action = ListenForEvents('localhost', all_parameters=all_parameters, apply_values=True)
+    apply_action.build_decoders()
+
+    num_events = sum(len(b) for b in bursts)
+    print('{} bursts, {} events'.format(len(bursts), num_events))
+    def legacy_apply(burst):
+        # What KpDevice.listen_for_events does with the legacy payload
+        by_id = all_parameters['by_id']
+        for param_id, d in process_events_legacy(all_parameters, burst).items():
+            by_id[param_id].value = d['value']
+    funcs = [
+        ('legacy', lambda b: process_events_legacy(all_parameters, b)),
+        ('decoders', action.decode_events),
+        ('legacy+apply', legacy_apply),
+        ('apply_values', apply_action.decode_events),
+    ]
+    def build_run(func):
+        def run():
+            for burst in bursts:
+                func(burst)
+        return run
+    # The repeats are interleaved so both see the same machine load
+    times = {name:[] for name, func in funcs}
+    for i in range(args.repeat):
+        for name, func in funcs:
+            times[name].append(timeit.timeit(build_run(func), number=args.number))
+    results = {}
+    for name, func in funcs:
+        t = results[name] = min(times[name]) / args.number
+        print('{:>12}: {:8.3f} us per event'.format(name, t / num_events * 1e6))
+    print('speedup: {:.2f}x, with apply_values: {:.2f}x'.format(
+        results['legacy'] / results['decoders'],
+        results['legacy+apply'] / results['apply_values'],
+    ))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import os
+import argparse
+import json
+import time
+import tracemalloc
+
+from kpkontrol.parameters import ParameterBase
+from kpkontrol.objects import DeviceParameter, LazyParameterMap
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+PARAMS_FILE = os.path.join(TOOLS_DIR, '..', 'tests', 'data', 'kp-params-flat.json')
+
+class FakeDevice(object):
+    # Stand-in for KpDevice, only what DeviceParameter needs
+    def _on_device_parameter_value(self, *args, **kwargs):
+        pass
+
+def load_parameters(filename):
+    with open(filename, 'r') as f:
+        data = json.load(f)
+    by_id = {}
+    for d in data:
+        param = ParameterBase.from_json(d)
+        by_id[param.id] = param
+    return by_id
+
+def build_device_parameter(device, param):
+    device_param = DeviceParameter.create(device=device, parameter=param)
+    device_param.bind(value=device._on_device_parameter_value)
+    return device_param
+
+def build_eager(descriptors, device):
+    return {
+        param_id:build_device_parameter(device, param)
+        for param_id, param in descriptors.items()
+    }
+
+def build_lazy(descriptors, device, touched):
+    m = LazyParameterMap(
+        descriptors=descriptors,
+        factory=lambda param: build_device_parameter(device, param),
+    )
+    for param_id in touched:
+        m[param_id]
+    return m
+
+def measure(f, num_devices):
+    tracemalloc.start()
+    start_ts = time.perf_counter()
+    objs = [f() for _ in range(num_devices)]
+    elapsed = time.perf_counter() - start_ts
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, size, objs
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('--params', dest='params', default=PARAMS_FILE)
+    p.add_argument('--devices', dest='devices', type=int, default=20)
+    p.add_argument(
+        '--touched', dest='touched', type=int, default=30,
+        help='Number of parameters accessed per device in lazy mode',
+    )
+    args = p.parse_args()
+
+    descriptors = load_parameters(args.params)
+    touched = sorted(descriptors.keys())[:args.touched]
+    print('{} descriptors, {} devices, {} touched'.format(
+        len(descriptors), args.devices, len(touched),
+    ))
+    results = {}
+    funcs = [
+        ('eager', lambda: build_eager(descriptors, FakeDevice())),
+        ('lazy', lambda: build_lazy(descriptors, FakeDevice(), touched)),
+    ]
+    for name, func in funcs:
+        elapsed, size, objs = measure(func, args.devices)
+        results[name] = (elapsed, size)
+        print('{:>6}: {:8.2f} ms per device, {:8.1f} KiB per device'.format(
+            name, elapsed / args.devices * 1e3, size / args.devices / 1024,
+        ))
+    print('time: {:.1f}x, memory: {:.1f}x'.format(
+        results['eager'][0] / results['lazy'][0],
+        results['eager'][1] / results['lazy'][1],
+    ))
+
+if __name__ == '__main__':
+    main()
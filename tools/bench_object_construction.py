@@ -0,0 +1,80 @@
+import os
+import argparse
+import json
+import timeit
+
+from kpkontrol.base import ObjectBase
+from kpkontrol.parameters import ParameterBase
+from kpkontrol.objects import Clip
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+PARAMS_FILE = os.path.join(TOOLS_DIR, '..', 'tests', 'data', 'kp-params-flat.json')
+
+CLIP_DATA = {
+    'format':'1920x1080i29.97', 'timestamp':'08/05/17 18:59:16', 'height':'1080',
+    'duration':'00:34:09:20', 'clipname':'A003SC10TK22.mov', 'framerate':'29.97',
+    'width':'1920', 'interlace':'1', 'fourcc':'apcn', 'framecount':'61429',
+    'attributes':{
+        'Audio Chan':'2', 'CC':'0', 'Format':'1920x1080i29.97',
+        'Starting TC':'18:25:06;12', 'Encode Type':'0',
+    },
+}
+
+def legacy_init(self, **kwargs):
+    # ObjectBase.__init__ before per-class caching
+    names, defaults = self._build_attribute_data()
+    self.attribute_names_ = names
+    for key in names:
+        val = kwargs.get(key, defaults.get(key))
+        setattr(self, key, val)
+
+def count_objects(f):
+    count = 0
+    cached_init = ObjectBase.__init__
+    def counting_init(self, **kwargs):
+        nonlocal count
+        count += 1
+        cached_init(self, **kwargs)
+    ObjectBase.__init__ = counting_init
+    try:
+        f()
+    finally:
+        ObjectBase.__init__ = cached_init
+    return count
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('--params', dest='params', default=PARAMS_FILE)
+    p.add_argument('--clips', dest='clips', type=int, default=500)
+    p.add_argument('--number', dest='number', type=int, default=5)
+    p.add_argument('--repeat', dest='repeat', type=int, default=3)
+    args = p.parse_args()
+
+    with open(args.params, 'r') as f:
+        param_data = json.load(f)
+
+    def load_descriptors():
+        for d in param_data:
+            ParameterBase.from_json(d)
+    def parse_clips():
+        for i in range(args.clips):
+            Clip.from_json(CLIP_DATA)
+
+    cached_init = ObjectBase.__init__
+    for name, func in [('descriptors', load_descriptors), ('clips', parse_clips)]:
+        num_objects = count_objects(func)
+        results = {}
+        for impl, init in [('legacy', legacy_init), ('cached', cached_init)]:
+            ObjectBase.__init__ = init
+            try:
+                t = min(timeit.repeat(func, number=args.number, repeat=args.repeat)) / args.number
+            finally:
+                ObjectBase.__init__ = cached_init
+            results[impl] = t
+            print('{:>12} {:>7}: {:8.1f} ms, {:10.0f} objects/s'.format(
+                name, impl, t * 1e3, num_objects / t,
+            ))
+        print('{:>12} speedup: {:.2f}x'.format(name, results['legacy'] / results['cached']))
+
+if __name__ == '__main__':
+    main()
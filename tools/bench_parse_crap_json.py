@@ -0,0 +1,74 @@
+import os
+import argparse
+import json
+import re
+import timeit
+
+from kpkontrol.parameters import parse_crap_json
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+PARAMS_FILE = os.path.join(TOOLS_DIR, '..', 'tests', 'data', 'kp-params-flat.json')
+
+def parse_crap_json_legacy(s):
+    # The previous implementation, kept here for comparison
+    def split_quotes(_s):
+        pre = None
+        while '"' in _s:
+            start, sep, _s = _s.partition('"')
+            if pre is None:
+                pre = start
+            else:
+                yield pre, '"{}"'.format(start)
+                pre = None
+        yield _s, ''
+    s = ''.join(s.splitlines()).strip(';')
+    cleaned = ''
+    c = re.compile('([a-zA-Z_]+):')
+    for non_quoted, quoted in split_quotes(s):
+        non_quoted = c.sub(r'"\1":', non_quoted)
+        cleaned = ''.join([cleaned, non_quoted, quoted])
+    return json.loads(cleaned)
+
+def build_enum_responses(filename):
+    with open(filename, 'r') as f:
+        data = json.load(f)
+    responses = []
+    for param in data:
+        if param['param_type'] != 'enum' or not len(param['enum_values']):
+            continue
+        lines = ['[']
+        for item in param['enum_values']:
+            item = item.copy()
+            item['selected'] = str(item['value'] == param['default_value']).lower()
+            s = 'value:"{value}", text:"{text}", short_text:"{short_text}", selected:"{selected}"'.format(**item)
+            lines.append('{%s},' % (s))
+        lines[-1] = lines[-1].rstrip(',')
+        lines.append('];')
+        responses.append('\n'.join(lines))
+    return responses
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('-n', '--number', dest='number', type=int, default=20)
+    p.add_argument('-r', '--repeat', dest='repeat', type=int, default=5)
+    p.add_argument('--params', dest='params', default=PARAMS_FILE, help='Descriptor json file')
+    args = p.parse_args()
+
+    responses = build_enum_responses(args.params)
+    total_bytes = sum(len(s) for s in responses)
+    for s in responses:
+        assert parse_crap_json(s) == parse_crap_json_legacy(s)
+
+    print('{} enum responses, {} bytes'.format(len(responses), total_bytes))
+    results = {}
+    for name, func in [('legacy', parse_crap_json_legacy), ('single-pass', parse_crap_json)]:
+        def run():
+            for s in responses:
+                func(s)
+        t = min(timeit.repeat(run, number=args.number, repeat=args.repeat)) / args.number
+        results[name] = t
+        print('{:>12}: {:8.3f} ms per pass'.format(name, t * 1000))
+    print('speedup: {:.2f}x'.format(results['legacy'] / results['single-pass']))
+
+if __name__ == '__main__':
+    main()
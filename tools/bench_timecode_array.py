@@ -0,0 +1,48 @@
+import argparse
+import timeit
+
+import numpy as np
+
+from kpkontrol.timecode import FrameRate, FrameFormat, Timecode
+from kpkontrol import timecode_array
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('--rate', dest='rate', type=float, default=29.97)
+    p.add_argument('--drop-frame', dest='drop_frame', action='store_true')
+    p.add_argument('--count', dest='count', type=int, default=100000)
+    p.add_argument('--scalar-count', dest='scalar_count', type=int, default=5000)
+    p.add_argument('--repeat', dest='repeat', type=int, default=3)
+    args = p.parse_args()
+
+    frame_format = FrameFormat(rate=FrameRate.from_float(args.rate), drop_frame=args.drop_frame)
+    rng = np.random.default_rng(0)
+    max_frames = frame_format.rate.rounded * 60 * 60 * 24
+    total_frames = rng.integers(0, max_frames, args.count)
+    strings = timecode_array.frames_to_strings(total_frames, frame_format)
+    scalar_frames = total_frames[:args.scalar_count].tolist()
+    scalar_strings = strings[:args.scalar_count].tolist()
+
+    tests = [
+        ('to strings',
+            lambda: [str(Timecode.from_frames(f, frame_format)) for f in scalar_frames],
+            lambda: timecode_array.frames_to_strings(total_frames, frame_format)),
+        ('from strings',
+            lambda: [Timecode.parse(s, frame_format.rate, args.drop_frame).total_frames for s in scalar_strings],
+            lambda: timecode_array.strings_to_frames(strings, frame_format.rate, args.drop_frame)),
+        ('to seconds',
+            lambda: [Timecode.from_frames(f, frame_format).total_seconds for f in scalar_frames],
+            lambda: timecode_array.frames_to_seconds(total_frames, frame_format)),
+    ]
+    print(frame_format)
+    for name, scalar_func, array_func in tests:
+        t = min(timeit.repeat(scalar_func, number=1, repeat=args.repeat))
+        scalar_rate = len(scalar_frames) / t
+        t = min(timeit.repeat(array_func, number=1, repeat=args.repeat))
+        array_rate = len(total_frames) / t
+        print('{:>14}: scalar {:12.0f}/s, array {:12.0f}/s ({:.0f}x)'.format(
+            name, scalar_rate, array_rate, array_rate / scalar_rate,
+        ))
+
+if __name__ == '__main__':
+    main()